@@ -27,6 +27,63 @@ Classify the user's query into ONE of these categories:
 
 Classification:"""
 
+ROUTE_AND_EXTRACT_PROMPT = """You are the intent classifier and flight search parameter extractor of a travel assistant.
+
+Classify the user's query into ONE of these categories:
+- FLIGHT_SEARCH: find, search, or compare flights
+- VISA_QUERY: visa requirements, entry rules, passport validity
+- POLICY_QUERY: refunds, cancellations, baggage, policies
+- GENERAL_TRAVEL: general travel questions, recommendations, tips
+- CLARIFICATION_NEEDED: too ambiguous or needs more information
+
+If and only if the category is FLIGHT_SEARCH, also extract the search criteria.
+Use the conversation to resolve references (e.g. "I want to travel" then "london" means destination London).
+
+**Output Format** (JSON only, no explanations):
+{{
+  "intent": "one of the categories above",
+  "criteria": null or {{
+    "origin": "city name or null if not specified",
+    "destination": "city name or null",
+    "departure_date": "YYYY-MM-DD or 'flexible' or date range like '2024-08-01 to 2024-08-15'",
+    "return_date": "YYYY-MM-DD or null for one-way",
+    "trip_type": "round-trip or one-way",
+    "alliance": "Star Alliance | Oneworld | SkyTeam | null",
+    "preferred_airlines": ["airline1", "airline2"] or null,
+    "avoid_overnight_layover": true or false,
+    "max_layovers": number or null,
+    "max_price_usd": number or null,
+    "refundable_only": true or false,
+    "flexible_dates": true or false
+  }}
+}}
+
+**Example:**
+
+Query: "Cheap direct flights to Paris next month under $700"
+Output:
+{{
+  "intent": "FLIGHT_SEARCH",
+  "criteria": {{
+    "origin": null,
+    "destination": "Paris",
+    "departure_date": "2024-09-01 to 2024-09-30",
+    "return_date": null,
+    "trip_type": "one-way",
+    "alliance": null,
+    "preferred_airlines": null,
+    "avoid_overnight_layover": false,
+    "max_layovers": 0,
+    "max_price_usd": 700,
+    "refundable_only": false,
+    "flexible_dates": true
+  }}
+}}
+
+{conversation_context}Latest user message: {query}
+
+**JSON Output:**"""
+
 # =============================================================================
 # CRITERIA EXTRACTION PROMPTS
 # =============================================================================
@@ -137,7 +194,7 @@ FLIGHT_RESULTS_FORMAT_PROMPT = """Format these flight search results into a user
 
 **Found Flights:**
 {results}
-
+{fare_calendar}
 **Instructions:**
 1. Start with a brief summary (e.g., "I found {count} flights matching your criteria")
 2. Present each flight clearly with:
@@ -148,18 +205,24 @@ FLIGHT_RESULTS_FORMAT_PROMPT = """Format these flight search results into a user
    - Layover information
    - Refundability
 3. Highlight the best option based on criteria
-4. End with a helpful suggestion or question
+4. If a fare calendar is given, show it as a compact day-by-day table and name the cheapest day(s)
+5. End with a helpful suggestion or question
 
 **Format:**"""
 
+FARE_CALENDAR_SECTION = """
+**Fare Calendar (cheapest fare per departure day on this route, all airlines):**
+{calendar}
+"""
+
 NO_RESULTS_PROMPT = """Generate a helpful response when no flights match the criteria.
 
 **Search Criteria:**
 {criteria}
-
+{fare_calendar}
 **Instructions:**
 1. Politely inform no exact matches were found
-2. Suggest relaxing specific constraints (dates, alliance, layovers, price)
+2. Suggest relaxing specific constraints (dates, alliance, layovers, price); if a fare calendar is given, point to its cheapest days
 3. Offer to search with modified criteria
 4. Keep tone positive and solution-oriented
 
@@ -7,6 +7,19 @@ class Settings(BaseSettings):
     gemini_model: str = "gemini-2.5-flash"
     gemini_embedding_model: str = "gemini-embedding-001"
 
+    # "gemini", or "offline" for deterministic simulated responses and embeddings
+    llm_backend: str = "gemini"
+    offline_latency_distribution: str = "fixed"  # fixed, uniform or lognormal
+    offline_latency_ms: float = 0.0  # mean (fixed, uniform) or median (lognormal)
+    offline_latency_spread: float = 0.0  # uniform: +/- fraction of the mean; lognormal: sigma
+    offline_tokens_per_second: float = 0.0  # output rate; 0 answers at once
+    offline_embedding_dimensions: int = 3072  # same as gemini-embedding-001
+    offline_responses_path: str = ""  # optional JSON of canned responses per call site
+
+    # Vector store: "chroma", or "numpy" for an in-process memory-mapped index
+    vector_backend: str = "chroma"
+    vector_index_directory: str = ""  # numpy backend; empty: "numpy" in the Chroma directory
+
     # ChromaDB Configuration
     chroma_persist_directory: str = "./data/vectorstore"
     chroma_collection_name: str = "travel_knowledge_base"
@@ -16,6 +29,75 @@ class Settings(BaseSettings):
     max_search_results: int = 5
     rag_top_k: int = 3
     rag_chunk_size: int = 600
+    # "hybrid" fuses BM25 and dense results; "dense" or "lexical" (no embedding call) use one
+    rag_retrieval_mode: str = "hybrid"
+    rag_fusion_candidates: int = 10  # results taken from each retriever before fusion
+    rag_rrf_k: int = 60  # reciprocal rank fusion constant
+    lexical_index_path: str = ""  # empty: lexical_index.json in the vector store directory
+    bm25_k1: float = 1.5
+    bm25_b: float = 0.75
+    kb_manifest_path: str = ""  # empty: kb_manifest.json in the Chroma directory
+    kb_ingest_workers: int = 0  # chunking processes; 0 = CPU count
+    kb_embed_batch_size: int = 100  # chunks per embedding request (provider limit)
+    kb_embed_batch_tokens: int = 20000  # estimated tokens per embedding request
+    kb_embed_concurrency: int = 4  # embedding batches in flight
+    kb_progress_seconds: float = 5.0
+    kb_checkpoint_seconds: float = 10.0  # manifest checkpoint interval during ingest
+
+    # Flight inventory
+    flight_snapshot_enabled: bool = True
+    flight_snapshot_path: str = ""  # empty: next to flights.json
+    flight_reload_interval_seconds: float = 0.0  # 0 disables watching flights.json
+    flight_cache_size: int = 256  # 0 disables the search result cache
+    flight_cache_ttl_seconds: float = 300.0
+    place_aliases_path: str = "data/place_aliases.json"
+
+    # LLM response cache (opt-in)
+    llm_cache_enabled: bool = False
+    llm_cache_path: str = "./data/llm_cache.sqlite3"
+    llm_cache_ttl_seconds: float = 86400.0  # 0 keeps entries until evicted
+    llm_cache_max_entries: int = 10000
+    # Call sites to cache: router, route_and_extract, criteria_extraction, flight_results,
+    # no_results, clarification, rag
+    llm_cache_sites: str = "router,route_and_extract,criteria_extraction,no_results"
+
+    # Persistent embedding cache, keyed on (model, task, text hash)
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: str = "./data/embedding_cache.sqlite3"
+    embedding_cache_max_entries: int = 50000
+
+    # Local fast-path intent classifier (rules + naive Bayes) ahead of the LLM router
+    intent_fast_path_enabled: bool = True
+    intent_fast_path_threshold: float = 0.85
+    intent_examples_path: str = "data/intent_examples.json"
+
+    # One LLM call returns the intent and, for flight searches, the criteria
+    combined_routing_enabled: bool = True
+
+    # Semantic intent cache for the router
+    intent_cache_enabled: bool = False
+    intent_cache_size: int = 2048
+    intent_cache_threshold: float = 0.92  # cosine similarity needed to reuse an intent
+    intent_cache_shadow: bool = False  # look up and log disagreements, but still ask the LLM
+
+    # Async execution
+    llm_max_concurrency: int = 8  # in-flight LLM (and, separately, embedding) calls
+    llm_coalescing_enabled: bool = True  # identical concurrent calls share one request
+
+    # Client-side scheduling of Gemini calls (0 disables a rate limit)
+    llm_requests_per_minute: int = 0
+    llm_tokens_per_minute: int = 0
+    embedding_requests_per_minute: int = 0
+    embedding_tokens_per_minute: int = 0
+    llm_max_retries: int = 3  # retries of rate-limited, 5xx and timed-out calls
+    llm_retry_base_seconds: float = 0.5  # full-jitter backoff: up to base * 2**attempt
+    llm_retry_max_seconds: float = 8.0
+    llm_hedge_enabled: bool = False  # resend calls still running after the recent p95
+    llm_hedge_min_samples: int = 20  # latencies observed before hedging starts
+
+    # Conversation history included in prompts
+    conversation_token_budget: int = 400  # most recent messages that fit
+    conversation_message_token_cap: int = 120  # longer messages are cut to this
 
     # Temperature settings
     temperature: float = 0.7
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 from typing import List
 
@@ -5,19 +6,20 @@ from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 
 from src.agents.graph import travel_assistant_graph
 from src.agents.state import TravelAssistantState
+from src.agents.streaming import ResponseStream
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
-def run() -> None:
+async def arun() -> None:
     messages: List[BaseMessage] = []
     sys.stdout.write("Travel Assistant. Type your message and press Enter (Ctrl+D or 'exit' to quit).\n\n")
     sys.stdout.flush()
 
     while True:
         try:
-            user_input = input("You: ").strip()
+            user_input = (await asyncio.to_thread(input, "You: ")).strip()
         except EOFError:
             break
         if not user_input:
@@ -32,6 +34,8 @@ def run() -> None:
             "intent": None,
             "extracted_criteria": None,
             "search_results": None,
+            "total_matches": None,
+            "fare_calendar": None,
             "rag_context": None,
             "final_response": None,
             "needs_clarification": False,
@@ -39,11 +43,15 @@ def run() -> None:
         }
 
         try:
-            result = travel_assistant_graph.invoke(state)
-            response = result.get("final_response") or "I couldn't process your request."
-            sys.stdout.write(f"Assistant: {response}\n")
+            stream = ResponseStream(travel_assistant_graph, state)
+            sys.stdout.write("Assistant: ")
+            sys.stdout.flush()
+            async for text in stream:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            sys.stdout.write("\n")
             sys.stdout.flush()
-            messages.append(AIMessage(content=response))
+            messages.append(AIMessage(content=stream.response))
         except Exception as e:
             logger.exception("Error processing request: %s", e)
             fallback = "I'm sorry, something went wrong. Please try again."
@@ -52,5 +60,9 @@ def run() -> None:
             messages.append(AIMessage(content=fallback))
 
 
+def run() -> None:
+    asyncio.run(arun())
+
+
 if __name__ == "__main__":
     run()
@@ -1,6 +1,15 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph
 
 from src.agents.nodes import (
+    aclarification_node,
+    acriteria_extraction_node,
+    aflight_search_node,
+    arag_query_node,
+    aresponse_generation_node,
+    arouter_node,
     clarification_node,
     criteria_extraction_node,
     flight_search_node,
@@ -14,22 +23,44 @@ from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+NodeFunc = Callable[[TravelAssistantState], Dict[str, Any]]
+AsyncNodeFunc = Callable[[TravelAssistantState], Awaitable[Dict[str, Any]]]
+
+
+def _node(func: NodeFunc, afunc: AsyncNodeFunc) -> RunnableLambda:
+    """Node that runs ``func`` under ``invoke`` and ``afunc`` under ``ainvoke``."""
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
 
 def create_travel_assistant_graph() -> StateGraph:
     workflow = StateGraph(TravelAssistantState)
 
-    workflow.add_node(NodeName.ROUTER.value, router_node)
-    workflow.add_node(NodeName.CRITERIA_EXTRACTION.value, criteria_extraction_node)
-    workflow.add_node(NodeName.FLIGHT_SEARCH.value, flight_search_node)
-    workflow.add_node(NodeName.RAG_QUERY.value, rag_query_node)
-    workflow.add_node(NodeName.RESPONSE_GENERATION.value, response_generation_node)
-    workflow.add_node(NodeName.CLARIFICATION.value, clarification_node)
+    workflow.add_node(NodeName.ROUTER.value, _node(router_node, arouter_node))
+    workflow.add_node(
+        NodeName.CRITERIA_EXTRACTION.value,
+        _node(criteria_extraction_node, acriteria_extraction_node),
+    )
+    workflow.add_node(NodeName.FLIGHT_SEARCH.value, _node(flight_search_node, aflight_search_node))
+    workflow.add_node(NodeName.RAG_QUERY.value, _node(rag_query_node, arag_query_node))
+    workflow.add_node(
+        NodeName.RESPONSE_GENERATION.value,
+        _node(response_generation_node, aresponse_generation_node),
+    )
+    workflow.add_node(NodeName.CLARIFICATION.value, _node(clarification_node, aclarification_node))
 
     workflow.set_entry_point(NodeName.ROUTER.value)
 
+    def check_clarification_needed(state: TravelAssistantState) -> str:
+        if state.get("needs_clarification"):
+            return NodeName.CLARIFICATION.value
+        return NodeName.FLIGHT_SEARCH.value
+
     def route_based_on_intent(state: TravelAssistantState) -> str:
         intent = state.get("intent")
         if intent == IntentType.FLIGHT_SEARCH:
+            # The combined routing call may already have extracted criteria.
+            if state.get("extracted_criteria") is not None:
+                return check_clarification_needed(state)
             return NodeName.CRITERIA_EXTRACTION.value
         if intent in (
             IntentType.VISA_QUERY,
@@ -44,11 +75,6 @@ def create_travel_assistant_graph() -> StateGraph:
         route_based_on_intent,
     )
 
-    def check_clarification_needed(state: TravelAssistantState) -> str:
-        if state.get("needs_clarification"):
-            return NodeName.CLARIFICATION.value
-        return NodeName.FLIGHT_SEARCH.value
-
     workflow.add_conditional_edges(
         NodeName.CRITERIA_EXTRACTION.value,
         check_clarification_needed,
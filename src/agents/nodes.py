@@ -1,96 +1,295 @@
-import json
-from typing import Any, Dict, List
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
 
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
 
 from config.prompts import (
     CLARIFICATION_PROMPT,
+    FARE_CALENDAR_SECTION,
     FLIGHT_RESULTS_FORMAT_PROMPT,
     INTENT_CLASSIFICATION_PROMPT,
     NO_RESULTS_PROMPT,
+    ROUTE_AND_EXTRACT_PROMPT,
 )
+from config.settings import settings
 from src.agents.state import TravelAssistantState
 from src.models.enums import IntentType
+from src.models.schemas import FlightCriteria, RAGResult
+from src.services.intent_cache import context_digest, intent_cache
 from src.services.llm_service import llm_service
-from src.tools.criteria_extractor import extract_criteria
+from src.tools.criteria_extractor import (
+    aextract_criteria,
+    criteria_from_data,
+    extract_criteria,
+    parse_json_response,
+)
 from src.tools.flight_search import flight_search_tool
+from src.tools.intent_classifier import intent_classifier
 from src.tools.rag_retrieval import rag_tool
+from src.utils.formatters import (
+    format_conversation,
+    format_criteria_summary,
+    format_fare_calendar,
+    format_flight_table,
+)
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-CONVERSATION_CONTEXT_MESSAGES = 6
 
+def _format_recent_messages(messages: List[BaseMessage]) -> str:
+    return format_conversation(
+        messages,
+        token_budget=settings.conversation_token_budget,
+        message_token_cap=settings.conversation_message_token_cap,
+    )
+
+
+def _router_context(state: TravelAssistantState) -> str:
+    messages = state.get("messages") or []
+    if len(messages) > 1:
+        context = _format_recent_messages(messages[:-1])
+        return f"Recent conversation:\n{context}\n\n" if context else ""
+    return ""
+
+
+def _router_prompt(state: TravelAssistantState, conversation_context: str) -> str:
+    return INTENT_CLASSIFICATION_PROMPT.format(
+        query=state["user_query"],
+        conversation_context=conversation_context,
+    )
+
+
+def _classification_prompt(
+    state: TravelAssistantState, conversation_context: str
+) -> Tuple[str, str]:
+    """(prompt, cache site) for the LLM classification call.
+
+    In combined mode the same call also extracts flight criteria.
+    """
+    if settings.combined_routing_enabled:
+        prompt = ROUTE_AND_EXTRACT_PROMPT.format(
+            query=state["user_query"],
+            conversation_context=conversation_context,
+        )
+        return prompt, "route_and_extract"
+    return _router_prompt(state, conversation_context), "router"
+
+
+def _classification_update(state: TravelAssistantState, response: str) -> Dict[str, Any]:
+    """State update for a classification response.
+
+    A combined response that carries valid criteria for a flight search
+    fills ``extracted_criteria`` so the graph can skip the extraction
+    node; if the criteria are missing or invalid only the intent is kept
+    and the extraction node runs as usual.
+    """
+    if not settings.combined_routing_enabled:
+        return {**state, "intent": _parse_intent(response)}
+    try:
+        data = parse_json_response(response)
+    except ValueError:
+        return {**state, "intent": _parse_intent(response)}
+    intent = _parse_intent(str(data.get("intent") or ""))
+    update: Dict[str, Any] = {**state, "intent": intent}
+    criteria = data.get("criteria")
+    if intent == IntentType.FLIGHT_SEARCH and isinstance(criteria, dict):
+        try:
+            return _extraction_update(update, criteria_from_data(criteria))
+        except Exception as e:
+            logger.warning("Combined criteria invalid, extracting separately: %s", e)
+    return update
 
-def _format_recent_messages(messages: List[BaseMessage], last_n: int = CONVERSATION_CONTEXT_MESSAGES) -> str:
-    if not messages:
-        return ""
-    recent = messages[-last_n:] if len(messages) > last_n else messages
-    lines = []
-    for msg in recent:
-        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-        content = getattr(msg, "content", str(msg))
-        if content:
-            lines.append(f"{role}: {content}")
-    return "\n".join(lines)
+
+def _parse_intent(response: str) -> IntentType:
+    response = response.strip()
+    for intent_type in IntentType:
+        if intent_type.value in response:
+            return intent_type
+    return IntentType.CLARIFICATION_NEEDED
+
+
+def _router_error(state: TravelAssistantState, e: Exception) -> Dict[str, Any]:
+    logger.error("Error in router_node: %s", e)
+    return {
+        **state,
+        "intent": IntentType.CLARIFICATION_NEEDED,
+        "error": str(e),
+    }
+
+
+def _fast_intent(state: TravelAssistantState) -> Optional[IntentType]:
+    """Intent from the local classifier when it is confident enough.
+
+    With earlier turns in the conversation a follow-up can depend on
+    them, so only keyword rules are trusted there, not the lexical model.
+    """
+    if not settings.intent_fast_path_enabled:
+        return None
+    prediction = intent_classifier.predict(state["user_query"])
+    if prediction is None or prediction.confidence < settings.intent_fast_path_threshold:
+        return None
+    if len(state.get("messages") or []) > 1 and prediction.source != "rule":
+        return None
+    logger.info(
+        "Fast-path intent: %s (%s, confidence %.2f)",
+        prediction.intent.value,
+        prediction.source,
+        prediction.confidence,
+    )
+    return prediction.intent
+
+
+def _cached_intent(
+    query: str, embedding: Optional[List[float]], context: int
+) -> Optional[IntentType]:
+    if embedding is None:
+        return None
+    cached = intent_cache.lookup(embedding, context)
+    if cached is not None:
+        logger.info("Intent cache hit for %r: %s", query, cached.value)
+    return cached
+
+
+def _record_intent(
+    query: str,
+    embedding: Optional[List[float]],
+    context: int,
+    cached: Optional[IntentType],
+    intent: IntentType,
+) -> None:
+    logger.info("Classified intent: %s", intent.value)
+    if embedding is not None:
+        intent_cache.observe(embedding, context, cached, intent, query=query)
 
 
 def router_node(state: TravelAssistantState) -> Dict[str, Any]:
     logger.info("Executing router_node")
     try:
+        intent = _fast_intent(state)
+        if intent is not None:
+            return {**state, "intent": intent}
         query = state["user_query"]
-        messages = state.get("messages") or []
-        if len(messages) > 1:
-            context = _format_recent_messages(messages[:-1])
-            conversation_context = f"Recent conversation:\n{context}\n\n" if context else ""
-        else:
-            conversation_context = ""
-        prompt = INTENT_CLASSIFICATION_PROMPT.format(
-            query=query,
-            conversation_context=conversation_context,
-        )
-        response = llm_service.generate(prompt).strip()
-        intent = IntentType.CLARIFICATION_NEEDED
-        for intent_type in IntentType:
-            if intent_type.value in response:
-                intent = intent_type
-                break
-        logger.info("Classified intent: %s", intent.value)
-        return {**state, "intent": intent}
+        conversation_context = _router_context(state)
+        context = context_digest(conversation_context)
+        embedding = None
+        if intent_cache.enabled:
+            try:
+                embedding = llm_service.embed_text(query)
+            except Exception as e:
+                logger.warning("Intent cache skipped, embedding failed: %s", e)
+        cached = _cached_intent(query, embedding, context)
+        if cached is not None and not intent_cache.shadow:
+            return {**state, "intent": cached}
+        prompt, site = _classification_prompt(state, conversation_context)
+        update = _classification_update(state, llm_service.generate(prompt, cache_site=site))
+        _record_intent(query, embedding, context, cached, update["intent"])
+        return update
+    except Exception as e:
+        return _router_error(state, e)
+
+
+async def arouter_node(state: TravelAssistantState) -> Dict[str, Any]:
+    logger.info("Executing router_node")
+    try:
+        intent = _fast_intent(state)
+        if intent is not None:
+            return {**state, "intent": intent}
+        query = state["user_query"]
+        conversation_context = _router_context(state)
+        context = context_digest(conversation_context)
+        embedding = None
+        if intent_cache.enabled:
+            try:
+                embedding = await llm_service.aembed_text(query)
+            except Exception as e:
+                logger.warning("Intent cache skipped, embedding failed: %s", e)
+        cached = _cached_intent(query, embedding, context)
+        if cached is not None and not intent_cache.shadow:
+            return {**state, "intent": cached}
+        prompt, site = _classification_prompt(state, conversation_context)
+        update = _classification_update(state, await llm_service.agenerate(prompt, cache_site=site))
+        _record_intent(query, embedding, context, cached, update["intent"])
+        return update
     except Exception as e:
-        logger.error("Error in router_node: %s", e)
+        return _router_error(state, e)
+
+
+def _resolve_places(criteria: FlightCriteria, query: str) -> FlightCriteria:
+    """Canonicalize origin/destination against the inventory, filling gaps from the query."""
+    resolver = flight_search_tool.place_resolver()
+    origin, destination = resolver.parse_route(query)
+    # Only exact names and aliases: an edit-distance match would turn a
+    # place the inventory lacks ("Paros") into one it has ("Paris").
+    updates = {
+        "origin": resolver.resolve(criteria.origin, fuzzy=False) or criteria.origin or origin,
+        "destination": (
+            resolver.resolve(criteria.destination, fuzzy=False)
+            or criteria.destination
+            or destination
+        ),
+    }
+    return criteria.model_copy(update=updates)
+
+
+def _extraction_context(state: TravelAssistantState) -> str:
+    messages = state.get("messages") or []
+    if len(messages) > 1:
+        context = _format_recent_messages(messages)
+        return f"Conversation:\n{context}\n\n"
+    return ""
+
+
+def _extraction_update(state: TravelAssistantState, criteria: FlightCriteria) -> Dict[str, Any]:
+    criteria = _resolve_places(criteria, state["user_query"])
+    needs_clarification = not (criteria.destination and criteria.destination.strip())
+    logger.info("Extracted criteria: %s", criteria.model_dump())
+    return {
+        **state,
+        "extracted_criteria": criteria,
+        "needs_clarification": needs_clarification,
+    }
+
+
+def _extraction_error(state: TravelAssistantState, e: Exception) -> Dict[str, Any]:
+    logger.error("Error in criteria_extraction_node: %s", e)
+    origin, destination = flight_search_tool.place_resolver().parse_route(state["user_query"])
+    if destination:
+        logger.info("Falling back to locally resolved route: %s -> %s", origin, destination)
         return {
             **state,
-            "intent": IntentType.CLARIFICATION_NEEDED,
+            "extracted_criteria": FlightCriteria(origin=origin, destination=destination),
+            "needs_clarification": False,
             "error": str(e),
         }
+    return {
+        **state,
+        "needs_clarification": True,
+        "error": str(e),
+    }
 
 
 def criteria_extraction_node(state: TravelAssistantState) -> Dict[str, Any]:
     logger.info("Executing criteria_extraction_node")
     try:
-        query = state["user_query"]
-        messages = state.get("messages") or []
-        if len(messages) > 1:
-            context = _format_recent_messages(messages)
-            conversation_context = f"Conversation:\n{context}\n\n"
-        else:
-            conversation_context = ""
-        criteria = extract_criteria(query, conversation_context=conversation_context)
-        needs_clarification = not (criteria.destination and criteria.destination.strip())
-        logger.info("Extracted criteria: %s", criteria.model_dump())
-        return {
-            **state,
-            "extracted_criteria": criteria,
-            "needs_clarification": needs_clarification,
-        }
+        criteria = extract_criteria(
+            state["user_query"], conversation_context=_extraction_context(state)
+        )
+        return _extraction_update(state, criteria)
     except Exception as e:
-        logger.error("Error in criteria_extraction_node: %s", e)
-        return {
-            **state,
-            "needs_clarification": True,
-            "error": str(e),
-        }
+        return _extraction_error(state, e)
+
+
+async def acriteria_extraction_node(state: TravelAssistantState) -> Dict[str, Any]:
+    logger.info("Executing criteria_extraction_node")
+    try:
+        criteria = await aextract_criteria(
+            state["user_query"], conversation_context=_extraction_context(state)
+        )
+        return _extraction_update(state, criteria)
+    except Exception as e:
+        return _extraction_error(state, e)
 
 
 def flight_search_node(state: TravelAssistantState) -> Dict[str, Any]:
@@ -98,98 +297,202 @@ def flight_search_node(state: TravelAssistantState) -> Dict[str, Any]:
     try:
         criteria = state.get("extracted_criteria")
         if not criteria:
-            return {**state, "search_results": [], "error": "No criteria extracted"}
-        results = flight_search_tool.search(criteria)
-        logger.info("Found %d flights", len(results))
-        return {**state, "search_results": results}
+            return {
+                **state,
+                "search_results": [],
+                "total_matches": 0,
+                "error": "No criteria extracted",
+            }
+        results, total = flight_search_tool.search(criteria, limit=settings.max_search_results)
+        logger.info("Found %d flights (showing %d)", total, len(results))
+        fare_calendar = []
+        if criteria.flexible_dates or " to " in (criteria.departure_date or ""):
+            fare_calendar = flight_search_tool.fare_calendar(criteria)
+            logger.info("Fare calendar has %d departure days", len(fare_calendar))
+        return {
+            **state,
+            "search_results": results,
+            "total_matches": total,
+            "fare_calendar": fare_calendar,
+        }
     except Exception as e:
         logger.error("Error in flight_search_node: %s", e)
-        return {**state, "search_results": [], "error": str(e)}
+        return {**state, "search_results": [], "total_matches": 0, "error": str(e)}
+
+
+async def aflight_search_node(state: TravelAssistantState) -> Dict[str, Any]:
+    # The search is in-memory and CPU-bound; a worker thread keeps the loop free.
+    return await asyncio.to_thread(flight_search_node, state)
+
+
+def _previous_response(state: TravelAssistantState) -> str:
+    for msg in reversed(state.get("messages") or []):
+        if isinstance(msg, AIMessage):
+            return getattr(msg, "content", "") or ""
+    return ""
+
+
+def _rag_update(state: TravelAssistantState, result: RAGResult) -> Dict[str, Any]:
+    logger.info("RAG answer generated with %d sources", len(result.sources))
+    return {
+        **state,
+        "final_response": result.answer,
+        "rag_context": "\n".join(result.sources),
+    }
+
 
+def _rag_error(state: TravelAssistantState, e: Exception) -> Dict[str, Any]:
+    logger.error("Error in rag_query_node: %s", e)
+    return {
+        **state,
+        "final_response": "I'm sorry, I encountered an error retrieving that information.",
+        "error": str(e),
+    }
 
-def rag_query_node(state: TravelAssistantState) -> Dict[str, Any]:
+
+def rag_query_node(
+    state: TravelAssistantState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
     logger.info("Executing rag_query_node")
     try:
-        query = state["user_query"]
-        messages = state.get("messages") or []
-        previous_response = ""
-        for msg in reversed(messages):
-            if isinstance(msg, AIMessage):
-                previous_response = getattr(msg, "content", "") or ""
-                break
-        result = rag_tool.query(query, previous_assistant_message=previous_response or None)
-        logger.info("RAG answer generated with %d sources", len(result.sources))
-        return {
-            **state,
-            "final_response": result.answer,
-            "rag_context": "\n".join(result.sources),
-        }
+        previous_response = _previous_response(state)
+        result = rag_tool.query(
+            state["user_query"],
+            previous_assistant_message=previous_response or None,
+            config=config,
+        )
+        return _rag_update(state, result)
     except Exception as e:
-        logger.error("Error in rag_query_node: %s", e)
-        return {
-            **state,
-            "final_response": "I'm sorry, I encountered an error retrieving that information.",
-            "error": str(e),
-        }
+        return _rag_error(state, e)
+
+
+async def arag_query_node(
+    state: TravelAssistantState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    logger.info("Executing rag_query_node")
+    try:
+        previous_response = _previous_response(state)
+        result = await rag_tool.aquery(
+            state["user_query"],
+            previous_assistant_message=previous_response or None,
+            config=config,
+        )
+        return _rag_update(state, result)
+    except Exception as e:
+        return _rag_error(state, e)
+
+
+def _response_prompt(state: TravelAssistantState) -> Tuple[str, str]:
+    """(prompt, cache site) for the final flight answer."""
+    results = state.get("search_results") or []
+    criteria = state.get("extracted_criteria")
+    criteria_text = format_criteria_summary(
+        criteria.model_dump(mode="json", exclude_none=True) if criteria else {}
+    )
+    calendar_text = format_fare_calendar(state.get("fare_calendar") or [])
+    fare_calendar = FARE_CALENDAR_SECTION.format(calendar=calendar_text) if calendar_text else ""
+    if not results:
+        prompt = NO_RESULTS_PROMPT.format(
+            criteria=criteria_text,
+            fare_calendar=fare_calendar,
+        )
+        return prompt, "no_results"
+    prompt = FLIGHT_RESULTS_FORMAT_PROMPT.format(
+        criteria=criteria_text,
+        results=format_flight_table(results),
+        count=state.get("total_matches") or len(results),
+        fare_calendar=fare_calendar,
+    )
+    return prompt, "flight_results"
+
+
+def _response_error(state: TravelAssistantState, e: Exception) -> Dict[str, Any]:
+    logger.error("Error in response_generation_node: %s", e)
+    return {
+        **state,
+        "final_response": "I apologize, but I encountered an error generating the response.",
+        "error": str(e),
+    }
 
 
-def response_generation_node(state: TravelAssistantState) -> Dict[str, Any]:
+def response_generation_node(
+    state: TravelAssistantState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
     logger.info("Executing response_generation_node")
     if state.get("final_response"):
         return dict(state)
     try:
-        results = state.get("search_results") or []
-        criteria = state.get("extracted_criteria")
-        criteria_dict = criteria.model_dump() if criteria else {}
-        if not results:
-            prompt = NO_RESULTS_PROMPT.format(criteria=json.dumps(criteria_dict, indent=2))
-        else:
-            results_text = json.dumps(
-                [r.model_dump(mode="json") for r in results[:5]],
-                indent=2,
-            )
-            prompt = FLIGHT_RESULTS_FORMAT_PROMPT.format(
-                criteria=json.dumps(criteria_dict, indent=2),
-                results=results_text,
-                count=len(results),
-            )
-        response = llm_service.generate(prompt)
+        prompt, site = _response_prompt(state)
+        response = llm_service.generate(prompt, cache_site=site, config=config)
         return {**state, "final_response": response}
     except Exception as e:
-        logger.error("Error in response_generation_node: %s", e)
-        return {
-            **state,
-            "final_response": "I apologize, but I encountered an error generating the response.",
-            "error": str(e),
-        }
+        return _response_error(state, e)
+
+
+async def aresponse_generation_node(
+    state: TravelAssistantState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    logger.info("Executing response_generation_node")
+    if state.get("final_response"):
+        return dict(state)
+    try:
+        prompt, site = _response_prompt(state)
+        response = await llm_service.agenerate(prompt, cache_site=site, config=config)
+        return {**state, "final_response": response}
+    except Exception as e:
+        return _response_error(state, e)
+
+
+def _clarification_prompt(state: TravelAssistantState) -> str:
+    query = state["user_query"]
+    messages = state.get("messages") or []
+    conversation_context = _format_recent_messages(messages) if messages else ""
+    criteria = state.get("extracted_criteria")
+    missing_fields = []
+    if criteria:
+        if not (criteria.destination and criteria.destination.strip()):
+            missing_fields.append("destination city")
+        if not (criteria.origin and criteria.origin.strip()) and not missing_fields:
+            missing_fields.append("origin city or dates")
+    if not missing_fields:
+        missing_fields.append("travel details")
+    return CLARIFICATION_PROMPT.format(
+        query=query,
+        missing_fields=", ".join(missing_fields),
+        conversation_context=conversation_context or "(none yet)",
+    )
 
 
-def clarification_node(state: TravelAssistantState) -> Dict[str, Any]:
+def _clarification_error(state: TravelAssistantState, e: Exception) -> Dict[str, Any]:
+    logger.error("Error in clarification_node: %s", e)
+    return {
+        **state,
+        "final_response": "Could you provide more details about your travel plans?",
+        "error": str(e),
+    }
+
+
+def clarification_node(
+    state: TravelAssistantState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
     logger.info("Executing clarification_node")
     try:
-        query = state["user_query"]
-        messages = state.get("messages") or []
-        conversation_context = _format_recent_messages(messages) if messages else ""
-        criteria = state.get("extracted_criteria")
-        missing_fields = []
-        if criteria:
-            if not (criteria.destination and criteria.destination.strip()):
-                missing_fields.append("destination city")
-            if not (criteria.origin and criteria.origin.strip()) and not missing_fields:
-                missing_fields.append("origin city or dates")
-        if not missing_fields:
-            missing_fields.append("travel details")
-        prompt = CLARIFICATION_PROMPT.format(
-            query=query,
-            missing_fields=", ".join(missing_fields),
-            conversation_context=conversation_context or "(none yet)",
+        prompt = _clarification_prompt(state)
+        response = llm_service.generate(prompt, cache_site="clarification", config=config)
+        return {**state, "final_response": response}
+    except Exception as e:
+        return _clarification_error(state, e)
+
+
+async def aclarification_node(
+    state: TravelAssistantState, config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    logger.info("Executing clarification_node")
+    try:
+        prompt = _clarification_prompt(state)
+        response = await llm_service.agenerate(
+            prompt, cache_site="clarification", config=config
         )
-        response = llm_service.generate(prompt)
         return {**state, "final_response": response}
     except Exception as e:
-        logger.error("Error in clarification_node: %s", e)
-        return {
-            **state,
-            "final_response": "Could you provide more details about your travel plans?",
-            "error": str(e),
-        }
+        return _clarification_error(state, e)
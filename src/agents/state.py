@@ -1,7 +1,7 @@
 from typing import List, Optional, TypedDict
 from langchain_core.messages import BaseMessage
 from src.models.enums import IntentType
-from src.models.schemas import Flight, FlightCriteria
+from src.models.schemas import FareDay, Flight, FlightCriteria
 
 class TravelAssistantState(TypedDict, total=False):
     messages: List[BaseMessage]
@@ -9,6 +9,8 @@ class TravelAssistantState(TypedDict, total=False):
     intent: Optional[IntentType]
     extracted_criteria: Optional[FlightCriteria]
     search_results: Optional[List[Flight]]
+    total_matches: Optional[int]  # flights that matched; search_results holds the top few
+    fare_calendar: Optional[List[FareDay]]
     rag_context: Optional[str]
     final_response: Optional[str]
     needs_clarification: bool
@@ -0,0 +1,85 @@
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from src.agents.state import TravelAssistantState
+from src.models.enums import NodeName
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Nodes whose LLM output is the answer shown to the user. Tokens from the
+# router and criteria extraction calls are internal and never streamed.
+STREAMING_NODES = frozenset(
+    {
+        NodeName.RESPONSE_GENERATION.value,
+        NodeName.RAG_QUERY.value,
+        NodeName.CLARIFICATION.value,
+    }
+)
+
+FALLBACK_RESPONSE = "I couldn't process your request."
+
+
+def _text(content: Any) -> str:
+    """Text of a message chunk; Gemini may send a list of content parts."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else str(part.get("text", ""))
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return ""
+
+
+class ResponseStream:
+    """Runs the graph and yields the user-facing answer as it is generated.
+
+    Uses LangGraph's ``messages`` stream mode for tokens and ``values`` for
+    the final state. If the answer was not produced token by token (a
+    cached response, a fixed fallback message, a failed call) it is
+    yielded once, whole, at the end. After iteration ``final_state``,
+    ``response`` and ``time_to_first_token`` (seconds until the first
+    visible text) are set.
+    """
+
+    def __init__(self, graph: Any, state: TravelAssistantState) -> None:
+        self.graph = graph
+        self.state = state
+        self.final_state: Dict[str, Any] = {}
+        self.response = ""
+        self.time_to_first_token: Optional[float] = None
+
+    def _first_token(self, start: float) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - start
+            logger.info("Time to first token: %.3fs", self.time_to_first_token)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        streamed = []
+        async for mode, payload in self.graph.astream(
+            self.state, stream_mode=["messages", "values"]
+        ):
+            if mode == "values":
+                self.final_state = payload
+                continue
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") not in STREAMING_NODES:
+                continue
+            text = _text(getattr(chunk, "content", ""))
+            if not text:
+                continue
+            self._first_token(start)
+            streamed.append(text)
+            yield text
+
+        final_response = self.final_state.get("final_response") or ""
+        if streamed:
+            self.response = final_response or "".join(streamed)
+        else:
+            self.response = final_response or FALLBACK_RESPONSE
+            self._first_token(start)
+            yield self.response
+        logger.info("Response complete in %.3fs", time.perf_counter() - start)
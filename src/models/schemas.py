@@ -40,6 +40,15 @@ class Flight(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
+class FareDay(BaseModel):
+    """Cheapest fare and availability for one departure day on a route."""
+
+    date: str
+    min_price_usd: float
+    flights: int = Field(..., description="Number of departures that day")
+    nonstop_available: bool = False
+
+
 class RAGQuery(BaseModel):
     """RAG retrieval query."""
 
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config.settings import settings
+from src.models.enums import IntentType
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def context_digest(conversation_context: str) -> int:
+    """64-bit digest of the conversation context a query was classified in."""
+    return int.from_bytes(
+        hashlib.blake2b(conversation_context.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class SemanticIntentCache:
+    """Nearest-neighbour cache of classified queries.
+
+    Query embeddings are kept unit-normalized in one matrix, so a lookup
+    is a single matrix-vector product. A cached intent is reused when the
+    most similar query seen in the same conversation context (same
+    digest) is at least ``threshold`` cosine-similar. The least recently
+    used entry is replaced once ``max_size`` entries are stored.
+
+    In shadow mode lookups are still made and counted, but the caller
+    keeps asking the LLM and reports its answer through ``observe``;
+    disagreements are logged so the threshold can be tuned before the
+    cache is trusted.
+    """
+
+    def __init__(self, max_size: int, threshold: float, shadow: bool = False) -> None:
+        self.max_size = max_size
+        self.threshold = threshold
+        self.shadow = shadow
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._contexts = np.zeros(max(max_size, 0), dtype=np.uint64)
+        self._last_used = np.zeros(max(max_size, 0), dtype=np.int64)
+        self._intents: List[IntentType] = []
+        self._queries: List[str] = []
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.shadow_checks = 0
+        self.disagreements = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def __len__(self) -> int:
+        return len(self._intents)
+
+    @staticmethod
+    def _normalized(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: Sequence[float], context: int) -> Optional[IntentType]:
+        """Cached intent of the nearest query in ``context``, or None below the threshold."""
+        if not self.enabled:
+            return None
+        query = self._normalized(embedding)
+        with self._lock:
+            n = len(self._intents)
+            if n == 0 or self._vectors is None or self._vectors.shape[1] != len(query):
+                self.misses += 1
+                return None
+            similarity = self._vectors[:n] @ query
+            similarity[self._contexts[:n] != np.uint64(context)] = -np.inf
+            best = int(np.argmax(similarity))
+            if similarity[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self.hits += 1
+            return self._intents[best]
+
+    def add(
+        self, embedding: Sequence[float], context: int, intent: IntentType, query: str = ""
+    ) -> None:
+        if not self.enabled:
+            return
+        vector = self._normalized(embedding)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+                self._intents, self._queries = [], []
+            n = len(self._intents)
+            if n < self.max_size:
+                slot = n
+                self._intents.append(intent)
+                self._queries.append(query)
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._intents[slot] = intent
+                self._queries[slot] = query
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._contexts[slot] = np.uint64(context)
+            self._last_used[slot] = self._clock
+
+    def observe(
+        self,
+        embedding: Sequence[float],
+        context: int,
+        cached: Optional[IntentType],
+        intent: IntentType,
+        query: str = "",
+    ) -> None:
+        """Record the LLM's intent for a query.
+
+        ``cached`` is what the lookup returned: None stores the query as a
+        new entry, anything else (shadow mode) is compared to ``intent``.
+        """
+        if cached is not None:
+            self.shadow_checks += 1
+            if cached != intent:
+                self.disagreements += 1
+                logger.warning(
+                    "Intent cache disagreement for %r: cached %s, LLM %s",
+                    query,
+                    cached.value,
+                    intent.value,
+                )
+            return
+        self.add(embedding, context, intent, query)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._intents, self._queries = [], []
+            self._last_used[:] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._intents),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "shadow": self.shadow,
+                "shadow_checks": self.shadow_checks,
+                "disagreements": self.disagreements,
+            }
+
+
+intent_cache = SemanticIntentCache(
+    max_size=settings.intent_cache_size if settings.intent_cache_enabled else 0,
+    threshold=settings.intent_cache_threshold,
+    shadow=settings.intent_cache_shadow,
+)
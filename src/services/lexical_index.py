@@ -0,0 +1,199 @@
+import json
+import math
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from src.services.vector_backends import backend_directory
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_VERSION = 1
+# Words too common to say anything about a chunk; "visa" and the like stay.
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it my of on or "
+    "the to what when where which with you your".split()
+)
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words and numbers ("$1,200" -> "1,200"), minus stopwords."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Okapi BM25 over the knowledge base chunks, kept in a JSON file.
+
+    The index is an inverted list of (chunk, term frequency) per term,
+    built at ingest time from the vector store's documents, so exact
+    tokens such as country names, airline names and fee amounts can be
+    matched without an embedding call. It is loaded on first search, from
+    ``path`` or, by default, ``lexical_index.json`` in the vector store
+    directory (worked out from settings, so the vector store itself is
+    not opened). Searches reload it when the file has changed, for
+    example after ``init_knowledge_base`` ran in another process.
+    """
+
+    def __init__(self, path: Optional[Path] = None, k1: float = 1.5, b: float = 0.75) -> None:
+        self._path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._source_stat: Optional[Tuple[int, int]] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths = np.zeros(0, dtype=np.float32)
+
+    @property
+    def path(self) -> Path:
+        if self._path is None:
+            self._path = backend_directory() / "lexical_index.json"
+        return self._path
+
+    def build(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """Index ``texts`` and replace the index file."""
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths: List[int] = []
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for token in tokens:
+                doc_counts = postings.setdefault(token, {})
+                doc_counts[i] = doc_counts.get(i, 0) + 1
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "version": INDEX_VERSION,
+                    "ids": ids,
+                    "documents": texts,
+                    "metadatas": metadatas,
+                    "lengths": lengths,
+                    "postings": {t: list(docs.items()) for t, docs in postings.items()},
+                }
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+        with self._lock:
+            self._set(ids, texts, metadatas, postings, lengths)
+            self._source_stat = self._stat()
+        logger.info("Built lexical index: %d chunks, %d terms", len(ids), len(postings))
+
+    def _set(self, ids, texts, metadatas, postings, lengths) -> None:
+        self._ids = ids
+        self._texts = texts
+        self._metadatas = metadatas
+        self._postings = postings
+        self._lengths = np.asarray(lengths, dtype=np.float32)
+        self._loaded = True
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def reload_if_changed(self) -> bool:
+        """Load the index file if it was never loaded or changed since; True if it was read."""
+        stat = self._stat()
+        if self._loaded and stat == self._source_stat:
+            return False
+        with self._lock:
+            stat = self._stat()
+            if self._loaded and stat == self._source_stat:
+                return False
+            self._load()
+            self._source_stat = stat
+            return True
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            data = {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable lexical index %s: %s", self.path, e)
+            data = {}
+        if data.get("version") != INDEX_VERSION:
+            logger.warning("No lexical index at %s; run init_knowledge_base to build it", self.path)
+            self._set([], [], [], {}, [])
+            return
+        postings = {
+            term: {doc: tf for doc, tf in docs} for term, docs in data["postings"].items()
+        }
+        self._set(data["ids"], data["documents"], data["metadatas"], postings, data["lengths"])
+        logger.info("Loaded lexical index: %d chunks from %s", len(self._ids), self.path)
+
+    def __len__(self) -> int:
+        self.reload_if_changed()
+        return len(self._ids)
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """Best ``top_k`` chunks by BM25 score, in ``similarity_search`` shape plus ``score``."""
+        self.reload_if_changed()
+        # A reload swaps every field; score against one consistent version.
+        with self._lock:
+            n = len(self._ids)
+            terms = [t for t in dict.fromkeys(tokenize(query)) if t in self._postings]
+            if not n or not terms or top_k <= 0:
+                return []
+            lengths = self._lengths
+            norm = self.k1 * (1 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0))
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                docs = self._postings[term]
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                idx = np.fromiter(docs.keys(), dtype=np.int64, count=len(docs))
+                tf = np.fromiter(docs.values(), dtype=np.float32, count=len(docs))
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm[idx])
+            matched = np.flatnonzero(scores)
+            top = matched[np.argsort(-scores[matched], kind="stable")[:top_k]]
+            return [
+                {
+                    "id": self._ids[i],
+                    "content": self._texts[i],
+                    "metadata": self._metadatas[i],
+                    "score": float(scores[i]),
+                }
+                for i in top
+            ]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Dict[str, Any]]], top_k: int, k: int = 60
+) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by summing ``1 / (k + rank)`` per document id."""
+    fused: Dict[str, float] = {}
+    documents: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.get("id") or doc["content"]
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    order = sorted(fused, key=lambda key: -fused[key])[:top_k]
+    return [{**documents[key], "rrf_score": fused[key]} for key in order]
+
+
+lexical_index = LexicalIndex(
+    Path(settings.lexical_index_path) if settings.lexical_index_path else None,
+    k1=settings.bm25_k1,
+    b=settings.bm25_b,
+)
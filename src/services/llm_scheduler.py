@@ -0,0 +1,502 @@
+"""Client-side admission control for Gemini calls.
+
+Every chat or embedding request passes through an ``LLMScheduler``
+before it reaches the API:
+
+* token buckets for requests and tokens per minute hold calls back
+  before the quota is hit rather than after;
+* one pool of slots, shared by threads and event loops, caps the calls
+  in flight; every request, hedges included, holds a slot until it ends;
+* transient failures (429, 5xx, timeouts) are retried with full-jitter
+  exponential backoff, so workers that failed together do not retry
+  together;
+* optionally, a call still running after the p95 of recent latencies is
+  hedged with a second identical request and the first answer wins.
+
+Queue depth, wait times, retries and hedges are counted for ``stats()``.
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+# Whether a failed call may be retried: fixed, or asked after each failure.
+Retry = Union[bool, Callable[[], bool]]
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+_RETRYABLE_MARKERS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "rate limit", "quota")
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether another attempt could succeed: rate limits, server errors, timeouts.
+
+    Client wrappers re-raise the API error with their own type, so the
+    whole ``__cause__``/``__context__`` chain is inspected.
+    """
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        status = getattr(current, "code", None) or getattr(current, "status_code", None)
+        if isinstance(status, int) and status in RETRYABLE_STATUS:
+            return True
+        message = str(current)
+        if any(marker in message for marker in _RETRYABLE_MARKERS):
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``per_minute``.
+
+    ``reserve`` always debits and returns how long the caller must wait
+    for its share, so waiting callers queue up in arrival order. A rate of
+    0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.capacity = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` and return the seconds until it is covered."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._level -= min(amount, self.capacity)
+            return max(0.0, -self._level / self._rate)
+
+    def try_take(self, amount: float) -> bool:
+        """Take ``amount`` only if it is available right now."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            self._refill()
+            if self._level < amount:
+                return False
+            self._level -= amount
+            return True
+
+    def adjust(self, amount: float) -> None:
+        """Debit (or credit, if negative) the difference to an earlier estimate."""
+        if not self.enabled or not amount:
+            return
+        with self._lock:
+            self._refill()
+            self._level = max(-self.capacity, min(self.capacity, self._level - amount))
+
+
+class SlotPool:
+    """Counting semaphore shared by threads and coroutines on any event loop.
+
+    A released slot is handed straight to the longest waiter, so sync and
+    async callers queue for the same ``size`` slots in arrival order.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._free = size
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now."""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            granted = threading.Event()
+            self._waiters.append(granted.set)
+        granted.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            granted = loop.create_future()
+            self._waiters.append(lambda: loop.call_soon_threadsafe(self._grant, granted))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            # Cancelled after the slot was handed over: pass it on.
+            if granted.done() and not granted.cancelled():
+                self.release()
+            raise
+
+    def _grant(self, granted: "asyncio.Future[None]") -> None:
+        if granted.done():
+            self.release()
+        else:
+            granted.set_result(None)
+
+    def release(self) -> None:
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    if self._free >= self.size:
+                        raise ValueError("SlotPool released too many times")
+                    self._free += 1
+                    return
+                wake = self._waiters.popleft()
+            try:
+                wake()
+                return
+            except RuntimeError:
+                # That waiter's event loop is closed; try the next one.
+                continue
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMScheduler:
+    """Rate limits, concurrency cap, retries and hedging for one model client."""
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 8.0,
+        hedge_enabled: bool = False,
+        hedge_min_samples: int = 20,
+    ) -> None:
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_retries = max(max_retries, 0)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self._slots = SlotPool(self.max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _enter_queue(self) -> float:
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        return time.monotonic()
+
+    def _leave_queue(self, started: float) -> None:
+        waited = time.monotonic() - started
+        with self._lock:
+            self.queue_depth -= 1
+            self.admitted += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        if waited > 1.0:
+            logger.debug("%s call waited %.2fs for admission", self.name, waited)
+
+    def _reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _admit(self, tokens: int) -> None:
+        """Wait for rate budget and take a slot; the caller must release it."""
+        started = self._enter_queue()
+        try:
+            delay = self._reserve(tokens)
+            if delay:
+                time.sleep(delay)
+            self._slots.acquire()
+        finally:
+            self._leave_queue(started)
+
+    async def _aadmit(self, tokens: int) -> None:
+        started = self._enter_queue()
+        try:
+            delay = self._reserve(tokens)
+            if delay:
+                await asyncio.sleep(delay)
+            await self._slots.aacquire()
+        finally:
+            self._leave_queue(started)
+
+    def _release(self, _done: object = None) -> None:
+        self._slots.release()
+
+    @contextmanager
+    def slot(self, tokens: int = 1) -> Iterator[None]:
+        """Wait for rate budget and a free slot; hold the slot for the block."""
+        self._admit(tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 1) -> AsyncIterator[None]:
+        await self._aadmit(tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def record_usage(self, actual_tokens: int, estimated_tokens: int) -> None:
+        """Charge the token bucket for what a call really used."""
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2**attempt))
+
+    def _should_retry(self, error: Exception, attempt: int, retry: Retry) -> bool:
+        allowed = retry() if callable(retry) else retry
+        if not allowed or attempt >= self.max_retries or not is_retryable(error):
+            with self._lock:
+                self.failures += 1
+            return False
+        with self._lock:
+            self.retries += 1
+        logger.warning(
+            "%s call failed (%s), retry %d/%d", self.name, error, attempt + 1, self.max_retries
+        )
+        return True
+
+    def _hedge_deadline(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(0.95)
+
+    def _can_hedge(self, tokens: int) -> bool:
+        # A hedge is only worth sending if a slot and the quota are free
+        # right now; on success the hedge holds a slot of its own.
+        if not self._slots.try_acquire():
+            return False
+        if self.requests.try_take(1) and self.tokens.try_take(tokens):
+            return True
+        self._release()
+        return False
+
+    def _timed(self, fn: Callable[[], T]) -> T:
+        started = time.monotonic()
+        result = fn()
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    async def _atimed(self, factory: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await factory()
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.max_concurrency, thread_name_prefix=f"{self.name}-hedge"
+                )
+            return self._executor
+
+    def _call(self, fn: Callable[[], T], tokens: int, hedge: bool) -> T:
+        # Runs in the slot the caller was admitted with. Each request gives
+        # its slot back when it ends, so a losing request still counts
+        # against the cap while it runs on.
+        deadline = self._hedge_deadline() if hedge else None
+        if deadline is None:
+            try:
+                return self._timed(fn)
+            finally:
+                self._release()
+        pool = self._pool()
+        first = pool.submit(contextvars.copy_context().run, self._timed, fn)
+        first.add_done_callback(self._release)
+        try:
+            return first.result(timeout=deadline)
+        except FutureTimeout:
+            pass
+        if not self._can_hedge(tokens):
+            return first.result()
+        with self._lock:
+            self.hedges += 1
+        second = pool.submit(contextvars.copy_context().run, self._timed, fn)
+        second.add_done_callback(self._release)
+        return self._first_success([first, second], second)
+
+    def _first_success(self, futures: List[Future], hedge: Future) -> Any:
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = error or future.exception()
+        assert error is not None
+        raise error
+
+    async def _acall(self, factory: Callable[[], Awaitable[T]], tokens: int, hedge: bool) -> T:
+        deadline = self._hedge_deadline() if hedge else None
+        if deadline is None:
+            try:
+                return await self._atimed(factory)
+            finally:
+                self._release()
+        first = asyncio.ensure_future(self._atimed(factory))
+        first.add_done_callback(self._release)
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=deadline)
+            if done or not self._can_hedge(tokens):
+                return await first
+            with self._lock:
+                self.hedges += 1
+            second = asyncio.ensure_future(self._atimed(factory))
+            second.add_done_callback(self._release)
+            tasks.append(second)
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def run(
+        self, fn: Callable[[], T], tokens: int = 1, hedge: bool = True, retry: Retry = True
+    ) -> T:
+        """Call ``fn`` under the limits, retrying transient failures unless ``retry`` is off.
+
+        ``retry`` may also be a callable, asked after each failure whether
+        that failure may still be retried.
+        """
+        attempt = 0
+        while True:
+            self._admit(tokens)
+            try:
+                return self._call(fn, tokens, hedge)
+            except Exception as e:
+                if not self._should_retry(e, attempt, retry):
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def arun(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        tokens: int = 1,
+        hedge: bool = True,
+        retry: Retry = True,
+    ) -> T:
+        attempt = 0
+        while True:
+            await self._aadmit(tokens)
+            try:
+                return await self._acall(factory, tokens, hedge)
+            except Exception as e:
+                if not self._should_retry(e, attempt, retry):
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "avg_wait_seconds": self.total_wait_seconds / self.admitted if self.admitted else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+                "retries": self.retries,
+                "failures": self.failures,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "p95_latency_seconds": self.latency.percentile(0.95),
+            }
@@ -1,59 +1,399 @@
-from typing import Iterator, List
+import threading
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 
 from config.settings import settings
+from src.services.embedding_cache import EmbeddingCache
+from src.services.llm_cache import PromptCache
+from src.services.llm_scheduler import LLMScheduler
+from src.services.offline_backend import (
+    HashEmbeddings,
+    LatencyModel,
+    OfflineChatModel,
+    OfflineResponder,
+)
+from src.services.single_flight import SingleFlight
 from src.utils.logger import get_logger
+from src.utils.tokens import estimate_tokens
 
 logger = get_logger(__name__)
 
 
+class _TokenWatch(BaseCallbackHandler):
+    """Notes whether a chat call has sent a token to its callbacks."""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.emitted = False
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.emitted = True
+
+
 class LLMService:
 
     def __init__(self) -> None:
-        self.chat_model = ChatGoogleGenerativeAI(
+        self.chat_model, self.embedding_model = self._build_models()
+        self.chat_scheduler = LLMScheduler(
+            "chat",
+            requests_per_minute=settings.llm_requests_per_minute,
+            tokens_per_minute=settings.llm_tokens_per_minute,
+            max_concurrency=settings.llm_max_concurrency,
+            max_retries=settings.llm_max_retries,
+            retry_base_seconds=settings.llm_retry_base_seconds,
+            retry_max_seconds=settings.llm_retry_max_seconds,
+            hedge_enabled=settings.llm_hedge_enabled,
+            hedge_min_samples=settings.llm_hedge_min_samples,
+        )
+        self.embedding_scheduler = LLMScheduler(
+            "embedding",
+            requests_per_minute=settings.embedding_requests_per_minute,
+            tokens_per_minute=settings.embedding_tokens_per_minute,
+            max_concurrency=settings.llm_max_concurrency,
+            max_retries=settings.llm_max_retries,
+            retry_base_seconds=settings.llm_retry_base_seconds,
+            retry_max_seconds=settings.llm_retry_max_seconds,
+            hedge_enabled=settings.llm_hedge_enabled,
+            hedge_min_samples=settings.llm_hedge_min_samples,
+        )
+        self.cache: Optional[PromptCache] = None
+        self.cache_sites = {
+            site.strip() for site in settings.llm_cache_sites.split(",") if site.strip()
+        }
+        if settings.llm_cache_enabled:
+            self.cache = PromptCache(
+                settings.llm_cache_path,
+                ttl_seconds=settings.llm_cache_ttl_seconds,
+                max_entries=settings.llm_cache_max_entries,
+            )
+            logger.info(
+                "LLM response cache at %s for: %s",
+                settings.llm_cache_path,
+                ", ".join(sorted(self.cache_sites)) or "(no call sites)",
+            )
+        self.embedding_model_id = (
+            f"offline-hash-{settings.offline_embedding_dimensions}"
+            if settings.llm_backend == "offline"
+            else settings.gemini_embedding_model
+        )
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if settings.embedding_cache_enabled:
+            self.embedding_cache = EmbeddingCache(
+                settings.embedding_cache_path, max_entries=settings.embedding_cache_max_entries
+            )
+        # Input/output tokens per call site, from the responses' usage metadata.
+        self.token_usage: Dict[str, Counter] = {}
+        self._usage_lock = threading.Lock()
+        # Concurrent identical calls share one upstream request.
+        self.single_flight = SingleFlight(enabled=settings.llm_coalescing_enabled)
+        logger.info(
+            "Initialized LLM service with model: %s (%s backend)",
+            settings.gemini_model,
+            settings.llm_backend,
+        )
+
+    @staticmethod
+    def _build_models() -> Tuple[BaseChatModel, Embeddings]:
+        if settings.llm_backend == "offline":
+            latency = LatencyModel(
+                settings.offline_latency_distribution,
+                latency_ms=settings.offline_latency_ms,
+                spread=settings.offline_latency_spread,
+                tokens_per_second=settings.offline_tokens_per_second,
+            )
+            logger.warning("Using the offline LLM backend; responses are simulated")
+            return (
+                OfflineChatModel(
+                    responder=OfflineResponder.from_file(settings.offline_responses_path),
+                    latency=latency,
+                ),
+                HashEmbeddings(settings.offline_embedding_dimensions, latency),
+            )
+        if settings.llm_backend != "gemini":
+            raise ValueError(
+                f"Unknown LLM backend {settings.llm_backend!r}; expected 'gemini' or 'offline'"
+            )
+        chat_model = ChatGoogleGenerativeAI(
             model=settings.gemini_model,
             google_api_key=settings.google_api_key,
             temperature=settings.temperature,
             max_output_tokens=settings.max_tokens,
+            # Retries are left to the scheduler, which backs off with jitter.
+            max_retries=1,
         )
-        self.embedding_model = GoogleGenerativeAIEmbeddings(
+        embedding_model = GoogleGenerativeAIEmbeddings(
             model=settings.gemini_embedding_model,
             google_api_key=settings.google_api_key,
         )
-        logger.info("Initialized LLM service with model: %s", settings.gemini_model)
+        return chat_model, embedding_model
+
+    @staticmethod
+    def _request_key(prompt: str, kwargs: dict) -> str:
+        # The runnable config (callbacks, tags) does not change the response;
+        # calls that carry one are not coalesced (see ``_streamed``).
+        params = {k: v for k, v in kwargs.items() if k != "config"}
+        return PromptCache.make_key(
+            settings.gemini_model, settings.temperature, settings.max_tokens, prompt, **params
+        )
+
+    def _embedding_key(self, kind: str, payload: object) -> str:
+        return PromptCache.make_key(self.embedding_model_id, 0.0, 0, kind, input=payload)
 
-    def generate(self, prompt: str, **kwargs: object) -> str:
+    def _cache_key(self, prompt: str, cache_site: Optional[str], kwargs: dict) -> Optional[str]:
+        """Cache key for this call, or None if the call site is not cached."""
+        if self.cache is None or cache_site not in self.cache_sites:
+            return None
+        return self._request_key(prompt, kwargs)
+
+    def _store(self, key: Optional[str], response: object) -> None:
+        if key is not None and self.cache is not None and isinstance(response, str):
+            self.cache.put(key, response)
+
+    def _content(self, response: Any, estimated_tokens: int, site: Optional[str]) -> str:
+        content = response.content if hasattr(response, "content") else str(response)
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens") or estimated_tokens
+        output_tokens = usage.get("output_tokens") or estimate_tokens(str(content))
+        self.chat_scheduler.record_usage(input_tokens + output_tokens, estimated_tokens)
+        site = site or "other"
+        with self._usage_lock:
+            counts = self.token_usage.setdefault(site, Counter())
+            counts["calls"] += 1
+            counts["input_tokens"] += input_tokens
+            counts["output_tokens"] += output_tokens
+            counts["estimated_calls"] += 0 if usage else 1
+        logger.info(
+            "LLM call (%s): %d input, %d output tokens%s",
+            site,
+            input_tokens,
+            output_tokens,
+            "" if usage else " (estimated)",
+        )
+        return content
+
+    def usage_stats(self) -> Dict[str, Dict[str, int]]:
+        """Token totals per call site since startup."""
+        with self._usage_lock:
+            return {site: dict(counts) for site, counts in self.token_usage.items()}
+
+    @staticmethod
+    def _streamed(kwargs: dict) -> bool:
+        # Calls from graph nodes carry the session's callbacks in the config,
+        # so their tokens can only go to that session, and only once: they
+        # are never shared with another caller's identical request or hedged.
+        return "config" in kwargs
+
+    @staticmethod
+    def _watch_tokens(kwargs: dict) -> Tuple[dict, Optional[_TokenWatch]]:
+        """Add a ``_TokenWatch`` to the config's callbacks, if there is a config.
+
+        A failure may be retried until the first token reached the
+        callbacks; after that a retry would resend tokens already shown.
+        """
+        config = kwargs.get("config")
+        if config is None:
+            return kwargs, None
+        watch = _TokenWatch()
+        callbacks = config.get("callbacks")
+        if isinstance(callbacks, BaseCallbackManager):
+            callbacks = callbacks.copy()
+            callbacks.add_handler(watch, inherit=True)
+        else:
+            callbacks = [*(callbacks or []), watch]
+        return {**kwargs, "config": {**config, "callbacks": callbacks}}, watch
+
+    def generate(self, prompt: str, cache_site: Optional[str] = None, **kwargs: object) -> str:
+        """Generate a response; ``cache_site`` names the caller for caching and token accounting."""
         try:
-            response = self.chat_model.invoke(prompt, **kwargs)
-            return response.content if hasattr(response, "content") else str(response)
+            key = self._cache_key(prompt, cache_site, kwargs)
+            if key is not None:
+                cached = self.cache.get(key)  # type: ignore[union-attr]
+                if cached is not None:
+                    logger.debug("LLM cache hit (%s)", cache_site)
+                    return cached
+
+            def call() -> str:
+                tokens = estimate_tokens(prompt)
+                call_kwargs, watch = self._watch_tokens(kwargs)
+                response = self.chat_scheduler.run(
+                    lambda: self.chat_model.invoke(prompt, **call_kwargs),
+                    tokens=tokens,
+                    hedge=watch is None,
+                    retry=True if watch is None else lambda: not watch.emitted,
+                )
+                content = self._content(response, tokens, cache_site)
+                self._store(key, content)
+                return content
+
+            if self._streamed(kwargs):
+                return call()
+            return self.single_flight.do(key or self._request_key(prompt, kwargs), call)
         except Exception as e:
             logger.error("LLM generation error: %s", e)
             raise
 
     def generate_stream(self, prompt: str, **kwargs: object) -> Iterator[str]:
         try:
-            for chunk in self.chat_model.stream(prompt, **kwargs):
-                if hasattr(chunk, "content") and chunk.content:
-                    yield chunk.content
+            with self.chat_scheduler.slot(estimate_tokens(prompt)):
+                for chunk in self.chat_model.stream(prompt, **kwargs):
+                    if hasattr(chunk, "content") and chunk.content:
+                        yield chunk.content
+        except Exception as e:
+            logger.error("LLM streaming error: %s", e)
+            raise
+
+    async def agenerate(
+        self, prompt: str, cache_site: Optional[str] = None, **kwargs: object
+    ) -> str:
+        try:
+            key = self._cache_key(prompt, cache_site, kwargs)
+            if key is not None:
+                cached = self.cache.get(key)  # type: ignore[union-attr]
+                if cached is not None:
+                    logger.debug("LLM cache hit (%s)", cache_site)
+                    return cached
+
+            async def call() -> str:
+                tokens = estimate_tokens(prompt)
+                call_kwargs, watch = self._watch_tokens(kwargs)
+                response = await self.chat_scheduler.arun(
+                    lambda: self.chat_model.ainvoke(prompt, **call_kwargs),
+                    tokens=tokens,
+                    hedge=watch is None,
+                    retry=True if watch is None else lambda: not watch.emitted,
+                )
+                content = self._content(response, tokens, cache_site)
+                self._store(key, content)
+                return content
+
+            if self._streamed(kwargs):
+                return await call()
+            return await self.single_flight.ado(key or self._request_key(prompt, kwargs), call)
+        except Exception as e:
+            logger.error("LLM generation error: %s", e)
+            raise
+
+    async def astream(self, prompt: str, **kwargs: object) -> AsyncIterator[str]:
+        try:
+            async with self.chat_scheduler.aslot(estimate_tokens(prompt)):
+                async for chunk in self.chat_model.astream(prompt, **kwargs):
+                    if hasattr(chunk, "content") and chunk.content:
+                        yield chunk.content
         except Exception as e:
             logger.error("LLM streaming error: %s", e)
             raise
 
+    def _embedding_keys(self, task: str, texts: List[str]) -> List[str]:
+        return [EmbeddingCache.make_key(self.embedding_model_id, task, text) for text in texts]
+
+    def _cached_embeddings(
+        self, task: str, texts: List[str]
+    ) -> Tuple[List[Optional[List[float]]], List[str]]:
+        """Cached vector (or None) per text, and the distinct texts still to embed."""
+        if self.embedding_cache is None:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        keys = self._embedding_keys(task, texts)
+        found = self.embedding_cache.get_many(keys)
+        vectors = [found.get(key) for key in keys]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if len(texts) > 1:
+            logger.info("%d of %d %s embeddings cached", len(texts) - len(missing), len(texts), task)
+        return vectors, missing
+
+    def _merge_embeddings(
+        self,
+        task: str,
+        texts: List[str],
+        vectors: List[Optional[List[float]]],
+        missing: List[str],
+        computed: List[List[float]],
+    ) -> List[List[float]]:
+        by_text = dict(zip(missing, computed))
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_many(dict(zip(self._embedding_keys(task, missing), computed)))
+        return [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+    def _embed_missing(self, kind: str, missing: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(t) for t in missing)
+        if kind == "query":
+            return [
+                self.single_flight.do(
+                    self._embedding_key(kind, missing[0]),
+                    lambda: self.embedding_scheduler.run(
+                        lambda: self.embedding_model.embed_query(missing[0]), tokens=tokens
+                    ),
+                )
+            ]
+        return self.single_flight.do(
+            self._embedding_key(kind, missing),
+            lambda: self.embedding_scheduler.run(
+                lambda: self.embedding_model.embed_documents(missing), tokens=tokens
+            ),
+        )
+
+    async def _aembed_missing(self, kind: str, missing: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(t) for t in missing)
+        if kind == "query":
+
+            async def call_query() -> List[float]:
+                return await self.embedding_scheduler.arun(
+                    lambda: self.embedding_model.aembed_query(missing[0]), tokens=tokens
+                )
+
+            key = self._embedding_key(kind, missing[0])
+            return [await self.single_flight.ado(key, call_query)]
+
+        async def call_documents() -> List[List[float]]:
+            return await self.embedding_scheduler.arun(
+                lambda: self.embedding_model.aembed_documents(missing), tokens=tokens
+            )
+
+        return await self.single_flight.ado(self._embedding_key(kind, missing), call_documents)
+
     def embed_text(self, text: str) -> List[float]:
         try:
-            return self.embedding_model.embed_query(text)
+            vectors, missing = self._cached_embeddings("query", [text])
+            if not missing:
+                return vectors[0]  # type: ignore[return-value]
+            computed = self._embed_missing("query", missing)
+            return self._merge_embeddings("query", [text], vectors, missing, computed)[0]
         except Exception as e:
             logger.error("Embedding error: %s", e)
             raise
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         try:
-            return self.embedding_model.embed_documents(texts)
+            vectors, missing = self._cached_embeddings("documents", texts)
+            computed = self._embed_missing("documents", missing) if missing else []
+            return self._merge_embeddings("documents", texts, vectors, missing, computed)
         except Exception as e:
             logger.error("Batch embedding error: %s", e)
             raise
 
+    async def aembed_text(self, text: str) -> List[float]:
+        try:
+            vectors, missing = self._cached_embeddings("query", [text])
+            if not missing:
+                return vectors[0]  # type: ignore[return-value]
+            computed = await self._aembed_missing("query", missing)
+            return self._merge_embeddings("query", [text], vectors, missing, computed)[0]
+        except Exception as e:
+            logger.error("Embedding error: %s", e)
+            raise
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            vectors, missing = self._cached_embeddings("documents", texts)
+            computed = await self._aembed_missing("documents", missing) if missing else []
+            return self._merge_embeddings("documents", texts, vectors, missing, computed)
+        except Exception as e:
+            logger.error("Batch embedding error: %s", e)
+            raise
 
 llm_service = LLMService()
@@ -0,0 +1,346 @@
+"""Deterministic stand-ins for the Gemini chat and embedding models.
+
+Selected with ``LLM_BACKEND=offline``. The whole graph then runs without
+network access, which makes per-node costs measurable and benchmarks
+repeatable:
+
+* ``OfflineChatModel`` recognises which prompt template it was sent and
+  answers in the shape the caller parses: an intent name for the router,
+  JSON for the combined router and the criteria extractor (built with the
+  local intent classifier and place resolver), and filler prose for the
+  user-facing answers. Canned responses per call site can be loaded from
+  a JSON file instead.
+* ``HashEmbeddings`` hashes words and word pairs into a fixed-size
+  vector, so equal texts embed identically and texts sharing words are
+  close.
+
+Both sleep according to a ``LatencyModel`` (fixed, uniform or lognormal
+latency plus an output token rate), seeded by the prompt so that reruns
+see the same delays.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config.prompts import (
+    CLARIFICATION_PROMPT,
+    CRITERIA_EXTRACTION_PROMPT,
+    FLIGHT_RESULTS_FORMAT_PROMPT,
+    INTENT_CLASSIFICATION_PROMPT,
+    NO_RESULTS_PROMPT,
+    RAG_SYSTEM_PROMPT,
+    ROUTE_AND_EXTRACT_PROMPT,
+)
+from src.models.enums import IntentType
+from src.utils.logger import get_logger
+from src.utils.tokens import estimate_tokens
+
+logger = get_logger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# Call site of a prompt, recognised by the first line of its template.
+PROMPT_SITES = {
+    ROUTE_AND_EXTRACT_PROMPT.splitlines()[0]: "route_and_extract",
+    INTENT_CLASSIFICATION_PROMPT.splitlines()[0]: "router",
+    CRITERIA_EXTRACTION_PROMPT.splitlines()[0]: "criteria_extraction",
+    FLIGHT_RESULTS_FORMAT_PROMPT.splitlines()[0]: "flight_results",
+    NO_RESULTS_PROMPT.splitlines()[0]: "no_results",
+    CLARIFICATION_PROMPT.splitlines()[0]: "clarification",
+    RAG_SYSTEM_PROMPT.splitlines()[0]: "rag",
+}
+
+DEFAULT_RESPONSES = {
+    "flight_results": "I found some flights matching your criteria.",
+    "no_results": "I couldn't find flights matching your criteria. Try relaxing the dates or price.",
+    "clarification": "Could you tell me where you'd like to fly to, and when?",
+    "rag": "Based on the travel policies I have, here is what applies to {query}.",
+    "other": "Here is some information for you.",
+}
+
+FILLER = [
+    "The fare includes one checked bag.",
+    "Seat selection is available for a fee.",
+    "Departures leave in the morning and arrive the next day, local time.",
+    "Prices may change until the booking is confirmed.",
+    "Let me know if you would like to compare other dates.",
+    "Passengers should check in at least three hours before departure.",
+]
+
+_QUERY = re.compile(r"Latest user message:\s*(.*)")
+_PRICE = re.compile(r"(?:under|below|less than|max(?:imum)?|up to)\s*\$?\s*(\d+)", re.I)
+_ALLIANCES = {
+    "star alliance": "Star Alliance",
+    "oneworld": "Oneworld",
+    "skyteam": "SkyTeam",
+}
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class LatencyModel:
+    """Simulated request latency plus output generation time."""
+
+    def __init__(
+        self,
+        distribution: str = "fixed",
+        latency_ms: float = 0.0,
+        spread: float = 0.0,
+        tokens_per_second: float = 0.0,
+    ) -> None:
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency distribution {distribution!r}; "
+                f"expected one of {', '.join(LATENCY_DISTRIBUTIONS)}"
+            )
+        self.distribution = distribution
+        self.latency_ms = latency_ms
+        self.spread = spread
+        self.tokens_per_second = tokens_per_second
+
+    def first_token(self, key: str) -> float:
+        """Seconds until the first token; the same ``key`` gets the same delay."""
+        if self.latency_ms <= 0:
+            return 0.0
+        rng = random.Random(_seed(key))
+        if self.distribution == "uniform":
+            ms = rng.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+        elif self.distribution == "lognormal":
+            ms = self.latency_ms * math.exp(rng.gauss(0.0, self.spread))
+        else:
+            ms = self.latency_ms
+        return max(ms, 0.0) / 1000.0
+
+    def per_token(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def total(self, key: str, output_tokens: int) -> float:
+        return self.first_token(key) + output_tokens * self.per_token()
+
+
+class OfflineResponder:
+    """Rule-generated (or canned) responses keyed by prompt template."""
+
+    def __init__(self, canned: Optional[Dict[str, Any]] = None) -> None:
+        self.canned = canned or {}
+        self._resolver: Any = None
+
+    @classmethod
+    def from_file(cls, path: str) -> "OfflineResponder":
+        if not path:
+            return cls()
+        try:
+            with open(Path(path), encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Could not load offline responses from %s: %s", path, e)
+            return cls()
+
+    @staticmethod
+    def site(prompt: str) -> str:
+        first_line = prompt.lstrip().split("\n", 1)[0]
+        return PROMPT_SITES.get(first_line, "other")
+
+    @staticmethod
+    def query(prompt: str) -> str:
+        matches = _QUERY.findall(prompt)
+        if matches:
+            return matches[-1].strip()
+        question = re.search(r"Question:\**\s*(.*)", prompt)
+        return question.group(1).strip() if question else ""
+
+    def _intent(self, query: str) -> IntentType:
+        from src.tools.intent_classifier import intent_classifier
+
+        prediction = intent_classifier.predict(query)
+        return prediction.intent if prediction else IntentType.GENERAL_TRAVEL
+
+    def _criteria(self, query: str) -> Dict[str, Any]:
+        if self._resolver is None:
+            from src.tools.flight_search import flight_search_tool
+
+            self._resolver = flight_search_tool.place_resolver()
+        origin, destination = self._resolver.parse_route(query)
+        lowered = query.lower()
+        price = _PRICE.search(query)
+        return {
+            "origin": origin,
+            "destination": destination,
+            "departure_date": "flexible",
+            "return_date": None,
+            "trip_type": "one-way" if re.search(r"one[- ]way", lowered) else "round-trip",
+            "alliance": next((v for k, v in _ALLIANCES.items() if k in lowered), None),
+            "preferred_airlines": None,
+            "avoid_overnight_layover": "overnight" in lowered,
+            "max_layovers": 0 if re.search(r"\b(direct|nonstop|non-stop)\b", lowered) else None,
+            "max_price_usd": float(price.group(1)) if price else None,
+            "refundable_only": "refundable" in lowered,
+            "flexible_dates": "flexible" in lowered,
+        }
+
+    def respond(self, prompt: str) -> str:
+        site = self.site(prompt)
+        query = self.query(prompt)
+        if site in self.canned:
+            return str(self.canned[site]).replace("{query}", query)
+        if site == "router":
+            return self._intent(query).value
+        if site == "criteria_extraction":
+            return json.dumps(self._criteria(query))
+        if site == "route_and_extract":
+            intent = self._intent(query)
+            criteria = self._criteria(query) if intent == IntentType.FLIGHT_SEARCH else None
+            return json.dumps({"intent": intent.value, "criteria": criteria})
+        lead = DEFAULT_RESPONSES.get(site, DEFAULT_RESPONSES["other"]).replace("{query}", query)
+        rng = random.Random(_seed(prompt))
+        return " ".join([lead] + [rng.choice(FILLER) for _ in range(rng.randint(2, 6))])
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(m.content) for m in messages)
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\S+\s*", text)
+
+
+class OfflineChatModel(BaseChatModel):
+    """Chat model that answers locally; see the module docstring."""
+
+    responder: Any
+    latency: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline"
+
+    def _message(self, prompt: str, text: str) -> AIMessage:
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = _prompt_text(messages)
+        text = self.responder.respond(prompt)
+        delay = self.latency.total(prompt, estimate_tokens(text))
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = _prompt_text(messages)
+        text = self.responder.respond(prompt)
+        delay = self.latency.total(prompt, estimate_tokens(text))
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._message(prompt, text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt = _prompt_text(messages)
+        text = self.responder.respond(prompt)
+        delay = self.latency.first_token(prompt)
+        for word in _words(text):
+            if delay:
+                time.sleep(delay)
+            delay = self.latency.per_token() * estimate_tokens(word)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = _prompt_text(messages)
+        text = self.responder.respond(prompt)
+        delay = self.latency.first_token(prompt)
+        for word in _words(text):
+            if delay:
+                await asyncio.sleep(delay)
+            delay = self.latency.per_token() * estimate_tokens(word)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashed bag of words and word pairs, L2-normalised."""
+
+    def __init__(self, dimensions: int, latency: LatencyModel) -> None:
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = _seed(feature)
+            vector[h % self.dimensions] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        delay = self.latency.first_token("\n".join(texts))
+        if delay:
+            time.sleep(delay)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        delay = self.latency.first_token("\n".join(texts))
+        if delay:
+            await asyncio.sleep(delay)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
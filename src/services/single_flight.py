@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    """An in-flight synchronous call that other threads can wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one.
+
+    The first caller for a key (the leader) makes the call; callers that
+    arrive with the same key while it is in flight wait for it and get
+    the same result, or the same exception. Nothing is kept once the call
+    finishes, so this deduplicates only concurrent work; reuse over time
+    is the response cache's job.
+
+    ``do`` coalesces threads, ``ado`` coroutines on the same event loop.
+    In ``ado`` the call runs as its own task, so a cancelled caller does
+    not cancel it for the others.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # Tasks are bound to their loop, so each loop has its own table.
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            logger.debug("Coalesced with in-flight call %s", key[:12])
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await factory()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            if task is None:
+                task = asyncio.ensure_future(factory())
+                tasks[key] = task
+                task.add_done_callback(lambda _: tasks.pop(key, None))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+                logger.debug("Coalesced with in-flight call %s", key[:12])
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.calls + self.coalesced
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "coalesced_rate": self.coalesced / total if total else 0.0,
+                "in_flight": len(self._calls) + sum(len(t) for t in self._tasks.values()),
+            }
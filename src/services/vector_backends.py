@@ -0,0 +1,436 @@
+"""Storage and nearest-neighbour search behind ``VectorStoreService``.
+
+``VECTOR_BACKEND`` selects the implementation:
+
+* ``chroma`` (default) keeps the collection in a Chroma ``PersistentClient``.
+* ``numpy`` keeps unit-normalised float32 vectors in a ``.npy`` file that
+  is memory-mapped on load, with texts and metadata in a JSON file next to
+  it. A query is one matrix product plus ``argpartition`` for the top k,
+  which for a knowledge base of a few thousand chunks is well under a
+  millisecond and needs no server or SQLite. Metadata filters use boolean
+  masks that are built once per (field, value) and reused until the next
+  write.
+
+Both answer in Chroma's query result shape, one list per query embedding,
+with distances as squared L2 (for unit vectors, ``2 - 2 * cosine``).
+"""
+
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+COLLECTION_METADATA = {"description": "Travel knowledge base"}
+
+
+class VectorBackend(ABC):
+    """Documents with embeddings and metadata, searchable by embedding."""
+
+    directory: Path
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """Add new documents; ids must not exist yet."""
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        """Add documents, replacing any with the same id."""
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None: ...
+
+    @abstractmethod
+    def ids(self) -> List[str]: ...
+
+    @abstractmethod
+    def documents(self) -> Dict[str, List[Any]]:
+        """All ids, texts and metadata, as ``ids``, ``documents``, ``metadatas``."""
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def query(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        top_k: int,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, List[List[Any]]]:
+        """Top ``top_k`` documents per embedding, in Chroma's result shape."""
+
+    @abstractmethod
+    def reset(self) -> None: ...
+
+    def flush(self) -> None:
+        """Persist pending writes; backends that write through do nothing."""
+
+
+class ChromaBackend(VectorBackend):
+    def __init__(self, directory: Path, collection_name: str) -> None:
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.collection_name = collection_name
+        self.client = chromadb.PersistentClient(
+            path=str(directory),
+            settings=ChromaSettings(
+                anonymized_telemetry=False,
+                allow_reset=True,
+            ),
+        )
+
+        try:
+            self.collection = self.client.get_collection(name=collection_name)
+            logger.info("Loaded existing collection: %s", collection_name)
+        except Exception as e:
+            logger.debug("Collection not found, creating: %s", e)
+            self.collection = self.client.create_collection(
+                name=collection_name, metadata=COLLECTION_METADATA
+            )
+            logger.info("Created new collection: %s", collection_name)
+
+    def add(self, ids, texts, embeddings, metadatas) -> None:
+        self.collection.add(documents=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)
+
+    def upsert(self, ids, texts, embeddings, metadatas) -> None:
+        self.collection.upsert(documents=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: List[str]) -> None:
+        self.collection.delete(ids=ids)
+
+    def ids(self) -> List[str]:
+        return list(self.collection.get(include=[])["ids"])
+
+    def documents(self) -> Dict[str, List[Any]]:
+        result = self.collection.get(include=["documents", "metadatas"])
+        return {
+            "ids": list(result["ids"]),
+            "documents": list(result["documents"]),
+            "metadatas": [m or {} for m in result["metadatas"]],
+        }
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def query(self, embeddings, top_k, where=None) -> Dict[str, List[List[Any]]]:
+        return self.collection.query(
+            query_embeddings=[list(e) for e in embeddings],
+            n_results=top_k,
+            where=where,
+        )
+
+    def reset(self) -> None:
+        self.client.delete_collection(self.collection_name)
+        self.collection = self.client.create_collection(
+            name=self.collection_name, metadata=COLLECTION_METADATA
+        )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class NumpyBackend(VectorBackend):
+    """Brute-force cosine search over a memory-mapped float32 matrix.
+
+    Writes go to an in-memory buffer that grows geometrically, so a
+    batch costs time proportional to its own size: new rows are appended
+    after the row count and existing ids are overwritten in place. The
+    first write copies the memory-mapped matrix into that buffer. ``flush``
+    persists the live rows and a JSON file of ids, texts and metadata, each
+    replaced atomically. Reads and writes hold one lock; a query is a
+    single matrix product, so it holds it only briefly. Queries reload the
+    files when another process has saved them since (as the lexical index
+    does), unless this process has unsaved writes of its own.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    DOCUMENTS_FILE = "documents.json"
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._source_stat: Optional[Tuple[int, ...]] = None
+        self._load()
+
+    def _stat(self) -> Optional[Tuple[int, ...]]:
+        try:
+            vectors = (self.directory / self.VECTORS_FILE).stat()
+            documents = (self.directory / self.DOCUMENTS_FILE).stat()
+        except OSError:
+            return None
+        return (vectors.st_size, vectors.st_mtime_ns, documents.st_size, documents.st_mtime_ns)
+
+    def reload_if_changed(self) -> bool:
+        """Reload the index files if another process replaced them; True if they were read."""
+        with self._lock:
+            if self._dirty or self._stat() == self._source_stat:
+                return False
+            self._load()
+            return True
+
+    def _load(self) -> None:
+        vectors_path = self.directory / self.VECTORS_FILE
+        documents_path = self.directory / self.DOCUMENTS_FILE
+        # Taken first: a save that races this load is picked up by the next check.
+        self._source_stat = self._stat()
+        if vectors_path.exists() and documents_path.exists():
+            vectors = np.load(vectors_path, mmap_mode="r")
+            documents = json.loads(documents_path.read_text(encoding="utf-8"))
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+            documents = {"ids": [], "documents": [], "metadatas": []}
+        if len(documents["ids"]) != len(vectors):
+            logger.warning(
+                "Vector index in %s is inconsistent (%d vectors, %d documents); starting empty",
+                self.directory,
+                len(vectors),
+                len(documents["ids"]),
+            )
+            vectors = np.zeros((0, 0), dtype=np.float32)
+            documents = {"ids": [], "documents": [], "metadatas": []}
+        self._set(vectors, documents["ids"], documents["documents"], documents["metadatas"])
+        logger.info("Loaded vector index: %d documents from %s", len(self._ids), self.directory)
+
+    def _set(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        # Rows [0, len(ids)) of the buffer are live; a memory-mapped buffer
+        # is read-only and is copied on the first write.
+        self._buffer = vectors
+        self._writable = False
+        self._ids = ids
+        self._texts = texts
+        self._metadatas = metadatas
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        self._masks: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def add(self, ids, texts, embeddings, metadatas) -> None:
+        with self._lock:
+            duplicates = [doc_id for doc_id in ids if doc_id in self._positions]
+            if duplicates or len(set(ids)) != len(ids):
+                raise ValueError(f"Document ids already exist: {duplicates[:5]}")
+            self._write(ids, texts, embeddings, metadatas)
+
+    def upsert(self, ids, texts, embeddings, metadatas) -> None:
+        with self._lock:
+            self._write(ids, texts, embeddings, metadatas)
+
+    @property
+    def _vectors(self) -> np.ndarray:
+        return self._buffer[: len(self._ids)]
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Make the buffer writable with room for ``rows`` live rows."""
+        size = len(self._ids)
+        capacity = len(self._buffer) if self._writable else size
+        if rows <= capacity:
+            return
+        buffer = np.empty((max(rows, 2 * capacity, 64), dim), dtype=np.float32)
+        if size:
+            buffer[:size] = self._buffer[:size]
+        self._buffer = buffer
+        self._writable = True
+
+    def _write(self, ids, texts, embeddings, metadatas) -> None:
+        rows = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        dim = rows.shape[1]
+        if len(self._ids) and dim != self._buffer.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {dim} does not match the index ({self._buffer.shape[1]})"
+            )
+        new = {doc_id for doc_id in ids if doc_id not in self._positions}
+        self._reserve(len(self._ids) + len(new), dim)
+        for row, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            i = self._positions.get(doc_id)
+            if i is None:
+                i = len(self._ids)
+                self._positions[doc_id] = i
+                self._ids.append(doc_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+            else:
+                self._texts[i] = text
+                self._metadatas[i] = metadata
+            self._buffer[i] = rows[row]
+        self._masks.clear()
+        self._dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            drop = {self._positions[doc_id] for doc_id in ids if doc_id in self._positions}
+            if not drop:
+                return
+            keep = [i for i in range(len(self._ids)) if i not in drop]
+            self._set(
+                np.array(self._vectors[keep]),
+                [self._ids[i] for i in keep],
+                [self._texts[i] for i in keep],
+                [self._metadatas[i] for i in keep],
+            )
+            self._dirty = True
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def documents(self) -> Dict[str, List[Any]]:
+        with self._lock:
+            return {
+                "ids": list(self._ids),
+                "documents": list(self._texts),
+                "metadatas": list(self._metadatas),
+            }
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._set(np.zeros((0, 0), dtype=np.float32), [], [], [])
+            self._dirty = True
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            vectors_path = self.directory / self.VECTORS_FILE
+            documents_path = self.directory / self.DOCUMENTS_FILE
+            # np.save appends ".npy" to names without it, so keep the suffix last.
+            tmp_vectors = vectors_path.with_name("vectors.tmp.npy")
+            np.save(tmp_vectors, np.ascontiguousarray(self._vectors, dtype=np.float32))
+            tmp_documents = documents_path.with_suffix(".json.tmp")
+            tmp_documents.write_text(
+                json.dumps(
+                    {"ids": self._ids, "documents": self._texts, "metadatas": self._metadatas}
+                ),
+                encoding="utf-8",
+            )
+            os.replace(tmp_vectors, vectors_path)
+            os.replace(tmp_documents, documents_path)
+            self._source_stat = self._stat()
+            self._dirty = False
+            logger.info("Saved vector index: %d documents to %s", len(self._ids), self.directory)
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Rows matching a Chroma-style ``where`` filter (equality, $in, $and, $or)."""
+        n = len(self._ids)
+        mask = np.ones(n, dtype=bool)
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask(part) for part in condition]
+                combine = np.logical_and if key == "$and" else np.logical_or
+                mask &= combine.reduce(parts) if parts else np.ones(n, dtype=bool)
+            elif isinstance(condition, dict):
+                for op, value in condition.items():
+                    if op == "$eq":
+                        mask &= self._value_mask(key, value)
+                    elif op == "$ne":
+                        mask &= ~self._value_mask(key, value)
+                    elif op == "$in":
+                        mask &= np.logical_or.reduce(
+                            [self._value_mask(key, v) for v in value] or [np.zeros(n, dtype=bool)]
+                        )
+                    else:
+                        raise ValueError(f"Unsupported filter operator: {op}")
+            else:
+                mask &= self._value_mask(key, condition)
+        return mask
+
+    def _value_mask(self, key: str, value: Any) -> np.ndarray:
+        cache_key = (key, json.dumps(value, sort_keys=True))
+        mask = self._masks.get(cache_key)
+        if mask is None:
+            mask = np.fromiter(
+                (metadata.get(key) == value for metadata in self._metadatas),
+                dtype=bool,
+                count=len(self._metadatas),
+            )
+            self._masks[cache_key] = mask
+        return mask
+
+    def query(self, embeddings, top_k, where=None) -> Dict[str, List[List[Any]]]:
+        with self._lock:
+            self.reload_if_changed()
+            return self._query(embeddings, top_k, where)
+
+    def _query(self, embeddings, top_k, where) -> Dict[str, List[List[Any]]]:
+        vectors, ids, texts, metadatas = self._vectors, self._ids, self._texts, self._metadatas
+        mask = self._mask(where) if where else None
+        results: Dict[str, List[List[Any]]] = {
+            "ids": [], "documents": [], "metadatas": [], "distances": []
+        }
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        if len(ids):
+            # (queries x documents) cosine similarities in one product.
+            scores = queries @ vectors.T
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            available = len(ids) if mask is None else int(mask.sum())
+            k = min(top_k, available)
+        else:
+            k = 0
+        for q in range(len(queries)):
+            if k <= 0:
+                top = np.empty(0, dtype=np.int64)
+            else:
+                row = scores[q]
+                top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+                top = top[np.argsort(-row[top], kind="stable")]
+            results["ids"].append([ids[i] for i in top])
+            results["documents"].append([texts[i] for i in top])
+            results["metadatas"].append([metadatas[i] for i in top])
+            results["distances"].append([float(2.0 - 2.0 * scores[q, i]) for i in top])
+        return results
+
+
+def backend_directory() -> Path:
+    """Directory of the configured backend, known without opening it."""
+    if settings.vector_backend == "numpy":
+        return Path(
+            settings.vector_index_directory
+            or Path(settings.chroma_persist_directory) / "numpy"
+        )
+    return Path(settings.chroma_persist_directory)
+
+
+def create_backend() -> VectorBackend:
+    name = settings.vector_backend
+    if name == "chroma":
+        return ChromaBackend(backend_directory(), settings.chroma_collection_name)
+    if name == "numpy":
+        return NumpyBackend(backend_directory())
+    raise ValueError(f"Unknown vector backend {name!r}; expected one of {VECTOR_BACKENDS}")
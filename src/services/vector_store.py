@@ -1,41 +1,57 @@
+import asyncio
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-
-from config.settings import settings
 from src.services.llm_service import llm_service
+from src.services.vector_backends import VectorBackend, backend_directory, create_backend
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
 class VectorStoreService:
+    """Knowledge base documents and similarity search over a ``VectorBackend``.
+
+    The backend (``VECTOR_BACKEND``) is created on first use rather than at
+    import, so processes that never search do not pay for opening it.
+    """
+
     def __init__(self) -> None:
-        persist_dir = Path(settings.chroma_persist_directory)
-        persist_dir.mkdir(parents=True, exist_ok=True)
+        self._backend: Optional[VectorBackend] = None
+        self._backend_lock = threading.Lock()
+        self._deferred = 0
 
-        self.client = chromadb.PersistentClient(
-            path=str(persist_dir),
-            settings=ChromaSettings(
-                anonymized_telemetry=False,
-                allow_reset=True,
-            ),
-        )
+    @property
+    def backend(self) -> VectorBackend:
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_backend()
+        return self._backend
 
+    @property
+    def persist_directory(self) -> Path:
+        return backend_directory()
+
+    @contextmanager
+    def bulk_write(self) -> Iterator[None]:
+        """Defer persisting writes until the block exits or ``flush`` is called."""
+        self._deferred += 1
         try:
-            self.collection = self.client.get_collection(
-                name=settings.chroma_collection_name
-            )
-            logger.info("Loaded existing collection: %s", settings.chroma_collection_name)
-        except Exception as e:
-            logger.debug("Collection not found, creating: %s", e)
-            self.collection = self.client.create_collection(
-                name=settings.chroma_collection_name,
-                metadata={"description": "Travel knowledge base"},
-            )
-            logger.info("Created new collection: %s", settings.chroma_collection_name)
+            yield
+        finally:
+            self._deferred -= 1
+            if not self._deferred:
+                self.flush()
+
+    def flush(self) -> None:
+        self.backend.flush()
+
+    def _written(self) -> None:
+        if not self._deferred:
+            self.flush()
 
     def add_documents(
         self,
@@ -50,55 +66,118 @@ class VectorStoreService:
             embeddings = llm_service.embed_documents(texts)
             if ids is None:
                 ids = [f"doc_{i}" for i in range(len(texts))]
-            self.collection.add(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas or [{}] * len(texts),
-                ids=ids,
-            )
+            self.backend.add(ids, texts, embeddings, metadatas or [{}] * len(texts))
+            self._written()
             logger.info("Added %d documents to vector store", len(texts))
         except Exception as e:
             logger.error("Error adding documents: %s", e)
             raise
 
+    def upsert_documents(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None,
+    ) -> None:
+        """Add or replace documents by id, embedding them unless ``embeddings`` is given."""
+        try:
+            if embeddings is None:
+                embeddings = llm_service.embed_documents(texts)
+            self.backend.upsert(ids, texts, embeddings, metadatas)
+            self._written()
+            logger.info("Upserted %d documents into vector store", len(texts))
+        except Exception as e:
+            logger.error("Error upserting documents: %s", e)
+            raise
+
+    def delete_documents(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        self.backend.delete(ids)
+        self._written()
+        logger.info("Deleted %d documents from vector store", len(ids))
+
+    def document_ids(self) -> List[str]:
+        return self.backend.ids()
+
+    def documents(self) -> Dict[str, List[Any]]:
+        """Every stored document: ``ids``, ``documents`` and ``metadatas`` lists."""
+        return self.backend.documents()
+
     def similarity_search(
         self,
         query: str,
         top_k: int = 3,
         filter_metadata: Optional[Dict[str, Any]] = None,
     ) -> List[Dict[str, Any]]:
+        return self.similarity_search_many([query], top_k, filter_metadata)[0]
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        top_k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Async ``similarity_search``; the index query itself runs in a worker thread."""
+        return (await self.asimilarity_search_many([query], top_k, filter_metadata))[0]
+
+    def similarity_search_many(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Results per query, searched as one batch."""
+        try:
+            query_embeddings = [llm_service.embed_text(query) for query in queries]
+            results = self.backend.query(query_embeddings, top_k, filter_metadata)
+            return self._to_documents(results)
+        except Exception as e:
+            logger.error("Error searching vector store: %s", e)
+            raise
+
+    async def asimilarity_search_many(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict[str, Any]]]:
         try:
-            query_embedding = llm_service.embed_text(query)
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                where=filter_metadata,
+            query_embeddings = await asyncio.gather(
+                *(llm_service.aembed_text(query) for query in queries)
             )
-            documents: List[Dict[str, Any]] = []
-            docs = results.get("documents", [[]])
-            metas = results.get("metadatas", [[]])
-            dists = results.get("distances", [[]])
-            if docs and docs[0]:
-                for i in range(len(docs[0])):
-                    doc = {
-                        "content": docs[0][i],
-                        "metadata": metas[0][i] if metas and metas[0] else {},
-                    }
-                    if dists and dists[0] and i < len(dists[0]):
-                        doc["distance"] = dists[0][i]
-                    documents.append(doc)
-            logger.info("Found %d similar documents for query", len(documents))
-            return documents
+            results = await asyncio.to_thread(
+                self.backend.query, query_embeddings, top_k, filter_metadata
+            )
+            return self._to_documents(results)
         except Exception as e:
             logger.error("Error searching vector store: %s", e)
             raise
 
+    @staticmethod
+    def _to_documents(results: Any) -> List[List[Dict[str, Any]]]:
+        batches: List[List[Dict[str, Any]]] = []
+        ids = results.get("ids") or []
+        metas = results.get("metadatas") or []
+        dists = results.get("distances") or []
+        for q, docs in enumerate(results.get("documents") or []):
+            documents: List[Dict[str, Any]] = []
+            for i, content in enumerate(docs or []):
+                doc = {
+                    "id": ids[q][i] if q < len(ids) and ids[q] else None,
+                    "content": content,
+                    "metadata": metas[q][i] if q < len(metas) and metas[q] else {},
+                }
+                if q < len(dists) and dists[q] and i < len(dists[q]):
+                    doc["distance"] = dists[q][i]
+                documents.append(doc)
+            logger.info("Found %d similar documents for query", len(documents))
+            batches.append(documents)
+        return batches
+
     def reset(self) -> None:
-        self.client.delete_collection(settings.chroma_collection_name)
-        self.collection = self.client.create_collection(
-            name=settings.chroma_collection_name,
-            metadata={"description": "Travel knowledge base"},
-        )
+        self.backend.reset()
         logger.info("Reset vector store")
 
 vector_store = VectorStoreService()
@@ -1,5 +1,6 @@
 import json
 import re
+from typing import Any, Dict
 
 from config.prompts import CRITERIA_EXTRACTION_PROMPT
 from src.models.enums import Alliance, TripType
@@ -11,13 +12,32 @@ from src.utils.validators import parse_json_from_text
 logger = get_logger(__name__)
 
 
-def extract_criteria(query: str, conversation_context: str = "") -> FlightCriteria:
-    prompt = CRITERIA_EXTRACTION_PROMPT.format(
+def _prompt(query: str, conversation_context: str) -> str:
+    return CRITERIA_EXTRACTION_PROMPT.format(
         query=query,
         conversation_context=conversation_context,
     )
-    response = llm_service.generate(prompt).strip()
 
+
+def extract_criteria(query: str, conversation_context: str = "") -> FlightCriteria:
+    prompt = _prompt(query, conversation_context)
+    response = llm_service.generate(prompt, cache_site="criteria_extraction")
+    return parse_criteria(response)
+
+
+async def aextract_criteria(query: str, conversation_context: str = "") -> FlightCriteria:
+    prompt = _prompt(query, conversation_context)
+    response = await llm_service.agenerate(prompt, cache_site="criteria_extraction")
+    return parse_criteria(response)
+
+
+def parse_criteria(response: str) -> FlightCriteria:
+    return criteria_from_data(parse_json_response(response))
+
+
+def parse_json_response(response: str) -> Dict[str, Any]:
+    """JSON object in an LLM response (fenced or bare); ValueError if there is none."""
+    response = response.strip()
     json_str = response
     match = re.search(r"```(?:json)?\s*([\s\S]*?)```", response)
     if match:
@@ -32,7 +52,14 @@ def extract_criteria(query: str, conversation_context: str = "") -> FlightCriter
     except json.JSONDecodeError as e:
         logger.warning("Criteria JSON parse failed: %s", e)
         raise ValueError(f"Could not parse criteria from response: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("Could not parse criteria from response: not a JSON object")
+    return data
+
 
+def criteria_from_data(data: Dict[str, Any]) -> FlightCriteria:
+    """Validate extracted criteria, normalizing the values LLMs commonly get wrong."""
+    data = dict(data)
     if data.get("trip_type"):
         try:
             data["trip_type"] = TripType(data["trip_type"])
@@ -0,0 +1,161 @@
+"""Per-route, per-day fare aggregates over the flight index.
+
+For every (origin, destination) route and every destination, the calendar
+holds dense arrays over the departure days the group spans: the lowest
+price, the number of flights and whether any of them is nonstop. A
+flexible-date question is then answered with a slice of those arrays
+instead of scanning and ranking the flights. A group whose span is far
+larger than its number of departure days (a stray or mis-parsed date
+years away) keeps one entry per departure day instead.
+
+The aggregates cover all live flights on the route; per-search filters
+(alliance, airline, price cap...) only apply to the ranked flight list.
+"""
+
+from datetime import date
+from typing import Dict, Generic, Hashable, List, NamedTuple, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from src.models.schemas import FareDay
+from src.tools.flight_index import NO_DATE, DateRange, FlightIndex, RouteRows
+
+K = TypeVar("K", bound=Hashable)
+
+# Dense arrays are kept while the span is at most this many times the
+# number of distinct departure days (or at most DENSE_SPAN_MIN_DAYS).
+DENSE_SPAN_FACTOR = 4
+DENSE_SPAN_MIN_DAYS = 366
+
+
+class DayAggregates(NamedTuple):
+    """Aggregates of one route group, by day ordinal.
+
+    Dense (``day_offsets`` is None): entry ``i`` is day ``first_day + i``.
+    Sparse: entry ``i`` is day ``first_day + day_offsets[i]``, and only
+    days with departures have an entry.
+    """
+
+    first_day: int
+    min_price: np.ndarray
+    count: np.ndarray
+    nonstop: np.ndarray
+    day_offsets: Optional[np.ndarray] = None
+
+
+def _aggregate(index: FlightIndex, rows: RouteRows) -> Optional[DayAggregates]:
+    # Rows are sorted by departure, so unparseable dates (NO_DATE) come first.
+    start = int(np.searchsorted(rows.departure, NO_DATE, side="right"))
+    ids = rows.ids[start:]
+    if not len(ids):
+        return None
+    first_day = int(rows.departure[start])
+    days = rows.departure[start:].astype(np.int64) - first_day
+    span = int(days[-1]) + 1
+    distinct = int(np.count_nonzero(np.diff(days))) + 1
+    day_offsets: Optional[np.ndarray] = None
+    slots, size = days, span
+    if span > max(DENSE_SPAN_FACTOR * distinct, DENSE_SPAN_MIN_DAYS):
+        day_offsets, slots = np.unique(days, return_inverse=True)
+        size = len(day_offsets)
+    min_price = np.full(size, np.inf)
+    np.minimum.at(min_price, slots, index.price[ids])
+    count = np.bincount(slots, minlength=size).astype(np.int32)
+    nonstop = np.bincount(slots, weights=index.layover_count[ids] == 0, minlength=size) > 0
+    return DayAggregates(first_day, min_price, count, nonstop, day_offsets)
+
+
+class _Aggregates(Generic[K]):
+    """Day aggregates per postings key, remembering the postings they came from."""
+
+    def __init__(self) -> None:
+        self.days: Dict[K, DayAggregates] = {}
+        self.sources: Dict[K, RouteRows] = {}
+
+    def refreshed(self, index: FlightIndex, postings: Dict[K, RouteRows]) -> "_Aggregates[K]":
+        """Aggregates for ``postings``, reusing every group whose rows did not change.
+
+        ``FlightIndex.with_changes`` keeps untouched groups as the same
+        ``RouteRows`` objects, so an identity check finds the touched ones.
+        """
+        updated: _Aggregates[K] = _Aggregates()
+        for key, rows in postings.items():
+            if self.sources.get(key) is rows:
+                aggregates: Optional[DayAggregates] = self.days.get(key)
+            else:
+                aggregates = _aggregate(index, rows)
+            updated.sources[key] = rows
+            if aggregates is not None:
+                updated.days[key] = aggregates
+        return updated
+
+
+class FareCalendar:
+    """Fare aggregates for one ``FlightIndex`` version."""
+
+    def __init__(
+        self,
+        version: int,
+        routes: "_Aggregates[Tuple[str, str]]",
+        destinations: "_Aggregates[str]",
+    ) -> None:
+        self.version = version
+        self._routes = routes
+        self._destinations = destinations
+
+    @classmethod
+    def build(cls, index: FlightIndex) -> "FareCalendar":
+        return cls.empty().refreshed(index)
+
+    @classmethod
+    def empty(cls) -> "FareCalendar":
+        return cls(-1, _Aggregates(), _Aggregates())
+
+    def refreshed(self, index: FlightIndex) -> "FareCalendar":
+        """Calendar for ``index``, recomputing only the route groups that changed."""
+        return FareCalendar(
+            index.version,
+            self._routes.refreshed(index, index.route_index),
+            self._destinations.refreshed(index, index.destination_index),
+        )
+
+    def days(
+        self,
+        destination: str,
+        origin: Optional[str] = None,
+        date_range: Optional[DateRange] = None,
+    ) -> List[FareDay]:
+        """Days with at least one departure, in date order, within ``date_range``."""
+        dest = destination.strip().lower()
+        if origin:
+            aggregates = self._routes.days.get((origin.strip().lower(), dest))
+        else:
+            aggregates = self._destinations.days.get(dest)
+        if aggregates is None:
+            return []
+        day_offsets = aggregates.day_offsets
+        span = len(aggregates.count) if day_offsets is None else int(day_offsets[-1]) + 1
+        lo, hi = 0, span
+        if date_range is not None:
+            start, end = date_range
+            lo = max(start.toordinal() - aggregates.first_day, 0)
+            hi = min(end.toordinal() - aggregates.first_day + 1, span)
+        if lo >= hi:
+            return []
+        if day_offsets is None:
+            offsets = lo + np.flatnonzero(aggregates.count[lo:hi])
+            day_of = offsets
+        else:
+            offsets = np.arange(
+                np.searchsorted(day_offsets, lo), np.searchsorted(day_offsets, hi)
+            )
+            day_of = day_offsets[offsets]
+        return [
+            FareDay(
+                date=date.fromordinal(aggregates.first_day + int(d)).isoformat(),
+                min_price_usd=float(aggregates.min_price[i]),
+                flights=int(aggregates.count[i]),
+                nonstop_available=bool(aggregates.nonstop[i]),
+            )
+            for i, d in zip(offsets, day_of)
+        ]
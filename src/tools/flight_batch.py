@@ -0,0 +1,89 @@
+"""Batch flight search over one ``FlightIndex`` version.
+
+``FlightSearchTool.search_many`` runs these functions in process pool
+workers. This module imports neither settings nor ``flight_search``, so a
+spawned worker that unpickles ``init_worker`` only maps the snapshot it is
+given: it never builds the ``flight_search_tool`` singleton, loads
+flights.json or starts an inventory watcher.
+"""
+
+from datetime import date
+from pathlib import Path
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from dateutil import parser as date_parser  # type: ignore[import-untyped]
+
+from src.models.schemas import Flight, FlightCriteria
+from src.tools.flight_index import FlightIndex
+from src.tools.flight_snapshot import load_snapshot
+
+PARALLEL_MIN_BATCH = 2000
+
+
+class SearchResults(NamedTuple):
+    flights: List[Flight]  # best first, at most the requested limit
+    total: int  # flights that matched, before the limit
+
+
+def parse_date_or_range(value: Optional[str]) -> Optional[Tuple[date, date]]:
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.lower() in ("flexible", "null", ""):
+        return None
+    if " to " in value:
+        parts = value.split(" to ", 1)
+        try:
+            start = date_parser.parse(parts[0].strip()).date()
+            end = date_parser.parse(parts[1].strip()).date()
+            return (start, end)
+        except (ValueError, TypeError):
+            return None
+    try:
+        d = date_parser.parse(value).date()
+        return (d, d)
+    except (ValueError, TypeError):
+        return None
+
+
+def materialize(index: FlightIndex, ranked: Iterable[Tuple[Any, Any]]) -> List[Flight]:
+    """New ``Flight`` objects for (row id, score) pairs, owned by the caller."""
+    return [index.flight(int(i), match_score=round(float(score), 2)) for i, score in ranked]
+
+
+def _ranked_results(
+    index: FlightIndex, row_ids: np.ndarray, criteria: FlightCriteria, limit: Optional[int]
+) -> SearchResults:
+    ids, scores = index.rank(row_ids, criteria, limit)
+    return SearchResults(materialize(index, zip(ids, scores)), len(row_ids))
+
+
+def search_batch(
+    index: FlightIndex, criteria_list: Sequence[FlightCriteria], limit: Optional[int]
+) -> List[SearchResults]:
+    selected = index.select_many(
+        criteria_list,
+        [parse_date_or_range(c.departure_date) for c in criteria_list],
+        [parse_date_or_range(c.return_date) for c in criteria_list],
+    )
+    return [
+        _ranked_results(index, row_ids, criteria, limit)
+        for criteria, row_ids in zip(criteria_list, selected)
+    ]
+
+
+_worker_index: Optional[FlightIndex] = None
+
+
+def init_worker(snapshot_path: str) -> None:
+    """Pool initializer: map the snapshot once per worker process."""
+    global _worker_index
+    _worker_index = load_snapshot(Path(snapshot_path))
+
+
+def search_in_worker(
+    criteria_list: List[FlightCriteria], limit: Optional[int]
+) -> List[SearchResults]:
+    assert _worker_index is not None
+    return search_batch(_worker_index, criteria_list, limit)
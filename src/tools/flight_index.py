@@ -0,0 +1,931 @@
+import hashlib
+import json
+from array import array
+from datetime import date
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    TypeVar,
+)
+
+import numpy as np
+from dateutil import parser as date_parser  # type: ignore[import-untyped]
+
+from src.models.schemas import Flight, FlightCriteria
+
+NO_CODE = -1
+NO_DATE = -1
+
+DateRange = Tuple[date, date]
+K = TypeVar("K", bound=Hashable)
+
+# Columns with one entry per row slot.
+ROW_COLUMNS = (
+    "origin",
+    "destination",
+    "airline",
+    "alliance",
+    "price",
+    "layover_count",
+    "refundable",
+    "overnight",
+    "departure",
+    "return_",
+    "departure_text",
+    "return_text",
+    "row_hash",
+)
+# Variable-length columns, stored flat with per-row offsets (n + 1 entries).
+RAGGED_COLUMNS = {"layover_values": "layover_offsets", "key_bytes": "key_offsets"}
+
+_DTYPES = {
+    "origin": np.int32,
+    "destination": np.int32,
+    "airline": np.int32,
+    "alliance": np.int32,
+    "price": np.float64,
+    "layover_count": np.int16,
+    "refundable": np.bool_,
+    "overnight": np.bool_,
+    "departure": np.int32,
+    "return_": np.int32,
+    "departure_text": np.int32,
+    "return_text": np.int32,
+    "row_hash": np.uint64,
+    "layover_offsets": np.int64,
+    "layover_values": np.int32,
+    "key_offsets": np.int64,
+    "key_bytes": np.uint8,
+}
+
+
+# array.array type codes matching _DTYPES, for building columns row by row.
+_TYPECODES = {
+    "origin": "i",
+    "destination": "i",
+    "airline": "i",
+    "alliance": "i",
+    "price": "d",
+    "layover_count": "h",
+    "refundable": "b",
+    "overnight": "b",
+    "departure": "i",
+    "return_": "i",
+    "departure_text": "i",
+    "return_text": "i",
+    "row_hash": "Q",
+}
+
+VOCABULARIES = ("places", "airlines", "alliances", "dates")
+
+# Characters read from flights.json at a time by ``iter_records``.
+READ_CHUNK = 1 << 16
+_JSON = json.JSONDecoder()
+
+
+class RouteRows(NamedTuple):
+    """Row ids on one route, sorted by departure date."""
+
+    ids: np.ndarray
+    departure: np.ndarray
+
+
+class FlightRecord(NamedTuple):
+    """A validated inventory row with its stable key and content digest."""
+
+    key: str
+    flight: Flight
+    digest: int
+
+
+def _route_key(origin: str, destination: str) -> Tuple[str, str]:
+    return (origin.lower(), destination.lower())
+
+
+def _to_ordinal(value: str, cache: Dict[str, Optional[int]]) -> Optional[int]:
+    """Parse a date string to a proleptic ordinal; None if it cannot be parsed."""
+    if value in cache:
+        return cache[value]
+    try:
+        ordinal: Optional[int] = date_parser.parse(value).date().toordinal()
+    except (ValueError, TypeError, OverflowError):
+        ordinal = None
+    cache[value] = ordinal
+    return ordinal
+
+
+def _encode(value: str, vocabulary: List[str], codes: Dict[str, int]) -> int:
+    code = codes.get(value)
+    if code is None:
+        code = len(vocabulary)
+        vocabulary.append(value)
+        codes[value] = code
+    return code
+
+
+def to_record(row: Dict[str, Any]) -> FlightRecord:
+    """Validate a raw flights.json row.
+
+    The key is the row's ``id`` when present, otherwise airline, route and
+    dates joined together. The digest covers the validated fields, so it
+    only changes when the flight itself does.
+    """
+    if "overnight_layover" not in row and row.get("layovers"):
+        row = {**row, "overnight_layover": len(row["layovers"]) > 1}
+    flight = Flight(**row)
+    key = row.get("id")
+    if key is None:
+        key = "|".join(
+            (
+                flight.airline,
+                flight.origin,
+                flight.destination,
+                flight.departure_date,
+                flight.return_date or "",
+            )
+        )
+    canonical = json.dumps(
+        flight.model_dump(by_alias=True, exclude={"match_score"}), sort_keys=True
+    )
+    digest = int.from_bytes(hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).digest(), "little")
+    return FlightRecord(key=str(key), flight=flight, digest=digest)
+
+
+def key_hash(key: str) -> int:
+    """64-bit hash of a flight key (see ``to_record``)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def iter_json_array(f: TextIO, chunk_size: int = READ_CHUNK) -> Iterator[Any]:
+    """Items of the top-level JSON array in ``f``, decoded one at a time.
+
+    The file is read in chunks and each item is parsed as soon as it is
+    complete, so memory holds one chunk and one item rather than the
+    whole document.
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> None:
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(separators: str) -> None:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in separators:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip(" \t\r\n")
+    if buffer[pos : pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    while True:
+        skip(" \t\r\n,")
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = _JSON.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buffer) and not eof:
+            # A number may continue in the next chunk; decode it again.
+            fill()
+            continue
+        pos = end
+        yield item
+
+
+def iter_records(path: Path) -> Iterator[FlightRecord]:
+    """Read a flights.json file and validate its rows one at a time.
+
+    The file is parsed incrementally (``iter_json_array``), never loaded
+    as a whole. Rows that end up with the same key (e.g. identical flights
+    without an ``id``) get ``#2``, ``#3``... suffixes so every key names
+    one row.
+    """
+    seen: Dict[str, int] = {}
+    with open(path, encoding="utf-8") as f:
+        for row in iter_json_array(f):
+            record = to_record(row)
+            count = seen.get(record.key, 0) + 1
+            seen[record.key] = count
+            yield record if count == 1 else record._replace(key=f"{record.key}#{count}")
+
+
+class _RowEncoder:
+    """Turns records into column values, extending the vocabularies in place."""
+
+    def __init__(self, vocabularies: Dict[str, List[str]]) -> None:
+        self.vocabularies = vocabularies
+        self.codes = {
+            name: {value: code for code, value in enumerate(vocabularies[name])}
+            for name in VOCABULARIES
+        }
+        self.parsed: Dict[str, Optional[int]] = {}
+        self.departure_failures = 0
+        self.return_failures = 0
+
+    def _code(self, vocabulary: str, value: str) -> int:
+        return _encode(value, self.vocabularies[vocabulary], self.codes[vocabulary])
+
+    def encode(
+        self, record: FlightRecord
+    ) -> Tuple[Tuple[Any, ...], List[int], bytes, Tuple[str, str]]:
+        """(row values in ``ROW_COLUMNS`` order, layover codes, key bytes, route)."""
+        f = record.flight
+        dep = _to_ordinal(f.departure_date, self.parsed)
+        if dep is None:
+            self.departure_failures += 1
+            dep = NO_DATE
+        ret = _to_ordinal(f.return_date, self.parsed) if f.return_date else NO_DATE
+        if ret is None:
+            self.return_failures += 1
+            ret = NO_DATE
+        values = (
+            self._code("places", f.origin),
+            self._code("places", f.destination),
+            self._code("airlines", f.airline),
+            self._code("alliances", f.alliance) if f.alliance else NO_CODE,
+            f.price_usd,
+            len(f.layovers),
+            f.refundable,
+            f.overnight_layover,
+            dep,
+            ret,
+            self._code("dates", f.departure_date),
+            self._code("dates", f.return_date) if f.return_date is not None else NO_CODE,
+            record.digest,
+        )
+        layovers = [self._code("places", place) for place in f.layovers]
+        return values, layovers, record.key.encode("utf-8"), _route_key(f.origin, f.destination)
+
+
+def _group_rows(
+    group: np.ndarray, n_groups: int, departure: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CSR layout of rows per group, each group sorted by departure date.
+
+    Returns (rows, departures, offsets): the rows of group ``g`` are
+    ``rows[offsets[g]:offsets[g + 1]]``.
+    """
+    rows = np.lexsort((np.arange(len(group)), departure, group)).astype(np.int64)
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group, minlength=n_groups), out=offsets[1:])
+    return rows, departure[rows], offsets
+
+
+def postings_from_csr(
+    keys: Sequence[K], rows: np.ndarray, departure: np.ndarray, offsets: np.ndarray
+) -> Dict[K, RouteRows]:
+    postings: Dict[K, RouteRows] = {}
+    for g, key in enumerate(keys):
+        lo, hi = offsets[g], offsets[g + 1]
+        postings[key] = RouteRows(ids=rows[lo:hi], departure=departure[lo:hi])
+    return postings
+
+
+def postings_to_csr(
+    postings: Dict[K, RouteRows]
+) -> Tuple[List[K], np.ndarray, np.ndarray, np.ndarray]:
+    keys = list(postings)
+    groups = [postings[k] for k in keys]
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(g.ids) for g in groups], out=offsets[1:])
+    if groups:
+        rows = np.concatenate([g.ids for g in groups]).astype(np.int64, copy=False)
+        departure = np.concatenate([g.departure for g in groups]).astype(np.int32, copy=False)
+    else:
+        rows = np.empty(0, dtype=np.int64)
+        departure = np.empty(0, dtype=np.int32)
+    return keys, rows, departure, offsets
+
+
+class _Storage:
+    """Column buffers with spare capacity, shared by successive index versions.
+
+    A version only ever reads the first ``size`` rows of each buffer, so the
+    latest version can append past that point while older versions are
+    still being searched. ``rows`` records how far the buffers are in use;
+    only a version whose size matches it may append.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], rows: int, lengths: Dict[str, int]) -> None:
+        self.arrays = arrays
+        self.rows = rows
+        self.lengths = lengths
+
+    @classmethod
+    def copy_of(
+        cls, columns: Dict[str, np.ndarray], size: int, extra_rows: int, extra: Dict[str, int]
+    ) -> "_Storage":
+        capacity = max(size + extra_rows, size + size // 4 + 1024)
+        arrays: Dict[str, np.ndarray] = {}
+        for name in ROW_COLUMNS:
+            arrays[name] = np.empty(capacity, dtype=_DTYPES[name])
+            arrays[name][:size] = columns[name]
+        lengths: Dict[str, int] = {}
+        for values, offsets in RAGGED_COLUMNS.items():
+            arrays[offsets] = np.empty(capacity + 1, dtype=np.int64)
+            arrays[offsets][: size + 1] = columns[offsets]
+            used = len(columns[values])
+            arrays[values] = np.empty(
+                max(used + extra[values], used + used // 4 + 4096), dtype=_DTYPES[values]
+            )
+            arrays[values][:used] = columns[values]
+            lengths[values] = used
+        return cls(arrays, size, lengths)
+
+    def fits(self, extra_rows: int, extra: Dict[str, int]) -> bool:
+        if self.rows + extra_rows > len(self.arrays["price"]):
+            return False
+        return all(
+            self.lengths[values] + extra[values] <= len(self.arrays[values])
+            for values in RAGGED_COLUMNS
+        )
+
+    def views(self) -> Dict[str, np.ndarray]:
+        columns = {name: self.arrays[name][: self.rows] for name in ROW_COLUMNS}
+        for values, offsets in RAGGED_COLUMNS.items():
+            columns[offsets] = self.arrays[offsets][: self.rows + 1]
+            columns[values] = self.arrays[values][: self.lengths[values]]
+        return columns
+
+
+class KeyLookup:
+    """Row id of every live key of an index, for applying inventory changes.
+
+    Two aligned NumPy arrays, the key hashes in sorted order and their row
+    ids: 16 bytes per flight rather than a dict of key strings. A hash hit
+    is confirmed against the key bytes of the index, so a collision reads
+    as a miss, never as the wrong row. Rows only ever get appended to an
+    index, so a lookup stays valid for later versions (see ``updated``).
+    """
+
+    def __init__(self, hashes: np.ndarray, rows: np.ndarray) -> None:
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.rows = rows[order]
+
+    @classmethod
+    def build(cls, index: "FlightIndex") -> "KeyLookup":
+        rows = index.live_rows()
+        hashes = np.fromiter(
+            (key_hash(index.key(int(row))) for row in rows), dtype=np.uint64, count=len(rows)
+        )
+        return cls(hashes, rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def position(self, index: "FlightIndex", key: str) -> int:
+        """Position of ``key`` in ``rows``, or -1 if it is not live."""
+        target = np.uint64(key_hash(key))
+        pos = int(self.hashes.searchsorted(target))
+        while pos < len(self.hashes) and self.hashes[pos] == target:
+            if index.key(int(self.rows[pos])) == key:
+                return pos
+            pos += 1
+        return -1
+
+    def rows_of(self, index: "FlightIndex", keys: Iterable[str]) -> np.ndarray:
+        """Live rows of ``keys``; unknown keys are skipped."""
+        positions = [self.position(index, key) for key in keys]
+        return self.rows[[pos for pos in positions if pos >= 0]]
+
+    def updated(self, removed: np.ndarray, added: Sequence[Tuple[str, int]]) -> "KeyLookup":
+        """Lookup after ``removed`` rows were dropped and ``(key, row)`` pairs added."""
+        dead = np.zeros(max(int(self.rows.max(initial=-1)), int(removed.max(initial=-1))) + 1, bool)
+        dead[removed] = True
+        keep = ~dead[self.rows]
+        hashes = np.fromiter((key_hash(key) for key, _ in added), dtype=np.uint64, count=len(added))
+        rows = np.fromiter((row for _, row in added), dtype=np.int64, count=len(added))
+        return KeyLookup(
+            np.concatenate([self.hashes[keep], hashes]), np.concatenate([self.rows[keep], rows])
+        )
+
+    def compacted(self, live: np.ndarray) -> "KeyLookup":
+        """Lookup for the ``compacted`` copy of an index whose live rows are ``live``."""
+        return KeyLookup(self.hashes, np.searchsorted(live, self.rows))
+
+
+class FlightIndex:
+    """Columnar view of the flight catalog.
+
+    Every column is aligned on the row id (position in the source catalog).
+    String columns are dictionary-encoded against small vocabularies and
+    dates are stored as ordinals (``NO_DATE`` when missing or unparseable).
+    Layovers and flight keys are flat arrays with per-row offsets. Rows are
+    grouped by (origin, destination) and by destination, each group sorted
+    by departure date, so that a search only touches the matching route and
+    answers date ranges with a binary search. A row is live exactly when it
+    appears in the route groups; rows dropped by ``with_changes`` stay in
+    the columns as dead slots until ``compacted``.
+
+    The index is only a bundle of arrays, so it can be built from rows
+    (``from_records``/``from_json``) or wrapped around arrays mapped from a
+    snapshot file without copying them (see ``flight_snapshot``). It is
+    never modified in place: ``with_changes`` and ``compacted`` return a
+    new version, with ``version`` incremented.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        vocabularies: Dict[str, List[str]],
+        route_index: Dict[Tuple[str, str], RouteRows],
+        destination_index: Dict[str, RouteRows],
+        departure_parse_failures: int = 0,
+        return_parse_failures: int = 0,
+        buffer: Optional[Any] = None,
+        storage: Optional[_Storage] = None,
+        version: int = 0,
+    ) -> None:
+        self.version = version
+        # Owner of the column memory when the arrays are views (e.g. an mmap).
+        self.buffer = buffer
+        self._storage = storage
+        self.columns = columns
+        self.origin = columns["origin"]
+        self.destination = columns["destination"]
+        self.airline = columns["airline"]
+        self.alliance = columns["alliance"]
+        self.price = columns["price"]
+        self.layover_count = columns["layover_count"]
+        self.refundable = columns["refundable"]
+        self.overnight = columns["overnight"]
+        self.departure = columns["departure"]
+        self.return_ = columns["return_"]
+        self.departure_text = columns["departure_text"]
+        self.return_text = columns["return_text"]
+        self.row_hash = columns["row_hash"]
+        self.layover_offsets = columns["layover_offsets"]
+        self.layover_values = columns["layover_values"]
+        self.key_offsets = columns["key_offsets"]
+        self.key_bytes = columns["key_bytes"]
+        self.size = len(self.price)
+
+        self.vocabularies = vocabularies
+        self.places = vocabularies["places"]
+        self.airlines = vocabularies["airlines"]
+        self.alliances = vocabularies["alliances"]
+        self.dates = vocabularies["dates"]
+        self._alliance_codes = {name: code for code, name in enumerate(self.alliances)}
+
+        self.route_index = route_index
+        self.destination_index = destination_index
+        self.live_count = sum(len(rows.ids) for rows in destination_index.values())
+        self.departure_parse_failures = departure_parse_failures
+        self.return_parse_failures = return_parse_failures
+
+    @classmethod
+    def from_records(cls, records: Iterable[FlightRecord]) -> "FlightIndex":
+        """Build the index from records, streaming them into typed buffers.
+
+        Only one validated ``Flight`` is alive at a time; the columns grow
+        as compact ``array.array`` buffers and are moved into NumPy once.
+        """
+        encoder = _RowEncoder({name: [] for name in VOCABULARIES})
+        buffers = {name: array(_TYPECODES[name]) for name in ROW_COLUMNS}
+        appenders = [buffers[name].append for name in ROW_COLUMNS]
+        layover_offsets = array("q", [0])
+        layover_values = array("i")
+        key_offsets = array("q", [0])
+        key_bytes = bytearray()
+        route_group = array("q")
+        destination_group = array("q")
+        route_codes: Dict[Tuple[str, str], int] = {}
+        destination_codes: Dict[str, int] = {}
+
+        for record in records:
+            values, layovers, key, route = encoder.encode(record)
+            for append, value in zip(appenders, values):
+                append(value)
+            layover_values.extend(layovers)
+            layover_offsets.append(len(layover_values))
+            key_bytes += key
+            key_offsets.append(len(key_bytes))
+            route_group.append(route_codes.setdefault(route, len(route_codes)))
+            destination_group.append(destination_codes.setdefault(route[1], len(destination_codes)))
+
+        columns = {
+            name: np.frombuffer(buffers[name], dtype=_DTYPES[name]) for name in ROW_COLUMNS
+        }
+        columns["layover_offsets"] = np.frombuffer(layover_offsets, dtype=np.int64)
+        columns["layover_values"] = np.frombuffer(layover_values, dtype=np.int32)
+        columns["key_offsets"] = np.frombuffer(key_offsets, dtype=np.int64)
+        columns["key_bytes"] = np.frombuffer(bytes(key_bytes), dtype=np.uint8)
+        n = len(columns["price"])
+        # Give the columns headroom now, while nothing else holds them, so the
+        # first incremental change does not have to reallocate.
+        storage = _Storage.copy_of(columns, n, 0, {values: 0 for values in RAGGED_COLUMNS})
+        departure = columns["departure"]
+        route_groups = np.frombuffer(route_group, dtype=np.int64)
+        destination_groups = np.frombuffer(destination_group, dtype=np.int64)
+        return cls(
+            storage.views(),
+            encoder.vocabularies,
+            route_index=postings_from_csr(
+                list(route_codes), *_group_rows(route_groups, len(route_codes), departure)
+            ),
+            destination_index=postings_from_csr(
+                list(destination_codes),
+                *_group_rows(destination_groups, len(destination_codes), departure),
+            ),
+            departure_parse_failures=encoder.departure_failures,
+            return_parse_failures=encoder.return_failures,
+            storage=storage,
+        )
+
+    @classmethod
+    def from_json(cls, path: Path) -> "FlightIndex":
+        """Build the index from a flights.json file."""
+        return cls.from_records(iter_records(path))
+
+    def key(self, row: int) -> str:
+        """Stable key of a row (see ``to_record``)."""
+        lo, hi = self.key_offsets[row], self.key_offsets[row + 1]
+        return self.key_bytes[lo:hi].tobytes().decode("utf-8")
+
+    def live_rows(self) -> np.ndarray:
+        """Ids of the live rows, in catalog order."""
+        if not self.destination_index:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([rows.ids for rows in self.destination_index.values()]))
+
+    def flight(self, row: int, match_score: float = 0.0) -> Flight:
+        """Materialize one catalog row as a ``Flight``."""
+        lo, hi = self.layover_offsets[row], self.layover_offsets[row + 1]
+        alliance = self.alliance[row]
+        return_text = self.return_text[row]
+        return Flight(
+            airline=self.airlines[self.airline[row]],
+            alliance=self.alliances[alliance] if alliance != NO_CODE else None,
+            origin=self.places[self.origin[row]],
+            destination=self.places[self.destination[row]],
+            departure_date=self.dates[self.departure_text[row]],
+            return_date=self.dates[return_text] if return_text != NO_CODE else None,
+            layovers=[self.places[c] for c in self.layover_values[lo:hi]],
+            price_usd=float(self.price[row]),
+            refundable=bool(self.refundable[row]),
+            overnight_layover=bool(self.overnight[row]),
+            match_score=match_score,
+        )
+
+    def _row_route(self, row: int) -> Tuple[str, str]:
+        return _route_key(self.places[self.origin[row]], self.places[self.destination[row]])
+
+    def with_changes(
+        self,
+        removed: Iterable[int],
+        added: Sequence[FlightRecord],
+        version: Optional[int] = None,
+    ) -> "FlightIndex":
+        """New version with ``removed`` rows dropped and ``added`` appended.
+
+        ``version`` defaults to this version + 1; a writer applying one
+        change in several steps passes the same number to each.
+
+        Only the route groups touched by the change are rebuilt; every other
+        group, and all column data, is shared with this version. Appended
+        rows go into spare capacity of the shared buffers, past the end this
+        version reads, so searches running against it are unaffected. The
+        buffers are only reallocated when they run out of room, or on the
+        first change to an index whose columns are not growable (built from
+        JSON or mapped from a snapshot).
+        """
+        removed_rows = np.unique(np.fromiter(removed, dtype=np.int64))
+        extra = {
+            "layover_values": sum(len(r.flight.layovers) for r in added),
+            "key_bytes": sum(len(r.key.encode("utf-8")) for r in added),
+        }
+        storage = self._storage
+        if storage is None or storage.rows != self.size or not storage.fits(len(added), extra):
+            storage = _Storage.copy_of(self.columns, self.size, len(added), extra)
+        arrays = storage.arrays
+
+        encoder = _RowEncoder(self.vocabularies)
+        encoder.departure_failures = self.departure_parse_failures
+        encoder.return_failures = self.return_parse_failures
+        for row in removed_rows:
+            if self.departure[row] == NO_DATE:
+                encoder.departure_failures -= 1
+            text = self.return_text[row]
+            if text != NO_CODE and self.dates[text] and self.return_[row] == NO_DATE:
+                encoder.return_failures -= 1
+
+        touched_routes: Dict[Tuple[str, str], List[int]] = {}
+        touched_destinations: Dict[str, List[int]] = {}
+        for row in removed_rows:
+            route = self._row_route(row)
+            touched_routes.setdefault(route, [])
+            touched_destinations.setdefault(route[1], [])
+
+        layover_end = storage.lengths["layover_values"]
+        key_end = storage.lengths["key_bytes"]
+        for i, record in enumerate(added, start=self.size):
+            values, layovers, key, route = encoder.encode(record)
+            for name, value in zip(ROW_COLUMNS, values):
+                arrays[name][i] = value
+            arrays["layover_values"][layover_end : layover_end + len(layovers)] = layovers
+            layover_end += len(layovers)
+            arrays["layover_offsets"][i + 1] = layover_end
+            arrays["key_bytes"][key_end : key_end + len(key)] = np.frombuffer(key, np.uint8)
+            key_end += len(key)
+            arrays["key_offsets"][i + 1] = key_end
+            touched_routes.setdefault(route, []).append(i)
+            touched_destinations.setdefault(route[1], []).append(i)
+
+        storage.rows = self.size + len(added)
+        storage.lengths["layover_values"] = layover_end
+        storage.lengths["key_bytes"] = key_end
+        columns = storage.views()
+        departure = columns["departure"]
+        dead = np.zeros(storage.rows, dtype=bool)
+        dead[removed_rows] = True
+
+        def merge(postings: Dict[K, RouteRows], touched: Dict[K, List[int]]) -> Dict[K, RouteRows]:
+            merged = dict(postings)
+            for key, new_rows in touched.items():
+                old = postings.get(key)
+                ids = old.ids if old is not None else np.empty(0, dtype=np.int64)
+                if len(removed_rows):
+                    ids = ids[~dead[ids]]
+                ids = np.concatenate([ids, np.asarray(new_rows, dtype=np.int64)])
+                if not len(ids):
+                    merged.pop(key, None)
+                    continue
+                ids = ids[np.lexsort((ids, departure[ids]))]
+                merged[key] = RouteRows(ids=ids, departure=departure[ids])
+            return merged
+
+        return FlightIndex(
+            columns,
+            self.vocabularies,
+            route_index=merge(self.route_index, touched_routes),
+            destination_index=merge(self.destination_index, touched_destinations),
+            departure_parse_failures=encoder.departure_failures,
+            return_parse_failures=encoder.return_failures,
+            storage=storage,
+            version=self.version + 1 if version is None else version,
+        )
+
+    def compacted(self) -> "FlightIndex":
+        """Copy of this version without dead row slots, as the next version.
+
+        Row ids change, so results cached against this version's number
+        must not be served for the copy.
+        """
+        live = self.live_rows()
+        remap = np.full(self.size, NO_CODE, dtype=np.int64)
+        remap[live] = np.arange(len(live), dtype=np.int64)
+        columns = {name: self.columns[name][live] for name in ROW_COLUMNS}
+        for values, offsets in RAGGED_COLUMNS.items():
+            starts = self.columns[offsets][live]
+            lengths = self.columns[offsets][live + 1] - starts
+            new_offsets = np.zeros(len(live) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=new_offsets[1:])
+            gather = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+            columns[offsets] = new_offsets
+            columns[values] = self.columns[values][gather]
+
+        def remapped(postings: Dict[K, RouteRows]) -> Dict[K, RouteRows]:
+            return {
+                key: RouteRows(ids=remap[rows.ids], departure=rows.departure)
+                for key, rows in postings.items()
+            }
+
+        return FlightIndex(
+            columns,
+            self.vocabularies,
+            route_index=remapped(self.route_index),
+            destination_index=remapped(self.destination_index),
+            departure_parse_failures=self.departure_parse_failures,
+            return_parse_failures=self.return_parse_failures,
+            version=self.version + 1,
+        )
+
+    def candidates(
+        self,
+        destination: str,
+        origin: Optional[str] = None,
+        departure_range: Optional[DateRange] = None,
+    ) -> np.ndarray:
+        """Row ids on the route (or into the destination), by departure date."""
+        dest = destination.strip().lower()
+        if origin:
+            rows = self.route_index.get((origin.strip().lower(), dest))
+        else:
+            rows = self.destination_index.get(dest)
+        if rows is None:
+            return np.empty(0, dtype=np.int64)
+        if departure_range is None:
+            return rows.ids
+        start, end = departure_range
+        lo = np.searchsorted(rows.departure, start.toordinal(), side="left")
+        hi = np.searchsorted(rows.departure, end.toordinal(), side="right")
+        return rows.ids[lo:hi]
+
+    def select(
+        self,
+        criteria: FlightCriteria,
+        departure_range: Optional[DateRange] = None,
+        return_range: Optional[DateRange] = None,
+    ) -> np.ndarray:
+        """Row ids matching the criteria and date ranges, in catalog order."""
+        if not criteria.destination or not criteria.destination.strip():
+            return np.empty(0, dtype=np.int64)
+        ids = self.candidates(criteria.destination, criteria.origin, departure_range)
+        if not len(ids):
+            return ids
+
+        mask = np.ones(len(ids), dtype=np.bool_)
+        if return_range is not None:
+            ret = self.return_[ids]
+            start, end = return_range
+            mask &= (ret >= start.toordinal()) & (ret <= end.toordinal())
+        if criteria.alliance:
+            code = self._alliance_codes.get(criteria.alliance.value, NO_CODE)
+            if code == NO_CODE:
+                return ids[:0]
+            mask &= self.alliance[ids] == code
+        if criteria.preferred_airlines:
+            wanted = {a.lower() for a in criteria.preferred_airlines}
+            codes = [c for c, name in enumerate(self.airlines) if name.lower() in wanted]
+            mask &= np.isin(self.airline[ids], codes)
+        if criteria.avoid_overnight_layover:
+            mask &= ~self.overnight[ids]
+        if criteria.max_layovers is not None:
+            mask &= self.layover_count[ids] <= criteria.max_layovers
+        if criteria.max_price_usd is not None:
+            mask &= self.price[ids] <= criteria.max_price_usd
+        if criteria.refundable_only:
+            mask &= self.refundable[ids]
+        return np.sort(ids[mask])
+
+    def select_many(
+        self,
+        criteria_list: Sequence[FlightCriteria],
+        departure_ranges: Sequence[Optional[DateRange]],
+        return_ranges: Sequence[Optional[DateRange]],
+        max_cells: int = 1 << 22,
+    ) -> List[np.ndarray]:
+        """Batch ``select``: one result per criteria, in input order.
+
+        Criteria on the same route share a single pass over its rows: the
+        filters of up to ``max_cells // route_size`` criteria are evaluated
+        together as one (criteria x rows) boolean mask.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        results: List[np.ndarray] = [empty] * len(criteria_list)
+        groups: Dict[Tuple[Optional[str], str], List[int]] = {}
+        for i, criteria in enumerate(criteria_list):
+            if not criteria.destination or not criteria.destination.strip():
+                continue
+            origin = criteria.origin.strip().lower() if criteria.origin else None
+            groups.setdefault((origin, criteria.destination.strip().lower()), []).append(i)
+
+        for (origin, destination), members in groups.items():
+            rows = (
+                self.route_index.get((origin, destination))
+                if origin is not None
+                else self.destination_index.get(destination)
+            )
+            if rows is None or not len(rows.ids):
+                continue
+            ids = np.sort(rows.ids)
+            step = max(1, max_cells // len(ids))
+            for start in range(0, len(members), step):
+                chunk = members[start : start + step]
+                mask = self._batch_mask(
+                    ids,
+                    [criteria_list[i] for i in chunk],
+                    [departure_ranges[i] for i in chunk],
+                    [return_ranges[i] for i in chunk],
+                )
+                for row, i in enumerate(chunk):
+                    results[i] = ids[mask[row]]
+        return results
+
+    def _batch_mask(
+        self,
+        ids: np.ndarray,
+        criteria_list: Sequence[FlightCriteria],
+        departure_ranges: Sequence[Optional[DateRange]],
+        return_ranges: Sequence[Optional[DateRange]],
+    ) -> np.ndarray:
+        lowest, highest = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+        def bounds(ranges: Sequence[Optional[DateRange]]) -> Tuple[np.ndarray, np.ndarray]:
+            lo = np.array([r[0].toordinal() if r else lowest for r in ranges], dtype=np.int64)
+            hi = np.array([r[1].toordinal() if r else highest for r in ranges], dtype=np.int64)
+            return lo[:, None], hi[:, None]
+
+        dep_lo, dep_hi = bounds(departure_ranges)
+        departure = self.departure[ids][None, :]
+        mask = (departure >= dep_lo) & (departure <= dep_hi)
+
+        if any(return_ranges):
+            ret_lo, ret_hi = bounds(return_ranges)
+            ret = self.return_[ids][None, :]
+            mask &= (ret >= ret_lo) & (ret <= ret_hi)
+
+        any_filter = -2  # no alliance requested
+        missing = -3  # requested alliance that no flight has
+        wanted_alliance = np.array(
+            [
+                self._alliance_codes.get(c.alliance.value, missing) if c.alliance else any_filter
+                for c in criteria_list
+            ],
+            dtype=np.int32,
+        )[:, None]
+        mask &= (wanted_alliance == any_filter) | (self.alliance[ids][None, :] == wanted_alliance)
+
+        if any(c.preferred_airlines for c in criteria_list):
+            lowered = [name.lower() for name in self.airlines]
+            allowed = np.ones((len(criteria_list), len(lowered)), dtype=np.bool_)
+            for row, c in enumerate(criteria_list):
+                if c.preferred_airlines:
+                    wanted = {a.lower() for a in c.preferred_airlines}
+                    allowed[row] = [name in wanted for name in lowered]
+            mask &= allowed[:, self.airline[ids]]
+
+        avoid_overnight = np.array([c.avoid_overnight_layover for c in criteria_list])[:, None]
+        mask &= ~(avoid_overnight & self.overnight[ids][None, :])
+        max_layovers = np.array(
+            [c.max_layovers if c.max_layovers is not None else highest for c in criteria_list],
+            dtype=np.int64,
+        )[:, None]
+        mask &= self.layover_count[ids][None, :] <= max_layovers
+        max_price = np.array(
+            [c.max_price_usd if c.max_price_usd is not None else np.inf for c in criteria_list],
+            dtype=np.float64,
+        )[:, None]
+        mask &= self.price[ids][None, :] <= max_price
+        refundable_only = np.array([c.refundable_only for c in criteria_list])[:, None]
+        mask &= self.refundable[ids][None, :] | ~refundable_only
+        return mask
+
+    def score(self, ids: np.ndarray, criteria: FlightCriteria) -> np.ndarray:
+        """Match scores for ``ids``; mirrors the original per-flight formula."""
+        if not len(ids):
+            return np.empty(0, dtype=np.float64)
+        layovers = self.layover_count[ids].astype(np.float64)
+        price = self.price[ids]
+        max_price = price.max()
+        scores = (3 - np.minimum(layovers, 3)) * 10
+        scores += np.where(layovers == 0, 15.0, 0.0)
+        if max_price > 0:
+            scores += np.maximum(0.0, (max_price - price) / max_price * 20)
+        scores += np.where(self.refundable[ids], 5.0, 0.0)
+        if criteria.alliance:
+            code = self._alliance_codes.get(criteria.alliance.value, NO_CODE)
+            scores += np.where(self.alliance[ids] == code, 8.0, 0.0)
+        return scores
+
+    def rank(
+        self, ids: np.ndarray, criteria: FlightCriteria, limit: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top ``limit`` rows of ``ids`` by score (ties keep catalog order).
+
+        ``ids`` must be in catalog order. Returns the selected ids and their
+        raw scores, best first. Selection is a partial sort, so only the
+        returned rows are fully ordered.
+        """
+        raw = self.score(ids, criteria)
+        scores = np.round(raw, 2)
+        n = len(ids)
+        if limit is not None and 0 <= limit < n:
+            if limit == 0:
+                return ids[:0], raw[:0]
+            kth = np.partition(scores, n - limit)[n - limit]
+            above = np.flatnonzero(scores > kth)
+            tied = np.flatnonzero(scores == kth)[: limit - len(above)]
+            chosen = np.concatenate([above, tied])
+        else:
+            chosen = np.arange(n)
+        order = np.lexsort((chosen, -scores[chosen]))
+        chosen = chosen[order]
+        return ids[chosen], raw[chosen]
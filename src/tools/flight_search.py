@@ -1,180 +1,433 @@
 import json
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from dateutil import parser as date_parser  # type: ignore[import-untyped]
+import numpy as np
 
-from src.models.schemas import Flight, FlightCriteria
+from config.settings import settings
+from src.models.schemas import FareDay, Flight, FlightCriteria
+from src.tools.fare_calendar import FareCalendar
+from src.tools.flight_batch import (
+    PARALLEL_MIN_BATCH,
+    SearchResults,
+    init_worker,
+    materialize,
+    parse_date_or_range,
+    search_batch,
+    search_in_worker,
+)
+from src.tools.flight_index import (
+    FlightIndex,
+    FlightRecord,
+    KeyLookup,
+    iter_records,
+    to_record,
+)
+from src.tools.flight_snapshot import load_or_build, write_snapshot
+from src.tools.place_resolver import PlaceResolver, load_aliases
+from src.utils.cache import LRUCache
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Changed flights indexed per step of a reload or delta, bounding how many
+# validated records are held at once.
+APPLY_BATCH_SIZE = 10_000
+
+
+# Cached search: (row id, score) of each returned flight, and the match count.
+_CachedSearch = Tuple[Tuple[Tuple[int, float], ...], int]
+
+
+class CatalogView(Sequence[Flight]):
+    """Read-only sequence over the live rows of one index version.
+
+    Rows stay in their columns until indexed; the view holds no ``Flight``
+    objects itself, so iterating it keeps only one row materialized.
+    """
+
+    def __init__(self, index: FlightIndex) -> None:
+        self._index = index
+        self._rows = index.live_rows()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [self._index.flight(int(row)) for row in self._rows[i]]
+        return self._index.flight(int(self._rows[i]))
+
 
 class FlightSearchTool:
-    def __init__(self, flights_path: str = "data/flights.json") -> None:
+    """Flight search over a versioned, indexed inventory.
+
+    ``self.index`` always points at a complete, immutable ``FlightIndex``
+    version. Inventory changes (``apply_delta``, ``reload_if_changed``)
+    build the next version incrementally and swap it in with a single
+    assignment (two when it is then compacted, each a complete version),
+    so a search that has already picked up a version keeps a consistent
+    view for its whole run.
+    """
+
+    def __init__(
+        self, flights_path: str = "data/flights.json", use_snapshot: Optional[bool] = None
+    ) -> None:
         self.flights_path = Path(flights_path)
-        self.flights: List[Flight] = []
+        self.use_snapshot = (
+            settings.flight_snapshot_enabled if use_snapshot is None else use_snapshot
+        )
+        self._write_lock = threading.Lock()
+        # Writer-side key -> row lookup, built on the first change.
+        self._key_lookup: Optional[KeyLookup] = None
+        self._source_stat: Optional[Tuple[int, int]] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._resolver: Optional[Tuple[int, PlaceResolver]] = None
+        self._calendar = FareCalendar.empty()
+        # Rows and scores, not Flight objects: every hit builds its own flights.
+        self._cache: LRUCache[_CachedSearch] = LRUCache(
+            settings.flight_cache_size, settings.flight_cache_ttl_seconds
+        )
         self._load_flights()
+        # Child processes (pool workers re-importing a module) serve one
+        # fixed version; only the parent process watches the source file.
+        if settings.flight_reload_interval_seconds > 0 and multiprocessing.parent_process() is None:
+            self.watch(settings.flight_reload_interval_seconds)
+
+    @property
+    def version(self) -> int:
+        """Version of the inventory currently served (0 for the initial load)."""
+        return self.index.version
+
+    @property
+    def flights(self) -> "CatalogView":
+        """Live catalog rows; each ``Flight`` is materialized only when accessed."""
+        return CatalogView(self.index)
+
+    def place_resolver(self) -> PlaceResolver:
+        """Alias resolver over the current inventory's places, rebuilt per version."""
+        index = self.index
+        cached = self._resolver
+        if cached is not None and cached[0] == index.version:
+            return cached[1]
+        resolver = PlaceResolver(
+            index.places, load_aliases(Path(settings.place_aliases_path))
+        )
+        self._resolver = (index.version, resolver)
+        return resolver
 
     def _load_flights(self) -> None:
         try:
-            with open(self.flights_path, encoding="utf-8") as f:
-                data = json.load(f)
-            for row in data:
-                if "overnight_layover" not in row and row.get("layovers"):
-                    row["overnight_layover"] = len(row["layovers"]) > 1
-            self.flights = [Flight(**row) for row in data]
-            logger.info("Loaded %d flights from %s", len(self.flights), self.flights_path)
+            self._source_stat = self._stat_source()
+            if self.use_snapshot:
+                snapshot_path = (
+                    Path(settings.flight_snapshot_path) if settings.flight_snapshot_path else None
+                )
+                self.index = load_or_build(self.flights_path, snapshot_path)
+            else:
+                self.index = FlightIndex.from_json(self.flights_path)
+            logger.info("Loaded %d flights from %s", self.index.size, self.flights_path)
+            self._calendar = FareCalendar.build(self.index)
+            if self.index.departure_parse_failures or self.index.return_parse_failures:
+                logger.warning(
+                    "Unparseable dates in %s: %d departure, %d return",
+                    self.flights_path,
+                    self.index.departure_parse_failures,
+                    self.index.return_parse_failures,
+                )
         except Exception as e:
             logger.error("Error loading flights: %s", e)
             raise
 
-    def _parse_date_or_range(self, value: Optional[str]) -> Optional[Tuple[date, date]]:
-        if not value or not isinstance(value, str):
-            return None
-        value = value.strip()
-        if value.lower() in ("flexible", "null", ""):
-            return None
-        if " to " in value:
-            parts = value.split(" to ", 1)
-            try:
-                start = date_parser.parse(parts[0].strip()).date()
-                end = date_parser.parse(parts[1].strip()).date()
-                return (start, end)
-            except (ValueError, TypeError):
-                return None
-        try:
-            d = date_parser.parse(value).date()
-            return (d, d)
-        except (ValueError, TypeError):
-            return None
-
-    def _filter_departure_dates(
-        self, flights: List[Flight], criteria_value: Optional[str]
-    ) -> List[Flight]:
-        parsed = self._parse_date_or_range(criteria_value)
-        if not parsed:
-            return flights
-        start, end = parsed
-        result = []
-        for f in flights:
-            try:
-                d = date_parser.parse(f.departure_date).date()
-                if start <= d <= end:
-                    result.append(f)
-            except (ValueError, TypeError):
-                continue
-        return result
-
-    def _filter_return_dates(
-        self, flights: List[Flight], criteria_value: Optional[str]
-    ) -> List[Flight]:
-        parsed = self._parse_date_or_range(criteria_value)
-        if not parsed:
-            return flights
-        start, end = parsed
-        result = []
-        for f in flights:
-            if not f.return_date:
-                continue
-            try:
-                d = date_parser.parse(f.return_date).date()
-                if start <= d <= end:
-                    result.append(f)
-            except (ValueError, TypeError):
+    def _stat_source(self) -> Tuple[int, int]:
+        stat = self.flights_path.stat()
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def apply_delta(
+        self, upserts: Iterable[Dict[str, Any]] = (), removals: Iterable[str] = ()
+    ) -> int:
+        """Apply inventory changes and return the new version number.
+
+        ``upserts`` are flights.json rows; a row whose key (its ``id``, or
+        airline + route + dates) already exists replaces that flight.
+        ``removals`` are keys to drop; unknown keys are ignored.
+        """
+        records = [to_record(row) for row in upserts]
+        with self._write_lock:
+            keys = self._keys()
+            removed = keys.rows_of(self.index, removals)
+            version = self.index.version + 1
+            index, keys, _ = self._upsert(self.index, keys, records, version)
+            return self._install(*self._remove(index, keys, removed, version))
+
+    def apply_delta_file(self, path: str) -> int:
+        """Apply a JSON delta file: ``{"upserts": [...], "removals": [...]}``."""
+        with open(path, encoding="utf-8") as f:
+            delta = json.load(f)
+        return self.apply_delta(delta.get("upserts") or [], delta.get("removals") or [])
+
+    def reload_if_changed(self) -> bool:
+        """Diff the source file against the live inventory and apply the changes.
+
+        Only flights whose content digest changed are re-indexed. The file
+        is parsed incrementally and changed flights are indexed in batches
+        as they are found, so neither the file nor the full set of changes
+        is ever held in memory. Returns True when a new version was
+        installed.
+        """
+        with self._write_lock:
+            stat = self._stat_source()
+            if stat == self._source_stat:
+                return False
+            keys = self._keys()
+            seen = np.zeros(len(keys), dtype=bool)
+            version = self.index.version + 1
+            index, staged, upserted = self._upsert(
+                self.index, keys, self._changed_records(self.index, keys, seen), version
+            )
+            removed = keys.rows[~seen]
+            self._source_stat = stat
+            if not upserted and not len(removed):
+                return False
+            self._install(*self._remove(index, staged, removed, version))
+            logger.info(
+                "Reloaded %s: %d upserted, %d removed",
+                self.flights_path,
+                upserted,
+                len(removed),
+            )
+            return True
+
+    def _changed_records(
+        self, index: FlightIndex, keys: KeyLookup, seen: np.ndarray
+    ) -> Iterator[FlightRecord]:
+        """Source records that are new or differ from ``index``; marks found keys in ``seen``."""
+        for record in iter_records(self.flights_path):
+            pos = keys.position(index, record.key)
+            if pos >= 0:
+                seen[pos] = True
+                if int(index.row_hash[keys.rows[pos]]) == record.digest:
+                    continue
+            yield record
+
+    def watch(self, interval: float) -> threading.Thread:
+        """Poll the source file every ``interval`` seconds in a daemon thread."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+
+        def poll() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    logger.error("Error reloading flights: %s", e)
+
+        self._watcher = threading.Thread(target=poll, name="flight-inventory-watcher", daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    # The methods below stage a change as unpublished index versions and
+    # install it; callers hold self._write_lock.
+
+    def _keys(self) -> KeyLookup:
+        if self._key_lookup is None:
+            self._key_lookup = KeyLookup.build(self.index)
+        return self._key_lookup
+
+    @staticmethod
+    def _upsert(
+        index: FlightIndex, keys: KeyLookup, records: Iterable[FlightRecord], version: int
+    ) -> Tuple[FlightIndex, KeyLookup, int]:
+        """Append ``records`` in batches, each replacing the live row with its key."""
+        count = 0
+        batch: List[FlightRecord] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) < APPLY_BATCH_SIZE:
                 continue
-        return result
+            index, keys = FlightSearchTool._upsert_batch(index, keys, batch, version)
+            count += len(batch)
+            batch = []
+        if batch:
+            index, keys = FlightSearchTool._upsert_batch(index, keys, batch, version)
+            count += len(batch)
+        return index, keys, count
+
+    @staticmethod
+    def _upsert_batch(
+        index: FlightIndex, keys: KeyLookup, batch: List[FlightRecord], version: int
+    ) -> Tuple[FlightIndex, KeyLookup]:
+        latest = {record.key: record for record in batch}
+        replaced = keys.rows_of(index, latest)
+        keys = keys.updated(replaced, [(key, row) for row, key in enumerate(latest, index.size)])
+        return index.with_changes(replaced, list(latest.values()), version=version), keys
 
-    def search(self, criteria: FlightCriteria) -> List[Flight]:
+    def _remove(
+        self, index: FlightIndex, keys: KeyLookup, removed: np.ndarray, version: int
+    ) -> Tuple[FlightIndex, KeyLookup]:
+        if len(removed) or index is self.index:
+            index = index.with_changes(removed, [], version=version)
+            keys = keys.updated(removed, [])
+        return index, keys
+
+    def _install(self, index: FlightIndex, keys: KeyLookup) -> int:
+        if index.size - index.live_count > index.live_count:
+            # Serve the new version before compacting it, so the previous
+            # one, and its buffers if with_changes had to reallocate them,
+            # can be freed before the compacted copy is made.
+            self.index = index
+            self._key_lookup = None
+            live = index.live_rows()
+            index = index.compacted()
+            keys = keys.compacted(live)
+        self.index = index
+        self._key_lookup = keys
+        self._calendar = self._calendar.refreshed(index)
+        self._cache.clear()
+        logger.info(
+            "Flight inventory version %d: %d live flights (%d row slots)",
+            index.version,
+            index.live_count,
+            index.size,
+        )
+        return index.version
+
+    def search(self, criteria: FlightCriteria, limit: Optional[int] = None) -> SearchResults:
+        """Matching flights, best first and at most ``limit`` when given, and the match count.
+
+        Returned flights are built from the index for this request and
+        carry its ``match_score``; the catalog itself is never modified.
+        """
         if not criteria.destination or not criteria.destination.strip():
-            return []
+            return SearchResults([], 0)
 
-        results: List[Flight] = list(self.flights)
-
-        results = self._filter_destination(results, criteria.destination)
-
-        if criteria.departure_date and criteria.departure_date.strip().lower() not in (
-            "flexible",
-            "null",
-        ):
-            results = self._filter_departure_dates(results, criteria.departure_date)
-        if criteria.return_date and criteria.return_date.strip().lower() not in (
-            "flexible",
-            "null",
-        ):
-            results = self._filter_return_dates(results, criteria.return_date)
-
-        if criteria.origin:
-            results = self._filter_origin(results, criteria.origin)
-        if criteria.alliance:
-            results = self._filter_alliance(results, criteria.alliance.value)
-        if criteria.preferred_airlines:
-            results = self._filter_airlines(results, criteria.preferred_airlines)
-        if criteria.avoid_overnight_layover:
-            results = self._filter_overnight(results)
-        if criteria.max_layovers is not None:
-            results = self._filter_max_layovers(results, criteria.max_layovers)
-        if criteria.max_price_usd is not None:
-            results = self._filter_price(results, criteria.max_price_usd)
-        if criteria.refundable_only:
-            results = self._filter_refundable(results)
-
-        results = self._rank_flights(results, criteria)
-        logger.info("Found %d flights matching criteria", len(results))
-        return results
+        index = self.index
+        departure_range = parse_date_or_range(criteria.departure_date)
+        return_range = parse_date_or_range(criteria.return_date)
+        cache_key = self._cache_key(criteria, limit, index.version, departure_range, return_range)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            ranked, total = cached
+            logger.info("Flight search cache hit (%d flights)", total)
+            return SearchResults(materialize(index, ranked), total)
 
-    def _filter_destination(self, flights: List[Flight], destination: str) -> List[Flight]:
-        dest = destination.strip().lower()
-        return [f for f in flights if f.destination.lower() == dest]
+        row_ids = index.select(
+            criteria,
+            departure_range=departure_range,
+            return_range=return_range,
+        )
+        ids, scores = index.rank(row_ids, criteria, limit)
+        ranked = tuple((int(i), float(score)) for i, score in zip(ids, scores))
+        logger.info("Found %d flights matching criteria", len(row_ids))
+        self._cache.put(cache_key, (ranked, len(row_ids)))
+        return SearchResults(materialize(index, ranked), len(row_ids))
 
-    def _filter_origin(self, flights: List[Flight], origin: str) -> List[Flight]:
-        o = origin.strip().lower()
-        return [f for f in flights if f.origin.lower() == o]
+    def fare_calendar(self, criteria: FlightCriteria) -> List[FareDay]:
+        """Cheapest fare per departure day on the criteria's route.
 
-    def _filter_alliance(self, flights: List[Flight], alliance: str) -> List[Flight]:
-        return [f for f in flights if f.alliance and f.alliance == alliance]
+        Covers the departure date or range of the criteria (every day with
+        flights when it is flexible). Only route and dates are taken into
+        account; the other filters apply to ``search`` results.
+        """
+        if not criteria.destination or not criteria.destination.strip():
+            return []
+        index = self.index
+        calendar = self._calendar
+        if calendar.version != index.version:
+            calendar = calendar.refreshed(index)
+            self._calendar = calendar
+        return calendar.days(
+            criteria.destination,
+            origin=criteria.origin,
+            date_range=parse_date_or_range(criteria.departure_date),
+        )
 
-    def _filter_airlines(
-        self, flights: List[Flight], airlines: List[str]
-    ) -> List[Flight]:
-        airlines_lower = [a.lower() for a in airlines]
-        return [f for f in flights if f.airline.lower() in airlines_lower]
+    @staticmethod
+    def _cache_key(
+        criteria: FlightCriteria,
+        limit: Optional[int],
+        version: int,
+        departure_range: Optional[Tuple[date, date]],
+        return_range: Optional[Tuple[date, date]],
+    ) -> Tuple[Any, ...]:
+        """Canonical form of the criteria, as far as ``search`` can tell them apart.
 
-    def _filter_overnight(self, flights: List[Flight]) -> List[Flight]:
-        return [f for f in flights if not f.overnight_layover]
+        Places and airlines are lower-cased (as the filters compare them),
+        "flexible"/"null"/unparseable dates collapse to no range and dates
+        are reduced to the range they parse to, airline lists become sorted
+        sets, and fields the search ignores (trip type, flexible dates) are
+        left out. The inventory version is part of the key.
+        """
+        return (
+            version,
+            limit,
+            (criteria.destination or "").strip().lower(),
+            criteria.origin.strip().lower() if criteria.origin else None,
+            departure_range,
+            return_range,
+            criteria.alliance.value if criteria.alliance else None,
+            tuple(sorted({a.lower() for a in criteria.preferred_airlines}))
+            if criteria.preferred_airlines
+            else None,
+            criteria.avoid_overnight_layover,
+            criteria.max_layovers,
+            criteria.max_price_usd,
+            criteria.refundable_only,
+        )
 
-    def _filter_max_layovers(
-        self, flights: List[Flight], max_layovers: int
-    ) -> List[Flight]:
-        return [f for f in flights if len(f.layovers) <= max_layovers]
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the search result cache."""
+        return self._cache.stats()
 
-    def _filter_price(self, flights: List[Flight], max_price: float) -> List[Flight]:
-        return [f for f in flights if f.price_usd <= max_price]
+    def search_many(
+        self,
+        criteria_list: Sequence[FlightCriteria],
+        limit: Optional[int] = None,
+        processes: Optional[int] = None,
+    ) -> List[SearchResults]:
+        """Run many searches at once; results are in input order.
 
-    def _filter_refundable(self, flights: List[Flight]) -> List[Flight]:
-        return [f for f in flights if f.refundable]
+        Criteria are grouped by route and each group is filtered in one
+        vectorized pass (``FlightIndex.select_many``). With ``processes``,
+        batches of at least ``PARALLEL_MIN_BATCH`` are split across a
+        process pool; workers map a snapshot of the current inventory
+        version instead of receiving a pickled copy, and run from
+        ``flight_batch`` so they never build this module's singleton.
+        """
+        index = self.index
+        if not processes or processes < 2 or len(criteria_list) < PARALLEL_MIN_BATCH:
+            return search_batch(index, criteria_list, limit)
 
-    def _rank_flights(
-        self, flights: List[Flight], criteria: FlightCriteria
-    ) -> List[Flight]:
-        if not flights:
-            return []
-        max_price = max(f.price_usd for f in flights)
-        for flight in flights:
-            score = 0.0
-            layover_count = len(flight.layovers)
-            score += (3 - min(layover_count, 3)) * 10
-            if layover_count == 0:
-                score += 15
-            price_score = ((max_price - flight.price_usd) / max_price) * 20
-            score += max(0, price_score)
-            if flight.refundable:
-                score += 5
-            if criteria.alliance and flight.alliance == criteria.alliance.value:
-                score += 8
-            flight.match_score = round(score, 2)
-        return sorted(flights, key=lambda x: x.match_score, reverse=True)
+        # Keep criteria for the same route in the same worker.
+        def route(c: FlightCriteria) -> Tuple[str, str]:
+            return ((c.origin or "").strip().lower(), (c.destination or "").strip().lower())
+
+        order = sorted(range(len(criteria_list)), key=lambda i: route(criteria_list[i]))
+        size = -(-len(order) // processes)
+        chunks = [order[i : i + size] for i in range(0, len(order), size)]
+        results: List[SearchResults] = [SearchResults([], 0)] * len(criteria_list)
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot = Path(tmp) / "flights.snapshot"
+            write_snapshot(index, snapshot, {"version": index.version})
+            with ProcessPoolExecutor(
+                max_workers=processes, initializer=init_worker, initargs=(str(snapshot),)
+            ) as pool:
+                futures = [
+                    pool.submit(search_in_worker, [criteria_list[i] for i in chunk], limit)
+                    for chunk in chunks
+                ]
+                for chunk, future in zip(chunks, futures):
+                    for i, found in zip(chunk, future.result()):
+                        results[i] = found
+        logger.info("Batch search of %d criteria across %d processes", len(criteria_list), processes)
+        return results
 
 
 flight_search_tool = FlightSearchTool()
@@ -0,0 +1,230 @@
+"""Compiled, memory-mappable snapshot of the flight inventory.
+
+Layout: an 8-byte magic, a little-endian u64 header length, a JSON header
+(source fingerprint, vocabularies, route keys and the dtype/offset/length of
+every column) and then the raw column arrays, each aligned to 64 bytes.
+Loading maps the file and wraps the columns with ``np.frombuffer``, so no
+array data is copied or validated.
+
+Build it ahead of time with::
+
+    python -m src.tools.flight_snapshot --source data/flights.json
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from src.tools.flight_index import (
+    RAGGED_COLUMNS,
+    ROW_COLUMNS,
+    FlightIndex,
+    postings_from_csr,
+    postings_to_csr,
+)
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"FLTSNAP1"
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+_LENGTH = struct.Struct("<Q")
+
+SNAPSHOT_COLUMNS = ROW_COLUMNS + tuple(
+    name for pair in RAGGED_COLUMNS.items() for name in pair
+)
+
+
+def default_snapshot_path(source: Path) -> Path:
+    return source.with_suffix(".snapshot")
+
+
+def source_fingerprint(source: Path) -> Dict[str, Any]:
+    stat = source.stat()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"sha256": digest.hexdigest(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(index: FlightIndex, path: Path, fingerprint: Dict[str, Any]) -> None:
+    """Write ``index`` to ``path`` atomically (temp file + rename)."""
+    if index.live_count != index.size:
+        index = index.compacted()
+    route_keys, route_rows, route_departure, route_offsets = postings_to_csr(index.route_index)
+    destination_keys, destination_rows, destination_departure, destination_offsets = (
+        postings_to_csr(index.destination_index)
+    )
+    arrays = {name: np.ascontiguousarray(index.columns[name]) for name in SNAPSHOT_COLUMNS}
+    arrays.update(
+        route_rows=route_rows,
+        route_departure=route_departure,
+        route_offsets=route_offsets,
+        destination_rows=destination_rows,
+        destination_departure=destination_departure,
+        destination_offsets=destination_offsets,
+    )
+    layout: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, array in arrays.items():
+        dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder == ">" else array.dtype
+        layout[name] = {"dtype": dtype.str, "offset": offset, "length": len(array)}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps(
+        {
+            "version": FORMAT_VERSION,
+            "source": fingerprint,
+            "rows": index.size,
+            "vocabularies": index.vocabularies,
+            "route_keys": route_keys,
+            "destination_keys": destination_keys,
+            "departure_parse_failures": index.departure_parse_failures,
+            "return_parse_failures": index.return_parse_failures,
+            "columns": layout,
+        }
+    ).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + _LENGTH.size + len(header))
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.astype(layout[name]["dtype"], copy=False).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+    logger.info("Wrote flight snapshot %s (%d rows)", path, index.size)
+
+
+def read_header(path: Path) -> Optional[Dict[str, Any]]:
+    """Snapshot header, or None if the file is missing or not a snapshot."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            header = json.loads(f.read(length))
+    except (OSError, ValueError, struct.error):
+        return None
+    if header.get("version") != FORMAT_VERSION:
+        return None
+    return header
+
+
+def load_snapshot(path: Path) -> FlightIndex:
+    """Map ``path`` and wrap its columns in a ``FlightIndex`` without copying."""
+    header = read_header(path)
+    if header is None:
+        raise ValueError(f"Not a flight snapshot: {path}")
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    (header_length,) = _LENGTH.unpack_from(buffer, len(MAGIC))
+    data_start = _aligned(len(MAGIC) + _LENGTH.size + header_length)
+    columns = {
+        name: np.frombuffer(
+            buffer,
+            dtype=np.dtype(spec["dtype"]),
+            count=spec["length"],
+            offset=data_start + spec["offset"],
+        )
+        for name, spec in header["columns"].items()
+    }
+    return FlightIndex(
+        {name: columns[name] for name in SNAPSHOT_COLUMNS},
+        header["vocabularies"],
+        route_index=postings_from_csr(
+            [(k[0], k[1]) for k in header["route_keys"]],
+            columns["route_rows"],
+            columns["route_departure"],
+            columns["route_offsets"],
+        ),
+        destination_index=postings_from_csr(
+            header["destination_keys"],
+            columns["destination_rows"],
+            columns["destination_departure"],
+            columns["destination_offsets"],
+        ),
+        departure_parse_failures=header["departure_parse_failures"],
+        return_parse_failures=header["return_parse_failures"],
+        buffer=buffer,
+    )
+
+
+def is_fresh(header: Optional[Dict[str, Any]], source: Path) -> bool:
+    """Whether a snapshot header still matches the source file.
+
+    Size and mtime are checked first; the content hash is only computed
+    when they differ, so a touched-but-unchanged file does not force a
+    rebuild.
+    """
+    if header is None:
+        return False
+    recorded = header.get("source") or {}
+    stat = source.stat()
+    if recorded.get("size") == stat.st_size and recorded.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return recorded.get("sha256") == source_fingerprint(source)["sha256"]
+
+
+def build_snapshot(source: Path, path: Optional[Path] = None) -> FlightIndex:
+    """Compile ``source`` (flights.json) into a snapshot and return its index."""
+    path = path or default_snapshot_path(source)
+    fingerprint = source_fingerprint(source)
+    index = FlightIndex.from_json(source)
+    write_snapshot(index, path, fingerprint)
+    return index
+
+
+def load_or_build(source: Path, path: Optional[Path] = None) -> FlightIndex:
+    """Load the snapshot for ``source``, rebuilding it if the source changed.
+
+    Falls back to an in-memory index if the snapshot cannot be written.
+    """
+    path = path or default_snapshot_path(source)
+    if is_fresh(read_header(path), source):
+        logger.info("Loading flight snapshot %s", path)
+        return load_snapshot(path)
+    logger.info("Flight snapshot %s is missing or stale; rebuilding", path)
+    fingerprint = source_fingerprint(source)
+    index = FlightIndex.from_json(source)
+    try:
+        write_snapshot(index, path, fingerprint)
+    except OSError as e:
+        logger.warning("Could not write flight snapshot %s: %s", path, e)
+        return index
+    return load_snapshot(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile flights.json into a binary snapshot.")
+    parser.add_argument("--source", default="data/flights.json", help="Flight inventory JSON")
+    parser.add_argument("--output", default=None, help="Snapshot path (default: <source>.snapshot)")
+    parser.add_argument(
+        "--force", action="store_true", help="Rebuild even if the snapshot is up to date"
+    )
+    args = parser.parse_args()
+    source = Path(args.source)
+    path = Path(args.output) if args.output else default_snapshot_path(source)
+    if not args.force and is_fresh(read_header(path), source):
+        logger.info("Snapshot %s is up to date", path)
+        return
+    build_snapshot(source, path)
+
+
+if __name__ == "__main__":
+    main()
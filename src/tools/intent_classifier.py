@@ -0,0 +1,179 @@
+"""Local intent classifier used ahead of the LLM router.
+
+Two stages: compiled keyword rules for unambiguous cues ("visa",
+"refund", "flights ... to X", "fly from X to Y") and a multinomial naive Bayes model over
+word unigrams and bigrams, trained at startup from labeled examples in
+``data/intent_examples.json``. The router only trusts a prediction whose
+confidence reaches ``settings.intent_fast_path_threshold``.
+"""
+
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from config.settings import settings
+from src.models.enums import IntentType
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9$]+")
+# Function words carry no intent and dominate the counts of a small training set.
+STOPWORDS = frozenset(
+    "a an the to of for in on at and or is are be do does i me my you your it this that "
+    "what what's whats how can with there any some".split()
+)
+
+RULES: List[Tuple[IntentType, Pattern[str], float]] = [
+    (
+        IntentType.VISA_QUERY,
+        re.compile(
+            r"\b(visas?|e-?visas?|visa-free|passports?|entry (rules|requirements))\b", re.I
+        ),
+        0.95,
+    ),
+    (
+        IntentType.POLICY_QUERY,
+        re.compile(
+            r"\b(refunds?|refund policy|cancel(s|led|ling|lation|lations)?|baggage|luggage"
+            r"|carry-on|change fees?|processing fees?|polic(y|ies)|transfer my (ticket|booking)"
+            r"|change my (flight|ticket|booking))\b",
+            re.I,
+        ),
+        0.9,
+    ),
+    (
+        IntentType.FLIGHT_SEARCH,
+        re.compile(
+            r"\b(flights?|fares?|tickets?|round[- ]trip|one[- ]way|nonstop)\b"
+            r".*\b(to|from|into)\s+\w+",
+            re.I,
+        ),
+        0.9,
+    ),
+    # "Flying to X" alone is as often about packing or documents as a
+    # search; it needs a route or a search verb to count as one.
+    (
+        IntentType.FLIGHT_SEARCH,
+        re.compile(
+            r"\b(fly|flying)\s+from\s+\w+.*\bto\s+\w+"
+            r"|\b(find|search|book|show|cheap|cheapest|want to|looking to)\b"
+            r".*\b(fly|flying)\s+to\s+\w+",
+            re.I,
+        ),
+        0.9,
+    ),
+    (
+        IntentType.CLARIFICATION_NEEDED,
+        re.compile(r"^\s*(hi|hello|hey|help|help me|start)\W*$", re.I),
+        0.9,
+    ),
+]
+
+
+class IntentPrediction(NamedTuple):
+    intent: IntentType
+    confidence: float
+    source: str  # "rule" or "model"
+
+
+def _features(text: str) -> List[str]:
+    words = [w for w in _TOKEN.findall(text.lower()) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesIntentModel:
+    """Multinomial naive Bayes with add-one smoothing."""
+
+    def __init__(self, examples: Dict[str, List[str]]) -> None:
+        self.intents: List[IntentType] = []
+        counts: List[Counter] = []
+        for label, texts in examples.items():
+            try:
+                intent = IntentType(label)
+            except ValueError:
+                logger.warning("Ignoring examples for unknown intent %s", label)
+                continue
+            self.intents.append(intent)
+            counts.append(Counter(f for text in texts for f in _features(text)))
+        self.vocabulary = set().union(*counts) if counts else set()
+        total_examples = sum(len(examples[i.value]) for i in self.intents)
+        self.log_prior = [
+            math.log(len(examples[i.value]) / total_examples) for i in self.intents
+        ]
+        self.log_likelihood: List[Dict[str, float]] = []
+        self.log_unseen: List[float] = []
+        for counter in counts:
+            denominator = sum(counter.values()) + len(self.vocabulary)
+            self.log_likelihood.append(
+                {f: math.log((c + 1) / denominator) for f, c in counter.items()}
+            )
+            self.log_unseen.append(math.log(1 / denominator))
+
+    def predict(self, text: str) -> Optional[IntentPrediction]:
+        """Most probable intent and its posterior; None if no feature is known."""
+        features = [f for f in _features(text) if f in self.vocabulary]
+        if not features or not self.intents:
+            return None
+        scores = [
+            prior + sum(likelihood.get(f, unseen) for f in features)
+            for prior, likelihood, unseen in zip(
+                self.log_prior, self.log_likelihood, self.log_unseen
+            )
+        ]
+        top = max(scores)
+        weights = [math.exp(s - top) for s in scores]
+        best = scores.index(top)
+        return IntentPrediction(self.intents[best], weights[best] / sum(weights), "model")
+
+
+class IntentClassifier:
+    """Rules first, the lexical model for everything else.
+
+    A single matching rule decides the intent unless the model picks a
+    different one, in which case there is no prediction and the LLM
+    router decides. When rules for different intents match, or none
+    does, the model's prediction is used; on a conflict it must also pick
+    one of the matched intents.
+    """
+
+    def __init__(self, model: NaiveBayesIntentModel) -> None:
+        self.model = model
+
+    @classmethod
+    def from_file(cls, path: Path) -> "IntentClassifier":
+        try:
+            with open(path, encoding="utf-8") as f:
+                examples = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Could not load intent examples from %s: %s", path, e)
+            examples = {}
+        return cls(NaiveBayesIntentModel(examples))
+
+    @staticmethod
+    def rule_matches(text: str) -> Dict[IntentType, float]:
+        matches: Dict[IntentType, float] = {}
+        for intent, pattern, confidence in RULES:
+            if pattern.search(text):
+                matches[intent] = max(confidence, matches.get(intent, 0.0))
+        return matches
+
+    def predict(self, text: str) -> Optional[IntentPrediction]:
+        matches = self.rule_matches(text)
+        model = self.model.predict(text)
+        if len(matches) == 1:
+            intent, confidence = next(iter(matches.items()))
+            if model is None:
+                return IntentPrediction(intent, confidence, "rule")
+            if model.intent != intent:
+                return None
+            return IntentPrediction(intent, max(confidence, model.confidence), "rule")
+        if matches and (model is None or model.intent not in matches):
+            return None
+        return model
+
+
+intent_classifier = IntentClassifier.from_file(Path(settings.intent_examples_path))
@@ -0,0 +1,236 @@
+"""Resolve free-text city and airport names to inventory place names.
+
+The resolver is built once per inventory version from the place vocabulary
+of the flight index plus ``data/place_aliases.json`` (IATA city and airport
+codes, alternate spellings). Lookups try, in order: an exact match on the
+normalized text, a unique prefix match (binary search over the sorted
+aliases) and a bounded edit-distance match over candidates that share a
+trigram with the query. No LLM call is involved.
+"""
+
+import bisect
+import json
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MIN_PREFIX = 3
+MAX_SCAN_WORDS = 4
+ORIGIN_MARKERS = {"from", "leaving", "departing"}
+DESTINATION_MARKERS = {"to", "into", "towards", "for"}
+# A place within STOP_WINDOW words after one of these is a stop on the way
+# ("via Doha", "a layover in Istanbul"), never the origin or destination.
+STOP_MARKERS = set(
+    "via through thru layover layovers stopover stopovers connecting connection "
+    "connections transit stop stops".split()
+)
+STOP_WINDOW = 3
+
+_NON_WORD = re.compile(r"[^\w]+")
+_WORD = re.compile(r"\w+")
+
+
+class PlaceMention(NamedTuple):
+    """A place found in free text: canonical name and word position."""
+
+    place: str
+    start: int
+    end: int
+
+
+def normalize_place(text: str) -> str:
+    """Case-folded, accent-free text with punctuation collapsed to spaces."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", stripped.casefold()).replace("_", " ").strip()
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_distance(text: str) -> int:
+    if len(text) < 5:
+        return 0
+    return 1 if len(text) <= 8 else 2
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or ``limit + 1`` once it is known to exceed ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def load_aliases(path: Path) -> Dict[str, Dict[str, List[str]]]:
+    """``{place: {"codes": [...], "names": [...]}}``; empty if the file is missing."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning("Place alias file not found: %s", path)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Could not load place aliases from %s: %s", path, e)
+    return {}
+
+
+class PlaceResolver:
+    """Alias index over the known places.
+
+    Inventory names win over alias-file entries that normalize to the same
+    text, and an alias claimed by two different places is dropped rather
+    than guessed. Codes (``DXB``, ``NYC``) resolve like any other alias,
+    but when scanning running text they only match if written in capitals,
+    so words such as "sin" or "par" are not taken for airports.
+    """
+
+    def __init__(
+        self, places: Iterable[str], aliases: Optional[Dict[str, Dict[str, List[str]]]] = None
+    ) -> None:
+        self._exact: Dict[str, str] = {}
+        self._codes: Set[str] = set()
+        ambiguous: Set[str] = set()
+
+        def add(alias: str, place: str) -> None:
+            key = normalize_place(alias)
+            if not key or key in ambiguous:
+                return
+            known = self._exact.get(key)
+            if known is None:
+                self._exact[key] = place
+            elif known != place and key != normalize_place(known):
+                del self._exact[key]
+                ambiguous.add(key)
+
+        for place in places:
+            add(place, place)
+        canonical = {normalize_place(place): place for place in self._exact.values()}
+        for place, entry in (aliases or {}).items():
+            place = canonical.get(normalize_place(place), place)
+            add(place, place)
+            for name in entry.get("names", []):
+                add(name, place)
+            for code in entry.get("codes", []):
+                add(code, place)
+                self._codes.add(normalize_place(code))
+
+        self._sorted = sorted(self._exact)
+        self._grams: Dict[str, List[str]] = {}
+        for key in self._sorted:
+            for gram in _trigrams(key):
+                self._grams.setdefault(gram, []).append(key)
+        self._longest = max((len(key.split()) for key in self._sorted), default=1)
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def resolve(self, text: Optional[str], fuzzy: bool = True) -> Optional[str]:
+        """Canonical place for ``text``, or None if it is unknown or ambiguous.
+
+        With ``fuzzy`` off only exact names and aliases count, so a place
+        missing from the inventory is not taken for a similar one.
+        """
+        if not text:
+            return None
+        key = normalize_place(text)
+        if not key:
+            return None
+        place = self._exact.get(key)
+        if place is not None or not fuzzy:
+            return place
+        return self._by_prefix(key) or self._by_distance(key)
+
+    def _by_prefix(self, key: str) -> Optional[str]:
+        if len(key) < MIN_PREFIX:
+            return None
+        lo = bisect.bisect_left(self._sorted, key)
+        hi = bisect.bisect_left(self._sorted, key + "\uffff")
+        places = {self._exact[alias] for alias in self._sorted[lo:hi]}
+        return places.pop() if len(places) == 1 else None
+
+    def _by_distance(self, key: str) -> Optional[str]:
+        limit = _max_distance(key)
+        if not limit:
+            return None
+        candidates = {alias for gram in _trigrams(key) for alias in self._grams.get(gram, ())}
+        best = limit + 1
+        places: Set[str] = set()
+        for alias in candidates:
+            if alias in self._codes:
+                continue
+            distance = _edit_distance(key, alias, best)
+            if distance < best:
+                best, places = distance, {self._exact[alias]}
+            elif distance == best:
+                places.add(self._exact[alias])
+        return places.pop() if best <= limit and len(places) == 1 else None
+
+    def find(self, text: str) -> List[PlaceMention]:
+        """Places mentioned in ``text``, longest exact alias first, left to right."""
+        words = _WORD.findall(text)
+        mentions: List[PlaceMention] = []
+        i = 0
+        while i < len(words):
+            for n in range(min(self._longest, MAX_SCAN_WORDS, len(words) - i), 0, -1):
+                phrase = " ".join(words[i : i + n])
+                key = normalize_place(phrase)
+                place = self._exact.get(key)
+                if place is None or (key in self._codes and not phrase.isupper()):
+                    continue
+                mentions.append(PlaceMention(place, i, i + n))
+                i += n
+                break
+            else:
+                i += 1
+        return mentions
+
+    def parse_route(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        """(origin, destination) read from phrases like "from X to Y".
+
+        The origin is only ever a place preceded by "from" or directly
+        followed by "to <place>" ("London to Paris"). A place preceded by
+        "to" is the destination, and failing that a single place with no
+        marker is. Stops ("via Doha", "a layover in Istanbul") are skipped.
+        """
+        mentions = self.find(text)
+        words = [word.casefold() for word in _WORD.findall(text)]
+        starts = {mention.start for mention in mentions}
+        origin: Optional[str] = None
+        destination: Optional[str] = None
+        unmarked: List[str] = []
+        for mention in mentions:
+            before = words[max(mention.start - STOP_WINDOW, 0) : mention.start]
+            marker = before[-1] if before else ""
+            if marker in ORIGIN_MARKERS and origin is None:
+                origin = mention.place
+            elif marker in DESTINATION_MARKERS and destination is None:
+                destination = mention.place
+            elif STOP_MARKERS.intersection(before):
+                continue
+            elif (
+                origin is None
+                and mention.end + 1 in starts
+                and words[mention.end] in DESTINATION_MARKERS
+            ):
+                origin = mention.place
+            else:
+                unmarked.append(mention.place)
+        if destination is None and len(unmarked) == 1:
+            destination = unmarked[0]
+        return origin, destination
@@ -1,8 +1,11 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
 
 from config.prompts import RAG_SYSTEM_PROMPT
 from config.settings import settings
 from src.models.schemas import RAGResult
+from src.services.lexical_index import lexical_index, reciprocal_rank_fusion
 from src.services.llm_service import llm_service
 from src.services.vector_store import vector_store
 from src.utils.logger import get_logger
@@ -10,6 +13,7 @@ from src.utils.logger import get_logger
 logger = get_logger(__name__)
 
 NO_INFO_MESSAGE = "I don't have that information in my knowledge base."
+RETRIEVAL_MODES = ("hybrid", "dense", "lexical")
 
 _RAG_FOLLOW_UP_PREFIX = """[Follow-up question. Previous assistant answer: {previous_answer}]
 User asks: {question}
@@ -33,37 +37,99 @@ class RAGTool:
         question: str,
         top_k: Optional[int] = None,
         previous_assistant_message: Optional[str] = None,
+        config: Optional[RunnableConfig] = None,
     ) -> RAGResult:
         k = top_k if top_k is not None else self.top_k
-        search_query = question
-        if previous_assistant_message and _is_follow_up(question):
-            search_query = f"{previous_assistant_message[:300]} {question}"
-        docs = vector_store.similarity_search(search_query, top_k=k)
+        search_query = self._search_query(question, previous_assistant_message)
+        docs = self._retrieve(search_query, k)
+        if not docs:
+            return RAGResult(answer=NO_INFO_MESSAGE, sources=[], confidence=0.0)
+        prompt = self._prompt(question, docs, previous_assistant_message)
+        answer = llm_service.generate(prompt, cache_site="rag", config=config)
+        return self._result(answer, docs)
 
+    async def aquery(
+        self,
+        question: str,
+        top_k: Optional[int] = None,
+        previous_assistant_message: Optional[str] = None,
+        config: Optional[RunnableConfig] = None,
+    ) -> RAGResult:
+        k = top_k if top_k is not None else self.top_k
+        search_query = self._search_query(question, previous_assistant_message)
+        docs = await self._aretrieve(search_query, k)
         if not docs:
-            return RAGResult(
-                answer=NO_INFO_MESSAGE,
-                sources=[],
-                confidence=0.0,
+            return RAGResult(answer=NO_INFO_MESSAGE, sources=[], confidence=0.0)
+        prompt = self._prompt(question, docs, previous_assistant_message)
+        answer = await llm_service.agenerate(prompt, cache_site="rag", config=config)
+        return self._result(answer, docs)
+
+    @staticmethod
+    def _retrieval_mode() -> str:
+        mode = settings.rag_retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(
+                f"Unknown RAG retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}"
             )
+        if mode == "hybrid" and not len(lexical_index):
+            return "dense"
+        return mode
+
+    @staticmethod
+    def _fuse(
+        dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]], k: int
+    ) -> List[Dict[str, Any]]:
+        return reciprocal_rank_fusion([dense, lexical], top_k=k, k=settings.rag_rrf_k)
+
+    def _retrieve(self, search_query: str, k: int) -> List[Dict[str, Any]]:
+        """Chunks for ``search_query``: BM25 and dense results fused by rank, or either alone."""
+        mode = self._retrieval_mode()
+        if mode == "lexical":
+            return lexical_index.search(search_query, top_k=k)
+        if mode == "dense":
+            return vector_store.similarity_search(search_query, top_k=k)
+        candidates = max(settings.rag_fusion_candidates, k)
+        dense = vector_store.similarity_search(search_query, top_k=candidates)
+        return self._fuse(dense, lexical_index.search(search_query, top_k=candidates), k)
+
+    async def _aretrieve(self, search_query: str, k: int) -> List[Dict[str, Any]]:
+        mode = self._retrieval_mode()
+        if mode == "lexical":
+            return lexical_index.search(search_query, top_k=k)
+        if mode == "dense":
+            return await vector_store.asimilarity_search(search_query, top_k=k)
+        candidates = max(settings.rag_fusion_candidates, k)
+        dense = await vector_store.asimilarity_search(search_query, top_k=candidates)
+        return self._fuse(dense, lexical_index.search(search_query, top_k=candidates), k)
+
+    @staticmethod
+    def _search_query(question: str, previous_assistant_message: Optional[str]) -> str:
+        if previous_assistant_message and _is_follow_up(question):
+            return f"{previous_assistant_message[:300]} {question}"
+        return question
 
+    @staticmethod
+    def _prompt(
+        question: str, docs: List[Dict[str, Any]], previous_assistant_message: Optional[str]
+    ) -> str:
         context = "\n\n".join(d["content"] for d in docs)
-        sources = [d["content"] for d in docs]
         if previous_assistant_message and _is_follow_up(question):
             question = _RAG_FOLLOW_UP_PREFIX.format(
                 previous_answer=previous_assistant_message[:500],
                 question=question,
             )
-        prompt = RAG_SYSTEM_PROMPT.format(context=context, question=question)
-        answer = llm_service.generate(prompt).strip()
+        return RAG_SYSTEM_PROMPT.format(context=context, question=question)
 
+    @staticmethod
+    def _result(answer: str, docs: List[Dict[str, Any]]) -> RAGResult:
+        answer = answer.strip()
+        sources = [d["content"] for d in docs]
         if not answer or NO_INFO_MESSAGE.lower() in answer.lower():
             return RAGResult(
                 answer=answer or NO_INFO_MESSAGE,
                 sources=sources,
                 confidence=0.0,
             )
-
         return RAGResult(answer=answer, sources=sources, confidence=1.0)
 
 
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterable, Coroutine, Iterator, Optional, Tuple, TypeVar
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    """One event loop in a daemon thread, shared by synchronous callers.
+
+    Lets code that cannot own a loop (e.g. Streamlit script reruns, one
+    thread per session) drive async graph runs on a single loop, so async
+    clients and the LLM concurrency limit are shared across sessions.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="async-graph-loop", daemon=True
+                )
+                thread.start()
+                self._loop = loop
+                logger.info("Started background event loop")
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """Run ``coro`` on the shared loop and block until it finishes."""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return future.result(timeout)
+
+    def iterate(self, items: AsyncIterable[T]) -> Iterator[T]:
+        """Consume an async iterable on the shared loop, one item at a time."""
+        iterator = items.__aiter__()
+
+        async def step() -> Tuple[bool, Optional[T]]:
+            try:
+                return True, await iterator.__anext__()
+            except StopAsyncIteration:
+                return False, None
+
+        while True:
+            more, item = self.run(step())
+            if not more:
+                return
+            yield item  # type: ignore[misc]
+
+
+background_loop = BackgroundLoop()
@@ -0,0 +1,115 @@
+"""Turns per second and per-node cost of the travel assistant graph, offline.
+
+Runs a fixed mix of user queries through the compiled graph with the
+offline LLM backend (no network, deterministic answers) and reports the
+mean and p95 wall time of every node and the overall turn rate::
+
+    python -m src.utils.benchmark_graph --turns 2000
+    python -m src.utils.benchmark_graph --turns 2000 --concurrency 32
+
+With ``--concurrency`` turns run concurrently on one event loop and only
+throughput is reported. Simulated latency and token rates come from the
+``OFFLINE_*`` settings (for example ``OFFLINE_LATENCY_MS=300``).
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict, List
+
+QUERIES = [
+    "flights from Dubai to Tokyo under $1000",
+    "Find me a round-trip to Tokyo with Star Alliance airlines only",
+    "cheap direct flights to Paris",
+    "do I need a visa for Japan",
+    "what's the refund policy for tickets",
+    "can I cancel my booking 48 hours before departure",
+    "best time to visit Tokyo",
+    "hello",
+    "I want to travel",
+    "flights to Atlantis",
+]
+
+
+def _state(query: str) -> Dict[str, Any]:
+    from langchain_core.messages import HumanMessage
+
+    return {
+        "messages": [HumanMessage(content=query)],
+        "user_query": query,
+        "intent": None,
+        "extracted_criteria": None,
+        "search_results": None,
+        "total_matches": None,
+        "fare_calendar": None,
+        "rag_context": None,
+        "final_response": None,
+        "needs_clarification": False,
+        "error": None,
+    }
+
+
+def _p95(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+def run_sequential(turns: int) -> None:
+    from src.agents.graph import travel_assistant_graph
+
+    timings: Dict[str, List[float]] = {}
+    started = time.perf_counter()
+    for i in range(turns):
+        last = time.perf_counter()
+        for update in travel_assistant_graph.stream(_state(QUERIES[i % len(QUERIES)])):
+            now = time.perf_counter()
+            for node in update:
+                timings.setdefault(node, []).append(now - last)
+            last = now
+    elapsed = time.perf_counter() - started
+
+    print(f"{turns} turns in {elapsed:.2f}s ({turns / elapsed:.0f} turns/s)")
+    for node, samples in sorted(timings.items(), key=lambda item: -sum(item[1])):
+        print(
+            f"  {node:<22} {len(samples):6d} runs"
+            f"  mean {1000 * sum(samples) / len(samples):7.3f} ms"
+            f"  p95 {1000 * _p95(samples):7.3f} ms"
+        )
+
+
+async def run_concurrent(turns: int, concurrency: int) -> None:
+    from src.agents.graph import travel_assistant_graph
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def turn(i: int) -> None:
+        async with semaphore:
+            await travel_assistant_graph.ainvoke(_state(QUERIES[i % len(QUERIES)]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(turn(i) for i in range(turns)))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{turns} turns, {concurrency} concurrent, in {elapsed:.2f}s"
+        f" ({turns / elapsed:.0f} turns/s)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the graph on the offline LLM backend.")
+    parser.add_argument("--turns", type=int, default=1000, help="User turns to run")
+    parser.add_argument("--concurrency", type=int, default=0, help="Concurrent async turns (0 = sequential)")
+    args = parser.parse_args()
+
+    # Settings are read on first import, so the backend is chosen before it.
+    os.environ["LLM_BACKEND"] = "offline"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.concurrency > 0:
+        asyncio.run(run_concurrent(args.turns, args.concurrency))
+    else:
+        run_sequential(args.turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Memory footprint of the flight inventory: ``Flight`` models vs ``FlightIndex``.
+
+Writes a synthetic catalog to a temporary flights.json and reports bytes
+per flight for a plain list of validated models and for the columnar index
+(columns, vocabularies and route postings), plus the peak allocation of
+each build. Both builds start from the file path, so parsing counts::
+
+    python -m src.utils.benchmark_inventory --rows 200000
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+from src.models.schemas import Flight
+from src.tools.flight_index import FlightIndex
+
+CITIES = [
+    "Dubai", "Tokyo", "London", "Paris", "New York", "Singapore", "Istanbul",
+    "Doha", "Frankfurt", "Sydney", "Bangkok", "Los Angeles", "Toronto", "Seoul",
+]
+AIRLINES = [
+    ("Emirates", None), ("Qatar Airways", "oneworld"), ("Turkish Airlines", "Star Alliance"),
+    ("ANA", "Star Alliance"), ("Lufthansa", "Star Alliance"), ("Air France", "SkyTeam"),
+    ("British Airways", "oneworld"), ("Korean Air", "SkyTeam"),
+]
+
+
+def synthetic_rows(n: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    for _ in range(n):
+        origin, destination = rng.sample(CITIES, 2)
+        airline, alliance = rng.choice(AIRLINES)
+        departure = start + timedelta(days=rng.randrange(365))
+        layovers = rng.sample([c for c in CITIES if c not in (origin, destination)], rng.randrange(3))
+        yield {
+            "airline": airline,
+            "alliance": alliance,
+            "from": origin,
+            "to": destination,
+            "departure_date": departure.isoformat(),
+            "return_date": (departure + timedelta(days=rng.randrange(3, 30))).isoformat(),
+            "layovers": layovers,
+            "price_usd": rng.randrange(200, 3000),
+            "refundable": rng.random() < 0.3,
+            "overnight_layover": len(layovers) > 1,
+        }
+
+
+def write_synthetic(path: Path, n: int, seed: int = 0) -> None:
+    """Write ``n`` synthetic rows as a flights.json array, one row at a time."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, row in enumerate(synthetic_rows(n, seed)):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(row))
+        f.write("\n]\n")
+
+
+def _load_models(path: Path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [Flight(**row) for row in json.load(f)]
+
+
+def _measure(build: Callable[[], Any]) -> Tuple[Any, int, int]:
+    """(result, bytes still allocated by it, peak bytes during the build)."""
+    tracemalloc.start()
+    try:
+        result = build()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, retained, peak
+
+
+def index_breakdown(index: FlightIndex) -> Dict[str, int]:
+    columns = sum(array.nbytes for array in index.columns.values())
+    vocabularies = sum(
+        sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+        for values in index.vocabularies.values()
+    )
+    postings = sum(
+        rows.ids.nbytes + rows.departure.nbytes
+        for postings in (index.route_index, index.destination_index)
+        for rows in postings.values()
+    )
+    return {"columns": columns, "vocabularies": vocabularies, "postings": postings}
+
+
+def run(rows: int, seed: int = 0) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "flights.json"
+        write_synthetic(path, rows, seed)
+        json_bytes = path.stat().st_size
+        flights, models_bytes, models_peak = _measure(lambda: _load_models(path))
+        del flights
+        index, index_bytes, index_peak = _measure(lambda: FlightIndex.from_json(path))
+
+    print(f"{rows} synthetic flights ({json_bytes / 2**20:.1f} MiB of JSON)")
+    print(f"  Flight models : {models_bytes / rows:8.1f} B/flight (peak {models_peak / 2**20:.1f} MiB)")
+    print(f"  FlightIndex   : {index_bytes / rows:8.1f} B/flight (peak {index_peak / 2**20:.1f} MiB)")
+    for part, size in index_breakdown(index).items():
+        print(f"    {part:<13}: {size / rows:8.1f} B/flight")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare flight inventory memory layouts.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Synthetic catalog size")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    run(args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,21 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Sequence
+
+from src.utils.tokens import estimate_tokens, truncate_to_tokens
+
+# Column header, attribute and cell formatter of the compact flight table.
+# match_score is internal ranking state and never sent to the model.
+FLIGHT_COLUMNS = [
+    ("airline", "airline", str),
+    ("alliance", "alliance", str),
+    ("from", "origin", str),
+    ("to", "destination", str),
+    ("depart", "departure_date", str),
+    ("return", "return_date", str),
+    ("layovers", "layovers", lambda v: "+".join(v) if v else "nonstop"),
+    ("price", "price_usd", lambda v: f"${v:.0f}"),
+    ("refundable", "refundable", lambda v: "yes" if v else "no"),
+    ("overnight", "overnight_layover", lambda v: "yes" if v else "no"),
+]
 
 def format_flight_summary(flight: Any) -> str:
     parts = [
@@ -19,3 +36,64 @@ def format_criteria_summary(criteria: Dict[str, Any]) -> str:
             continue
         parts.append(f"{k}: {v}")
     return ", ".join(parts) if parts else "No criteria"
+
+
+def format_flight_table(flights: Sequence[Any]) -> str:
+    """Flights as a pipe-separated table, one header line and one row each.
+
+    Columns that are empty for every flight (no alliance, one-way trips)
+    are left out.
+    """
+    columns = [
+        (header, attr, cell)
+        for header, attr, cell in FLIGHT_COLUMNS
+        if any(getattr(f, attr, None) not in (None, "") for f in flights)
+    ]
+    lines = ["#|" + "|".join(header for header, _, _ in columns)]
+    for i, flight in enumerate(flights, 1):
+        cells = []
+        for _, attr, cell in columns:
+            value = getattr(flight, attr, None)
+            cells.append("-" if value is None or value == "" else cell(value))
+        lines.append(f"{i}|" + "|".join(cells))
+    return "\n".join(lines)
+
+
+def format_conversation(
+    messages: Sequence[Any], token_budget: int, message_token_cap: int
+) -> str:
+    """The most recent messages that fit in ``token_budget`` tokens.
+
+    Each message is first cut to ``message_token_cap`` tokens, so one long
+    earlier answer cannot crowd out the rest of the conversation. The
+    newest message is always kept.
+    """
+    lines: List[str] = []
+    used = 0
+    for msg in reversed(messages):
+        content = getattr(msg, "content", str(msg))
+        if not content:
+            continue
+        role = "User" if getattr(msg, "type", "") == "human" else "Assistant"
+        line = f"{role}: {truncate_to_tokens(str(content), message_token_cap)}"
+        cost = estimate_tokens(line)
+        if lines and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(reversed(lines))
+
+
+def format_fare_calendar(days: List[Any]) -> str:
+    if not days:
+        return ""
+    cheapest = min(day.min_price_usd for day in days)
+    lines = []
+    for day in days:
+        line = f"{day.date} | from ${day.min_price_usd:.0f} | {day.flights} flight(s)"
+        if day.nonstop_available:
+            line += " | nonstop"
+        if day.min_price_usd == cheapest:
+            line += " | cheapest"
+        lines.append(line)
+    return "\n".join(lines)
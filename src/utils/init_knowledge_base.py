@@ -1,16 +1,31 @@
+import argparse
+import hashlib
+import json
+import os
 import re
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
 from config.settings import settings
+from src.services.lexical_index import lexical_index
+from src.services.llm_service import llm_service
 from src.services.vector_store import vector_store
 from src.utils.logger import get_logger
+from src.utils.tokens import estimate_tokens
 
 logger = get_logger(__name__)
 
 DEFAULT_KB_DIR = Path("data/knowledge_base")
 DEFAULT_VISA_RULES = Path("data/visa_rules.md")
 CHUNK_SIZE = 600
+MANIFEST_VERSION = 1
+# Below this many files, process start-up costs more than it saves.
+PARALLEL_CHUNKING_MIN_FILES = 32
+# Files submitted for chunking ahead of the one being consumed, per worker.
+CHUNKING_WINDOW_PER_WORKER = 4
 
 
 def _chunk_text(text: str, max_chars: int = CHUNK_SIZE) -> List[str]:
@@ -52,60 +67,332 @@ def _chunk_text(text: str, max_chars: int = CHUNK_SIZE) -> List[str]:
     return chunks
 
 
-def load_and_chunk_file(path: Path, source_name: str) -> List[Tuple[str, dict]]:
-    if not path.exists():
-        logger.warning("File not found: %s", path)
-        return []
-    text = path.read_text(encoding="utf-8")
-    chunk_texts = _chunk_text(text, max_chars=settings.rag_chunk_size)
-    return [(c, {"source": source_name}) for c in chunk_texts]
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def run(
-    kb_dir: Optional[Path] = None,
-    visa_rules_path: Optional[Path] = None,
-    reset: bool = True,
-) -> None:
-    kb_dir = kb_dir or DEFAULT_KB_DIR
-    visa_rules_path = visa_rules_path or DEFAULT_VISA_RULES
+def chunk_id(source_name: str, chunk_hash: str) -> str:
+    """Stable id of a chunk: its file's relative path and a prefix of its content hash.
+
+    The path (without extension) keeps same-named files in different
+    subdirectories apart.
+    """
+    return f"{Path(source_name).with_suffix('').as_posix()}_{chunk_hash[:16]}"
+
+
+def manifest_path() -> Path:
+    if settings.kb_manifest_path:
+        return Path(settings.kb_manifest_path)
+    return vector_store.persist_directory / "kb_manifest.json"
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+        return {}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def write_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
 
-    all_chunks: List[str] = []
-    all_metadatas: List[dict] = []
-    all_ids: List[str] = []
-    idx = 0
 
+class ChunkedFile(NamedTuple):
+    source_name: str
+    file_hash: str
+    # (chunk id, chunk hash, text); None when the file matched its known hash
+    chunks: Optional[List[Tuple[str, str, str]]]
+
+
+class _Chunk(NamedTuple):
+    id: str
+    hash: str
+    text: str
+    source_name: str
+
+
+def chunk_file(path: str, source_name: str, chunk_size: int, known_hash: Optional[str]) -> ChunkedFile:
+    """Read and chunk one file; runs in a worker process for large corpora."""
+    text = Path(path).read_text(encoding="utf-8")
+    file_hash = _sha256(text)
+    if file_hash == known_hash:
+        return ChunkedFile(source_name, file_hash, None)
+    chunks: Dict[str, Tuple[str, str, str]] = {}
+    for chunk in _chunk_text(text, max_chars=chunk_size):
+        chunk_hash = _sha256(chunk)
+        cid = chunk_id(source_name, chunk_hash)
+        chunks.setdefault(cid, (cid, chunk_hash, chunk))
+    return ChunkedFile(source_name, file_hash, list(chunks.values()))
+
+
+def _sources(kb_dir: Path, visa_rules_path: Path) -> Iterator[Tuple[Path, str]]:
+    """(path, source name) of every knowledge base file, streamed."""
     if kb_dir.exists():
-        for md_file in sorted(kb_dir.glob("*.md")):
-            pairs = load_and_chunk_file(md_file, md_file.name)
-            for text, meta in pairs:
-                all_chunks.append(text)
-                all_metadatas.append(meta)
-                all_ids.append(f"{md_file.stem}_{idx}")
-                idx += 1
+        for path in sorted(kb_dir.rglob("*.md")):
+            yield path, path.relative_to(kb_dir).as_posix()
     else:
         logger.warning("Knowledge base directory not found: %s", kb_dir)
-
     if visa_rules_path.exists():
-        for text, meta in load_and_chunk_file(visa_rules_path, visa_rules_path.name):
-            all_chunks.append(text)
-            all_metadatas.append(meta)
-            all_ids.append(f"visa_rules_{idx}")
-            idx += 1
-
-    if not all_chunks:
-        logger.warning("No chunks loaded; check paths.")
+        yield visa_rules_path, visa_rules_path.name
+
+
+def _chunk_files(
+    jobs: Iterable[Tuple[str, str, int, Optional[str]]], workers: int
+) -> Iterator[ChunkedFile]:
+    """Chunk files in order, across ``workers`` processes when there are many.
+
+    Only a bounded window of files is submitted ahead of the consumer, so
+    chunked files do not pile up in memory while embedding lags behind.
+    """
+    jobs = list(jobs)
+    if workers <= 1 or len(jobs) < PARALLEL_CHUNKING_MIN_FILES:
+        for job in jobs:
+            yield chunk_file(*job)
         return
+    window = workers * CHUNKING_WINDOW_PER_WORKER
+    pending: Deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for job in jobs:
+                pending.append(pool.submit(chunk_file, *job))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class KnowledgeBaseSync:
+    """Streams knowledge base files into the vector store.
+
+    Files are chunked (in parallel for large corpora) and new chunks are
+    embedded in batches bounded by count and tokens, with up to
+    ``kb_embed_concurrency`` batches in flight; finished batches are
+    written to the vector store in order while later ones are still
+    embedding. A file enters the manifest once all its new chunks are
+    written, and the manifest is checkpointed as files complete, so a
+    failed run resumes where it stopped: finished files are skipped by
+    hash, and chunks already in the store are never embedded again.
+    Removed chunks are deleted only after a complete pass.
+    """
 
+    def __init__(self, manifest_file: Path, manifest: Dict[str, Any]) -> None:
+        self.manifest_file = manifest_file
+        self.model = llm_service.embedding_model_id
+        self.chunk_size = settings.rag_chunk_size
+        reuse = manifest.get("chunk_size") == self.chunk_size
+        self.previous_files: Dict[str, Any] = manifest.get("files", {}) if reuse else {}
+        self.existing: Set[str] = set(vector_store.document_ids())
+        self.files: Dict[str, Any] = {}
+        self._paths: Dict[str, Path] = {}
+        self.wanted: Set[str] = set()
+        self._open: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        self.files_total = 0
+        self.files_done = 0
+        self.added = 0
+        self._last_report = time.monotonic()
+        self._last_checkpoint = time.monotonic()
+        self._started = time.monotonic()
+
+    def _new_chunks(self, chunked: Iterable[ChunkedFile]) -> Iterator[_Chunk]:
+        for item in chunked:
+            previous = self.previous_files.get(item.source_name)
+            chunks = item.chunks
+            if chunks is None and not self.existing.issuperset(previous["chunks"]):
+                # Same file, but its chunks are gone from the collection.
+                path = self._paths[item.source_name]
+                chunks = chunk_file(str(path), item.source_name, self.chunk_size, None).chunks
+            if chunks is None:
+                self.wanted.update(previous["chunks"])
+                self._finish(item.source_name, previous)
+                continue
+            entry = {"hash": item.file_hash, "chunks": {cid: h for cid, h, _ in chunks}}
+            self.wanted.update(entry["chunks"])
+            new = [c for c in chunks if c[0] not in self.existing]
+            if not new:
+                self._finish(item.source_name, entry)
+                continue
+            self._open[item.source_name] = (entry, len(new))
+            for cid, chunk_hash, text in new:
+                yield _Chunk(cid, chunk_hash, text, item.source_name)
+
+    def _batches(self, chunks: Iterable[_Chunk]) -> Iterator[List[_Chunk]]:
+        max_items = max(settings.kb_embed_batch_size, 1)
+        max_tokens = max(settings.kb_embed_batch_tokens, 1)
+        batch: List[_Chunk] = []
+        tokens = 0
+        for chunk in chunks:
+            cost = estimate_tokens(chunk.text)
+            if batch and (len(batch) >= max_items or tokens + cost > max_tokens):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(chunk)
+            tokens += cost
+        if batch:
+            yield batch
+
+    def _write(self, batch: List[_Chunk], embeddings: List[List[float]]) -> None:
+        vector_store.upsert_documents(
+            texts=[c.text for c in batch],
+            metadatas=[{"source": c.source_name, "content_hash": c.hash} for c in batch],
+            ids=[c.id for c in batch],
+            embeddings=embeddings,
+        )
+        self.added += len(batch)
+        for chunk in batch:
+            entry, remaining = self._open[chunk.source_name]
+            if remaining > 1:
+                self._open[chunk.source_name] = (entry, remaining - 1)
+            else:
+                del self._open[chunk.source_name]
+                self._finish(chunk.source_name, entry)
+        self._report()
+
+    def _finish(self, source_name: str, entry: Dict[str, Any]) -> None:
+        self.files[source_name] = entry
+        self.files_done += 1
+        if time.monotonic() - self._last_checkpoint >= settings.kb_checkpoint_seconds:
+            self._checkpoint()
+
+    def _checkpoint(self, final: bool = False) -> None:
+        # The manifest may only list chunks that are already persisted.
+        vector_store.flush()
+        # Until the pass completes, files not reached yet keep their old entry.
+        files = self.files if final else {**self.previous_files, **self.files}
+        write_manifest(
+            self.manifest_file,
+            {
+                "version": MANIFEST_VERSION,
+                "embedding_model": self.model,
+                "chunk_size": self.chunk_size,
+                "files": files,
+            },
+        )
+        self._last_checkpoint = time.monotonic()
+
+    def _report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_report < settings.kb_progress_seconds:
+            return
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-9)
+        logger.info(
+            "Ingest progress: %d/%d files, %d chunks embedded (%.1f chunks/s)",
+            self.files_done,
+            self.files_total,
+            self.added,
+            self.added / elapsed,
+        )
+
+    def run(self, sources: Iterable[Tuple[Path, str]]) -> Dict[str, int]:
+        jobs = []
+        for path, source_name in sources:
+            self._paths[source_name] = path
+            previous = self.previous_files.get(source_name)
+            jobs.append((str(path), source_name, self.chunk_size, previous and previous.get("hash")))
+        self.files_total = len(jobs)
+        before = set(self.existing)
+
+        workers = settings.kb_ingest_workers or os.cpu_count() or 1
+        concurrency = max(settings.kb_embed_concurrency, 1)
+        batches = self._batches(self._new_chunks(_chunk_files(jobs, workers)))
+        in_flight: Deque[Tuple[List[_Chunk], Future]] = deque()
+        with vector_store.bulk_write(), ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="kb-embed"
+        ) as pool:
+            try:
+                for batch in batches:
+                    in_flight.append(
+                        (batch, pool.submit(llm_service.embed_documents, [c.text for c in batch]))
+                    )
+                    while len(in_flight) > concurrency or (in_flight and in_flight[0][1].done()):
+                        done_batch, future = in_flight.popleft()
+                        self._write(done_batch, future.result())
+                while in_flight:
+                    done_batch, future = in_flight.popleft()
+                    self._write(done_batch, future.result())
+            except BaseException:
+                for _, future in in_flight:
+                    future.cancel()
+                self._checkpoint()
+                raise
+
+        removed = sorted(before - self.wanted)
+        vector_store.delete_documents(removed)
+        self._checkpoint(final=True)
+        self._report(force=True)
+        return {
+            "added": self.added,
+            "removed": len(removed),
+            "unchanged": len(self.wanted) - self.added,
+        }
+
+
+def run(
+    kb_dir: Optional[Path] = None,
+    visa_rules_path: Optional[Path] = None,
+    reset: bool = False,
+) -> None:
+    """Bring the vector store in line with the knowledge base files.
+
+    Chunks are identified by content hash, and a manifest records each
+    file's hash and chunk hashes. Files whose hash is unchanged are not
+    re-chunked. Chunks that are new are embedded and upserted, chunks that
+    no longer exist are deleted, and everything else is left untouched.
+    ``reset`` (or a change of embedding model) rebuilds from scratch.
+    """
+    kb_dir = kb_dir or DEFAULT_KB_DIR
+    visa_rules_path = visa_rules_path or DEFAULT_VISA_RULES
+    path = manifest_path()
+    manifest = load_manifest(path)
+    model = llm_service.embedding_model_id
+
+    if manifest and manifest.get("embedding_model") != model:
+        logger.info(
+            "Embedding model changed (%s -> %s); rebuilding",
+            manifest.get("embedding_model"),
+            model,
+        )
+        reset = True
     if reset:
         vector_store.reset()
+        manifest = {}
+
+    sources = list(_sources(kb_dir, visa_rules_path))
+    if not sources:
+        # Still sync: chunks of files that were all deleted must go too.
+        logger.warning("No knowledge base files found; removing every stored chunk")
+
+    counts = KnowledgeBaseSync(path, manifest).run(sources)
+    logger.info(
+        "Knowledge base synced: %d chunks added, %d removed, %d unchanged",
+        counts["added"],
+        counts["removed"],
+        counts["unchanged"],
+    )
+    if counts["added"] or counts["removed"] or reset or not lexical_index.path.exists():
+        stored = vector_store.documents()
+        lexical_index.build(stored["ids"], stored["documents"], stored["metadatas"])
+
 
-    vector_store.add_documents(
-        texts=all_chunks,
-        metadatas=all_metadatas,
-        ids=all_ids,
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync the knowledge base into the vector store.")
+    parser.add_argument(
+        "--reset", action="store_true", help="Drop the collection and re-embed every chunk"
     )
-    logger.info("Knowledge base initialized with %d chunks", len(all_chunks))
+    args = parser.parse_args()
+    run(reset=args.reset)
 
 
 if __name__ == "__main__":
-    run()
+    main()
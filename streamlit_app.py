@@ -4,6 +4,8 @@ from langchain_core.messages import AIMessage, HumanMessage
 
 from src.agents.graph import travel_assistant_graph
 from src.agents.state import TravelAssistantState
+from src.agents.streaming import ResponseStream
+from src.utils.async_runner import background_loop
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -41,14 +43,20 @@ if prompt := st.chat_input("Ask about flights, visas, or travel policies..."):
                 "intent": None,
                 "extracted_criteria": None,
                 "search_results": None,
+                "total_matches": None,
+                "fare_calendar": None,
                 "rag_context": None,
                 "final_response": None,
                 "needs_clarification": False,
                 "error": None,
             }
+            stream = ResponseStream(travel_assistant_graph, state)
+            streamed = ""
             with st.spinner("Thinking..."):
-                result = travel_assistant_graph.invoke(state)
-            response = result.get("final_response") or "I couldn't process your request."
+                for text in background_loop.iterate(stream):
+                    streamed += text
+                    placeholder.markdown(streamed + "▌")
+            response = stream.response
             placeholder.markdown(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
         except Exception as e: